@@ -1,3 +1,6 @@
+DROP TABLE IF EXISTS EmpleadoXerarquia;
+DROP FUNCTION IF EXISTS sgbd_xerarquia_insert(), sgbd_xerarquia_update();
+DROP TABLE IF EXISTS schema_version;
 DROP TABLE DepartamentoProyecto CASCADE;
 DROP TABLE EmpleadoProyecto CASCADE;
 DROP TABLE Proyecto CASCADE;
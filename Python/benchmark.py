@@ -0,0 +1,510 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Autores:
+#   - Joaquín Solla Vázquez (joaquin.solla@udc.es)
+#   - Lucas Campos Camiña (lucas.campos@udc.es)
+
+# Data de creación: 18-10-2026
+#
+# Benchmark das 24 operacións do menú de sgbd.py. Xera un conxunto de
+# datos sintético da BD empresa, executa cada operación polo camiño non
+# interactivo (os repositorios) e escribe en JSON o throughput e as
+# latencias p50/p95/p99 de cada unha.
+#
+#   python3 benchmark.py --employees 10k --iterations 500 -o resultado.json
+#   python3 benchmark.py --throwaway --employees 1M
+#
+# Sen --throwaway úsase o servidor de dbconfig.json e a BD --dbname (por
+# defecto empresa_bench), que se borra e se volve crear.
+
+import argparse
+import csv
+import io
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+
+import psycopg2
+
+import sgbd
+
+LOCALIDADES = ['A Coruña', 'Santiago de Compostela', 'Vigo', 'Pontevedra', 'Lugo', 'Ourense', 'Ferrol']
+TRABALLOS = ['Desarrollador', 'Supervisor', 'Tester', 'Analista', 'Administrativo', 'Comercial']
+
+CREATE_TABLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ScriptCreateTables.sql')
+
+
+## AUX_FUNCS---------------------------------------------------
+def parse_scale(text):
+    """
+    Converte unha escala coma 10k, 1M ou 10m nun enteiro
+    :param text: a escala
+    :return: número de empregados
+    """
+    text = text.strip().lower()
+    mult = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    if mult != 1:
+        text = text[:-1]
+    return int(float(text) * mult)
+
+
+def percentile(values, p):
+    """
+    :param values: lista ordenada de valores
+    :param p: percentil entre 0 e 100
+    :return: o valor do percentil (método do rango máis próximo)
+    """
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, math.ceil(p / 100 * len(values)) - 1))
+    return values[k]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+## SERVIDOR----------------------------------------------------
+@contextmanager
+def throwaway_postgres(pg_bin=None):
+    """
+    Crea e arranca un servidor PostgreSQL temporal (initdb + pg_ctl) nun
+    porto libre e bórrao ao rematar
+    :param pg_bin: directorio cos binarios de PostgreSQL (por defecto o PATH)
+    :return: parámetros de conexión á BD empresa do servidor temporal
+    """
+    def binary(name):
+        return os.path.join(pg_bin, name) if pg_bin else name
+
+    tmp = tempfile.mkdtemp(prefix='sgbd_bench_')
+    data = os.path.join(tmp, 'data')
+    port = free_port()
+    subprocess.run([binary('initdb'), '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8'],
+                   check=True, stdout=subprocess.DEVNULL)
+    # en postgresql.conf e non en pg_ctl -o, que pasa polo shell e rompe
+    # se o directorio temporal ten espazos
+    socket_dir = tmp.replace("'", "''")
+    with open(os.path.join(data, 'postgresql.conf'), 'a', encoding='utf-8') as conf:
+        conf.write(f"\nport = {port}\n"
+                   f"unix_socket_directories = '{socket_dir}'\n"
+                   "fsync = off\n"
+                   "synchronous_commit = off\n")
+    subprocess.run([binary('pg_ctl'), '-D', data, '-l', os.path.join(tmp, 'postgres.log'), '-w', 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield {'host': tmp, 'port': port, 'user': 'postgres', 'dbname': 'empresa'}
+    finally:
+        subprocess.run([binary('pg_ctl'), '-D', data, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def recreate_database(params):
+    """
+    Borra e crea de novo a BD indicada en params e o seu esquema
+    (ScriptCreateTables.sql e as migracións)
+    :param params: parámetros de conexión
+    :return: Nada
+    """
+    admin = dict(params, dbname='postgres')
+    conn = psycopg2.connect(**admin)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"drop database if exists {params['dbname']}")
+        cur.execute(f"create database {params['dbname']}")
+    conn.close()
+
+    with open(CREATE_TABLES, encoding='utf-8') as f:
+        ddl = "\n".join(line for line in f if not line.upper().startswith('DROP TABLE'))
+    conn = psycopg2.connect(**params)
+    with conn.cursor() as cur:
+        cur.execute(ddl)
+    conn.commit()
+    migrator = sgbd.Migrator(conn)
+    for version, nombre, path in migrator.pending():
+        migrator.apply(version, nombre, path)
+    conn.close()
+
+
+## DATOS-------------------------------------------------------
+class Dataset:
+    """
+    Conxunto de datos sintético. É determinista para unha semente dada, de
+    xeito que o benchmark sabe que relacións existen sen consultalas
+    """
+
+    def __init__(self, employees, seed=1):
+        """
+        :param employees: número de empregados
+        :param seed: semente dos números aleatorios
+        """
+        self.employees = employees
+        self.departments = max(3, employees // 100)
+        self.projects = max(3, employees // 50)
+        self.seed = seed
+
+    def projects_of(self, emp_id):
+        """
+        Cada empregado traballa en dous proxectos
+        """
+        first = emp_id % self.projects + 1
+        second = (emp_id * 7 + 3) % self.projects + 1
+        return [first] if first == second else [first, second]
+
+    def departamento_rows(self):
+        for i in range(1, self.departments + 1):
+            yield [i, f"Departamento {i}", LOCALIDADES[i % len(LOCALIDADES)], None]
+
+    def empleado_rows(self):
+        rnd = random.Random(self.seed)
+        start = date(2000, 1, 1).toordinal()
+        for i in range(1, self.employees + 1):
+            # organigrama: cada xefe ten ata 10 empregados
+            jefe = (i - 2) // 10 + 1 if i > 1 else None
+            comision = round(rnd.uniform(0, 300), 2) if rnd.random() < 0.3 else None
+            yield [i, f"Empregado {i}", rnd.choice(TRABALLOS),
+                   date.fromordinal(start + rnd.randrange(8000)).isoformat(),
+                   round(rnd.uniform(1000, 6000), 2), comision, jefe, rnd.randint(1, self.departments)]
+
+    def proyecto_rows(self):
+        for i in range(1, self.projects + 1):
+            yield [i, f"Proxecto {i}", LOCALIDADES[(i * 3) % len(LOCALIDADES)]]
+
+    def empleadoproyecto_rows(self):
+        for i in range(1, self.employees + 1):
+            for p in self.projects_of(i):
+                yield [i, p, (i + p) % 40]
+
+    def departamentoproyecto_rows(self):
+        for p in range(1, self.projects + 1):
+            for d in {p % self.departments + 1, (p * 5) % self.departments + 1}:
+                yield [d, p]
+
+    def director_of(self, dept_id):
+        return (dept_id * 13) % self.employees + 1
+
+
+def copy_rows(conn, table, columns, rows, chunk_size=100000):
+    """
+    Carga as filas cun COPY FROM STDIN por cada bloque de chunk_size filas
+    :return: número de filas cargadas
+    """
+    total = 0
+    with conn.cursor() as cur:
+        while True:
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            n = 0
+            for row in rows:
+                writer.writerow(row)
+                n += 1
+                if n == chunk_size:
+                    break
+            if n == 0:
+                break
+            buf.seek(0)
+            cur.copy_expert(f"copy {table} ({', '.join(columns)}) from stdin with (format csv)", buf)
+            conn.commit()
+            total += n
+            if n < chunk_size:
+                break
+    return total
+
+
+def load_dataset(conn, dataset):
+    """
+    Carga o conxunto de datos na BD (xa baleira)
+    :return: Nada
+    """
+    copy_rows(conn, 'departamento', ['id', 'nombre', 'localidad', 'id_director'], dataset.departamento_rows())
+    # id_jefe referencia a empregados anteriores, que xa están cargados
+    copy_rows(conn, 'empleado', ['id', 'nombre', 'trabajo', 'fecha_contratacion', 'salario', 'comision',
+                                 'id_jefe', 'id_departamento'], dataset.empleado_rows())
+    with conn.cursor() as cur:
+        cur.execute("update departamento set id_director = (id * 13) %% %(n)s + 1", {'n': dataset.employees})
+    conn.commit()
+    copy_rows(conn, 'proyecto', ['id', 'nombre', 'localidad'], dataset.proyecto_rows())
+    copy_rows(conn, 'empleadoproyecto', ['id_empleado', 'id_proyecto', 'horas'], dataset.empleadoproyecto_rows())
+    copy_rows(conn, 'departamentoproyecto', ['id_departamento', 'id_proyecto'], dataset.departamentoproyecto_rows())
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("vacuum analyze")
+    conn.autocommit = False
+
+
+## OPERACIÓNS--------------------------------------------------
+class Operations:
+    """
+    As 24 operacións do menú expresadas sobre os repositorios, con
+    argumentos aleatorios válidos. As operacións que borran usan as filas
+    creadas polas que insertan, así que se executan despois delas
+    """
+
+    # orde de execución: primeiro as lecturas, despois as escrituras e
+    # por último os borrados das filas insertadas
+    ORDER = ['get_emp_by_id', 'get_dept_by_id', 'get_pro_by_id', 'get_emps_by_sal', 'get_depts_by_loc',
+             'get_pros_by_loc', 'get_pros_of_emp', 'get_depts_of_pro', 'get_directed_depts_by_id',
+             'search_by_name', 'get_emp_profile',
+             'insert_emp', 'insert_dept', 'insert_pro', 'update_emp_sal_by_percentage', 'update_emp_comm',
+             'update_dept_director', 'update_hours_emppro', 'update_reemplazar_emp_emppro',
+             'insert_rel_emp_pro', 'insert_rel_dept_pro', 'delete_emp_by_id', 'delete_depts_by_keyword',
+             'delete_pros_by_loc']
+
+    def __init__(self, dataset, salario_umbral, seed=1):
+        """
+        :param dataset: o conxunto de datos cargado
+        :param salario_umbral: salario para o listado por salario
+        """
+        self.d = dataset
+        self.salario_umbral = salario_umbral
+        self.rnd = random.Random(seed)
+        base = 10 ** len(str(dataset.employees + dataset.projects + dataset.departments))
+        self.next_emp = base
+        self.next_dept = base
+        self.next_pro = base
+        self.new_emps = []
+        self.new_depts = []
+        self.new_pros = []
+        self.rel_emps = []
+        self.rel_depts = []
+        self.replace_state = None
+
+    def emp(self):
+        return self.rnd.randint(1, self.d.employees)
+
+    def dept(self):
+        return self.rnd.randint(1, self.d.departments)
+
+    def pro(self):
+        return self.rnd.randint(1, self.d.projects)
+
+    def get_emp_by_id(self, conn):
+        sgbd.EmpleadoRepo(conn).get(self.emp())
+
+    def get_dept_by_id(self, conn):
+        sgbd.DepartamentoRepo(conn).get(self.dept())
+
+    def get_pro_by_id(self, conn):
+        sgbd.ProyectoRepo(conn).get(self.pro())
+
+    def get_emps_by_sal(self, conn):
+        for _ in sgbd.EmpleadoRepo(conn).list_by_salario(self.salario_umbral):
+            pass
+
+    def get_depts_by_loc(self, conn):
+        for _ in sgbd.DepartamentoRepo(conn).list_by_localidad(self.rnd.choice(LOCALIDADES)):
+            pass
+
+    def get_pros_by_loc(self, conn):
+        for _ in sgbd.ProyectoRepo(conn).list_by_localidad(self.rnd.choice(LOCALIDADES)):
+            pass
+
+    def get_pros_of_emp(self, conn):
+        sgbd.EmpleadoProyectoRepo(conn).proyectos_de_empleado(self.emp())
+
+    def get_depts_of_pro(self, conn):
+        sgbd.DepartamentoProyectoRepo(conn).departamentos_de_proyecto(self.pro())
+
+    def get_directed_depts_by_id(self, conn):
+        sgbd.EmpleadoRepo(conn).directed_depts(self.d.director_of(self.dept()))
+
+    def search_by_name(self, conn):
+        sgbd.BuscaRepo(conn).search('empleado', f"Empregado {self.emp()}")
+
+    def get_emp_profile(self, conn):
+        sgbd.EmpleadoRepo(conn).ficha(self.emp())
+
+    def insert_emp(self, conn):
+        self.next_emp += 1
+        sgbd.EmpleadoRepo(conn).insert(sgbd.Empleado(
+            id=self.next_emp, nombre=f"Bench {self.next_emp}", trabajo='Tester',
+            fecha_contratacion=date.today(), salario=1500.0, id_jefe=self.emp(), id_departamento=self.dept()))
+        self.new_emps.append(self.next_emp)
+
+    def insert_dept(self, conn):
+        self.next_dept += 1
+        sgbd.DepartamentoRepo(conn).insert(sgbd.Departamento(
+            id=self.next_dept, nombre=f"Bench -{self.next_dept}-", localidad='Bench'))
+        self.new_depts.append(self.next_dept)
+
+    def insert_pro(self, conn):
+        self.next_pro += 1
+        sgbd.ProyectoRepo(conn).insert(sgbd.Proyecto(
+            id=self.next_pro, nombre=f"Bench {self.next_pro}", localidad=f"Bench -{self.next_pro}-"))
+        self.new_pros.append(self.next_pro)
+
+    def update_emp_sal_by_percentage(self, conn):
+        sgbd.EmpleadoRepo(conn).update_salario_by_percentage(self.emp(), 0.01)
+
+    def update_emp_comm(self, conn):
+        sgbd.EmpleadoRepo(conn).update_comision(self.emp(), round(self.rnd.uniform(0, 300), 2))
+
+    def update_dept_director(self, conn):
+        dept = self.dept()
+        sgbd.DepartamentoRepo(conn).update_director(dept, self.d.director_of(dept))
+
+    def update_hours_emppro(self, conn):
+        emp = self.emp()
+        sgbd.EmpleadoProyectoRepo(conn).add_horas(emp, self.d.projects_of(emp)[0], 1)
+
+    def update_reemplazar_emp_emppro(self, conn):
+        # alterna dous empregados novos nun mesmo proxecto
+        repo = sgbd.EmpleadoProyectoRepo(conn)
+        if self.replace_state is None:
+            emp_a, emp_b = self.new_emps[0], self.new_emps[1]
+            pro = self.pro()
+            repo.insert(emp_a, pro)
+            self.replace_state = (emp_a, emp_b, pro)
+        emp_out, emp_in, pro = self.replace_state
+        repo.replace(emp_out, emp_in, pro)
+        self.replace_state = (emp_in, emp_out, pro)
+
+    def insert_rel_emp_pro(self, conn):
+        emp = self.new_emps[len(self.rel_emps) + 2]
+        sgbd.EmpleadoProyectoRepo(conn).insert(emp, self.pro())
+        self.rel_emps.append(emp)
+
+    def insert_rel_dept_pro(self, conn):
+        dept = self.new_depts[len(self.rel_depts)]
+        sgbd.DepartamentoProyectoRepo(conn).insert(dept, self.pro())
+        self.rel_depts.append(dept)
+
+    def delete_emp_by_id(self, conn):
+        sgbd.EmpleadoRepo(conn).delete(self.new_emps.pop())
+
+    def delete_depts_by_keyword(self, conn):
+        sgbd.DepartamentoRepo(conn).delete_by_keyword(f"-{self.new_depts.pop()}-")
+
+    def delete_pros_by_loc(self, conn):
+        sgbd.ProyectoRepo(conn).delete_by_localidad(f"Bench -{self.new_pros.pop()}-")
+
+
+def run_benchmark(pool, operations, iterations, warmup=10):
+    """
+    Executa cada operación iterations veces (máis warmup sen medir)
+    cunha conexión do pool por operación
+    :return: diccionario operación -> métricas
+    """
+    results = {}
+    for name in Operations.ORDER:
+        op = getattr(operations, name)
+        latencies = []
+        errors = 0
+        # as insercións fan unha fila extra por cada operación que as consume
+        count = iterations + warmup
+        if name == 'insert_emp':
+            count += iterations + warmup + 2
+        started = time.perf_counter()
+        for i in range(count):
+            t0 = time.perf_counter()
+            try:
+                with pool.connection() as conn:
+                    op(conn)
+            except (sgbd.SgbdError, psycopg2.Error):
+                errors += 1
+            if i >= count - iterations:
+                latencies.append(time.perf_counter() - t0)
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        results[name] = {
+            'count': len(latencies),
+            'errors': errors,
+            'ops_per_s': round(len(latencies) / sum(latencies), 2) if latencies else None,
+            'mean_ms': round(1000 * sum(latencies) / len(latencies), 3) if latencies else None,
+            'p50_ms': round(1000 * percentile(latencies, 50), 3) if latencies else None,
+            'p95_ms': round(1000 * percentile(latencies, 95), 3) if latencies else None,
+            'p99_ms': round(1000 * percentile(latencies, 99), 3) if latencies else None,
+            'elapsed_s': round(elapsed, 3),
+        }
+        print(f"[✓] {name}: {results[name]['ops_per_s']} ops/s, p99 {results[name]['p99_ms']} ms",
+              file=sys.stderr)
+    return results
+
+
+## ------------------------------------------------------------
+def bench(params, args):
+    """
+    Crea a BD, carga os datos e executa o benchmark
+    :return: o informe en forma de diccionario
+    """
+    # Mídese sempre contra a BD: sen a caché de dbconfig.json (que só se
+    # carga sen --throwaway) os get_* serían acertos da caché nun modo e
+    # consultas no outro. Tampouco se cronometran as sentenzas
+    sgbd.Repo.cache = None
+    sgbd.TimedCursor.timer = None
+    dataset = Dataset(parse_scale(args.employees), seed=args.seed)
+    recreate_database(params)
+
+    conn = psycopg2.connect(**params)
+    t0 = time.perf_counter()
+    load_dataset(conn, dataset)
+    load_s = time.perf_counter() - t0
+    with conn.cursor() as cur:
+        cur.execute("select percentile_disc(0.99) within group (order by salario) from empleado")
+        umbral = cur.fetchone()[0]
+        cur.execute("show server_version")
+        version = cur.fetchone()[0]
+    conn.close()
+    print(f"[✓] Datos cargados en {load_s:.1f} s", file=sys.stderr)
+
+    pool = sgbd.ConnectionPool(params, minconn=1, maxconn=2)
+    try:
+        results = run_benchmark(pool, Operations(dataset, umbral, seed=args.seed), args.iterations, args.warmup)
+    finally:
+        pool.closeall()
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'server_version': version,
+        'scale': {'employees': dataset.employees, 'departments': dataset.departments,
+                  'projects': dataset.projects},
+        'iterations': args.iterations,
+        'cache': False,
+        'load_s': round(load_s, 3),
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark das operacións de sgbd.py")
+    parser.add_argument('--employees', default='10k', help="empregados a xerar (10k, 1M, 10M...)")
+    parser.add_argument('--iterations', type=int, default=200, help="execucións medidas de cada operación")
+    parser.add_argument('--warmup', type=int, default=10, help="execucións previas sen medir")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--throwaway', action='store_true', help="usa un servidor PostgreSQL temporal")
+    parser.add_argument('--pg-bin', help="directorio de initdb/pg_ctl para --throwaway")
+    parser.add_argument('--dbname', default='empresa_bench', help="BD a usar sen --throwaway (bórrase)")
+    parser.add_argument('-o', '--output', help="ficheiro JSON de saída (por defecto stdout)")
+    args = parser.parse_args()
+
+    if args.throwaway:
+        with throwaway_postgres(args.pg_bin) as params:
+            report = bench(params, args)
+    else:
+        params = sgbd.configure(sgbd.read_config('dbconfig.json'))
+        params.pop('pool', None)
+        params['dbname'] = args.dbname
+        report = bench(params, args)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+## ------------------------------------------------------------
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+-- Claves primarias das táboas de relación e índices das claves foráneas
+-- e das columnas polas que se busca (localidade, salario).
+
+-- EmpleadoProyecto: quítanse as filas sen empregado ou proxecto e xúntanse
+-- as relacións repetidas sumando as súas horas antes de crear a clave
+delete from EmpleadoProyecto where id_empleado is null or id_proyecto is null;
+
+create temp table _ep_repetidas on commit drop as
+    select id_empleado, id_proyecto, sum(horas)::int as horas
+    from EmpleadoProyecto
+    group by id_empleado, id_proyecto
+    having count(*) > 1;
+
+delete from EmpleadoProyecto ep using _ep_repetidas r
+    where ep.id_empleado = r.id_empleado and ep.id_proyecto = r.id_proyecto;
+
+insert into EmpleadoProyecto(id_empleado, id_proyecto, horas)
+    select id_empleado, id_proyecto, horas from _ep_repetidas;
+
+alter table EmpleadoProyecto
+    add constraint pk_empleadoproyecto primary key (id_empleado, id_proyecto);
+
+-- DepartamentoProyecto: o mesmo, quedando cunha fila de cada par
+delete from DepartamentoProyecto where id_departamento is null or id_proyecto is null;
+
+delete from DepartamentoProyecto a using DepartamentoProyecto b
+    where a.ctid > b.ctid
+      and a.id_departamento = b.id_departamento and a.id_proyecto = b.id_proyecto;
+
+alter table DepartamentoProyecto
+    add constraint pk_departamentoproyecto primary key (id_departamento, id_proyecto);
+
+-- A clave primaria cobre as buscas polo primeiro campo (proxectos dun
+-- empregado, proxectos dun departamento). Para o segundo (departamentos
+-- dun proxecto, ON DELETE CASCADE desde Proyecto) fai falla outro índice
+create index if not exists ix_empleadoproyecto_proyecto on EmpleadoProyecto(id_proyecto);
+create index if not exists ix_departamentoproyecto_proyecto on DepartamentoProyecto(id_proyecto);
+
+-- Claves foráneas de Empleado e Departamento (ON DELETE SET NULL/CASCADE
+-- e departamentos dirixidos por un empregado)
+create index if not exists ix_empleado_departamento on Empleado(id_departamento);
+create index if not exists ix_empleado_jefe on Empleado(id_jefe);
+create index if not exists ix_departamento_director on Departamento(id_director);
+
+-- Buscas por localidade
+create index if not exists ix_departamento_localidad on Departamento(localidad);
+create index if not exists ix_proyecto_localidad on Proyecto(localidad);
+
+-- Rangos de salario: inclúe id e nome para que o listado de empregados
+-- por salario se resolva só co índice
+create index if not exists ix_empleado_salario on Empleado(salario) include (id, nombre);
+
+analyze Empleado, Departamento, Proyecto, EmpleadoProyecto, DepartamentoProyecto;
@@ -0,0 +1,62 @@
+-- Notificacións de cambios para a caché de sgbd.py (EntityCache).
+-- Cada sentenza que escribe en Empleado, Departamento ou Proyecto envía
+-- pola canle sgbd_cambios un texto "táboa:id1,id2,..." cos ids tocados,
+-- ou "táboa:*" se son moitos, para que os outros clientes invaliden esas
+-- filas. Os triggers son por sentenza e usan táboas de transición, así
+-- un update masivo manda unha soa notificación.
+
+create or replace function sgbd_notify_cambios() returns trigger
+language plpgsql as $$
+declare
+    ids int[];
+begin
+    if tg_op = 'INSERT' then
+        select array_agg(distinct id) into ids from novas;
+    elsif tg_op = 'DELETE' then
+        select array_agg(distinct id) into ids from vellas;
+    else
+        select array_agg(distinct id) into ids
+            from (select id from novas union select id from vellas) t;
+    end if;
+    if ids is null then
+        return null;
+    end if;
+    -- pg_notify admite ata 8000 bytes
+    if cardinality(ids) > 100 then
+        perform pg_notify('sgbd_cambios', lower(tg_table_name) || ':*');
+    else
+        perform pg_notify('sgbd_cambios', lower(tg_table_name) || ':' || array_to_string(ids, ','));
+    end if;
+    return null;
+end
+$$;
+
+create trigger tr_empleado_notify_ins after insert on Empleado
+    referencing new table as novas
+    for each statement execute function sgbd_notify_cambios();
+create trigger tr_empleado_notify_upd after update on Empleado
+    referencing old table as vellas new table as novas
+    for each statement execute function sgbd_notify_cambios();
+create trigger tr_empleado_notify_del after delete on Empleado
+    referencing old table as vellas
+    for each statement execute function sgbd_notify_cambios();
+
+create trigger tr_departamento_notify_ins after insert on Departamento
+    referencing new table as novas
+    for each statement execute function sgbd_notify_cambios();
+create trigger tr_departamento_notify_upd after update on Departamento
+    referencing old table as vellas new table as novas
+    for each statement execute function sgbd_notify_cambios();
+create trigger tr_departamento_notify_del after delete on Departamento
+    referencing old table as vellas
+    for each statement execute function sgbd_notify_cambios();
+
+create trigger tr_proyecto_notify_ins after insert on Proyecto
+    referencing new table as novas
+    for each statement execute function sgbd_notify_cambios();
+create trigger tr_proyecto_notify_upd after update on Proyecto
+    referencing old table as vellas new table as novas
+    for each statement execute function sgbd_notify_cambios();
+create trigger tr_proyecto_notify_del after delete on Proyecto
+    referencing old table as vellas
+    for each statement execute function sgbd_notify_cambios();
@@ -0,0 +1,15 @@
+-- Paxinación por clave (keyset): os listados paxinados ordénanse por
+-- (salario, id) e (localidad, id) e cada páxina empeza despois da última
+-- clave da anterior. Co id no índice a comparación de filas
+-- (salario, id) > (...) baixa directamente á primeira fila da páxina e non
+-- fai falla ordenar, así cada páxina custa o mesmo aínda que estea lonxe.
+drop index if exists ix_empleado_salario;
+create index ix_empleado_salario on Empleado(salario, id) include (nombre);
+
+drop index if exists ix_departamento_localidad;
+create index ix_departamento_localidad on Departamento(localidad, id) include (nombre);
+
+drop index if exists ix_proyecto_localidad;
+create index ix_proyecto_localidad on Proyecto(localidad, id) include (nombre);
+
+analyze Empleado, Departamento, Proyecto;
@@ -0,0 +1,43 @@
+-- Vistas materializadas dos informes de horas e custo (InformeRepo en
+-- sgbd.py). Os informes lense destas vistas en vez de percorrer
+-- EmpleadoProyecto en cada petición; refréscanse con
+-- "python3 sgbd.py report refresh", que usa REFRESH ... CONCURRENTLY para
+-- non bloquear as lecturas (por iso cada vista ten un índice único).
+--
+-- O custo dunha hora dun empregado é o seu salario mensual entre 160 horas.
+
+create materialized view mv_informe_proyecto as
+    select p.id as id_proyecto, p.nombre, p.localidad,
+           coalesce(sum(ep.horas), 0)::bigint as horas,
+           count(ep.id_empleado) as empregados,
+           coalesce(sum(ep.horas * e.salario / 160.0), 0) as custo
+    from Proyecto p
+    left join EmpleadoProyecto ep on ep.id_proyecto = p.id
+    left join Empleado e on e.id = ep.id_empleado
+    group by p.id;
+create unique index ux_mv_informe_proyecto on mv_informe_proyecto(id_proyecto);
+create index ix_mv_informe_proyecto_horas on mv_informe_proyecto(horas desc, id_proyecto);
+create index ix_mv_informe_proyecto_custo on mv_informe_proyecto(custo desc, id_proyecto);
+
+-- Un proxecto de varios departamentos conta enteiro para cada un
+create materialized view mv_informe_departamento as
+    select d.id as id_departamento, d.nombre, d.localidad,
+           count(ip.id_proyecto) as proxectos,
+           coalesce(sum(ip.horas), 0)::bigint as horas,
+           coalesce(sum(ip.custo), 0) as custo
+    from Departamento d
+    left join DepartamentoProyecto dp on dp.id_departamento = d.id
+    left join mv_informe_proyecto ip on ip.id_proyecto = dp.id_proyecto
+    group by d.id;
+create unique index ux_mv_informe_departamento on mv_informe_departamento(id_departamento);
+
+create materialized view mv_informe_empleado as
+    select e.id as id_empleado, e.nombre, e.id_departamento,
+           sum(ep.horas)::bigint as horas,
+           count(*) as proxectos,
+           sum(ep.horas * e.salario / 160.0) as custo
+    from Empleado e
+    join EmpleadoProyecto ep on ep.id_empleado = e.id
+    group by e.id;
+create unique index ux_mv_informe_empleado on mv_informe_empleado(id_empleado);
+create index ix_mv_informe_empleado_horas on mv_informe_empleado(horas desc, id_empleado);
@@ -0,0 +1,40 @@
+-- Busca por nome en Departamento, Proyecto e Empleado (BuscaRepo).
+-- Un like '%texto%' non pode usar un índice B-tree e percorre toda a
+-- táboa. Cos índices GIN de trigramas de pg_trgm like/ilike con comodíns
+-- ós dous lados, e a busca aproximada (<%), usan o índice. Con unaccent
+-- engádese ademais un índice de texto completo sobre o nome sen acentos
+-- (configuración simple, que vale para nomes galegos e castelás).
+-- As dúas extensións son opcionais: se o servidor non as ten a migración
+-- só avisa e as buscas seguen funcionando sen índice (a aproximada non).
+-- Se se instalan despois hai que volver executar este script a man.
+do $$
+begin
+    if exists (select 1 from pg_available_extensions where name = 'pg_trgm') then
+        create extension if not exists pg_trgm with schema public;
+        create index if not exists ix_empleado_nombre_trgm on Empleado using gin (nombre public.gin_trgm_ops);
+        create index if not exists ix_departamento_nombre_trgm on Departamento using gin (nombre public.gin_trgm_ops);
+        create index if not exists ix_proyecto_nombre_trgm on Proyecto using gin (nombre public.gin_trgm_ops);
+    else
+        raise notice 'pg_trgm non está dispoñible: as buscas por nome non terán índice';
+    end if;
+
+    if exists (select 1 from pg_available_extensions where name = 'unaccent') then
+        create extension if not exists unaccent with schema public;
+        -- unaccent() é STABLE e un índice precisa unha función IMMUTABLE;
+        -- fixando o dicionario pódese declarar así
+        create or replace function sgbd_unaccent(text) returns text
+            language sql immutable parallel safe strict
+            as $f$ select public.unaccent('public.unaccent'::regdictionary, $1) $f$;
+        create index if not exists ix_empleado_nombre_fts
+            on Empleado using gin (to_tsvector('simple', sgbd_unaccent(nombre)));
+        create index if not exists ix_departamento_nombre_fts
+            on Departamento using gin (to_tsvector('simple', sgbd_unaccent(nombre)));
+        create index if not exists ix_proyecto_nombre_fts
+            on Proyecto using gin (to_tsvector('simple', sgbd_unaccent(nombre)));
+    else
+        raise notice 'unaccent non está dispoñible: a busca de texto completo non terá índice';
+    end if;
+end
+$$;
+
+analyze Empleado, Departamento, Proyecto;
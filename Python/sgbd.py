@@ -8,13 +8,38 @@
 # Data de creación: 03-05-2022
 #
 
+import argparse
+import base64
+import bisect
+import copy
+import csv
+import functools
+import http.server
+import importlib.util
+import io
+import itertools
 import json
+import os
+import queue
+import random
+import re
+import select
 import sys
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext, redirect_stdout
+from dataclasses import dataclass, asdict, field, fields
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterator, Optional
+
 import psycopg2
 import psycopg2.extras
 import psycopg2.errorcodes
 import psycopg2.extensions
-from datetime import datetime
 
 
 ## AUX_FUNCS---------------------------------------------------
@@ -149,374 +174,3827 @@ def request_horas():
         return None
 
 
-## ------------------------------------------------------------
-def connect_db():
+## SENTENZAS PREPARADAS----------------------------------------
+class StatementCache:
     """
-    Establece conexión ca BD
-    :return: conexión ca BD
+    Sentenzas preparadas dunha conexión. Cada sentenza fixa prepárase
+    (PREPARE) a primeira vez que se usa e despois execútase con EXECUTE e
+    os seus parámetros, aforrando o envío e a planificación do SQL. Gárdanse
+    como moito maxsize sentenzas; ao pasar dese número desaloxase (DEALLOCATE)
+    a usada hai máis tempo
     """
-    try:
-        config = read_config('dbconfig.json')
-        conn = psycopg2.connect(cursor_factory=psycopg2.extras.DictCursor, **config)
-        conn.autocommit = False
-        print('[✓] Conectado.')
-        return conn
-    except psycopg2.OperationalError as e:
-        print(f"[✗] Imposible conectar: {e}")
-        sys.exit(-1)
 
+    # a sentenza xa non existe no servidor (DISCARD, reconexión dun proxy...)
+    # ou o esquema cambiou e o plan gardado xa non vale
+    REPREPARE_PGCODES = (psycopg2.errorcodes.INVALID_SQL_STATEMENT_NAME,
+                         psycopg2.errorcodes.FEATURE_NOT_SUPPORTED)
 
-## ------------------------------------------------------------
-def disconnect_db(conn):
+    _names = itertools.count(1)
+
+    def __init__(self, maxsize=64):
+        """
+        :param maxsize: número máximo de sentenzas preparadas
+        """
+        self.maxsize = maxsize
+        self._prepared = OrderedDict()
+        self._stale = False
+
+    @staticmethod
+    def to_positional(sentenza):
+        """
+        Cambia os parámetros %(nome)s de psycopg2 polos $n de PREPARE
+        :return: par (sentenza, lista de nomes na orde de $1, $2...)
+        """
+        names = []
+
+        def replace(match):
+            if match.group(0) == '%%':
+                return '%'
+            if match.group(1) not in names:
+                names.append(match.group(1))
+            return f"${names.index(match.group(1)) + 1}"
+
+        return re.sub(r'%%|%\((\w+)\)s', replace, sentenza), names
+
+    def _prepare(self, cur, sentenza):
+        if self._stale:
+            cur.execute("deallocate all")
+            self._stale = False
+        entry = self._prepared.get(sentenza)
+        if entry is not None:
+            self._prepared.move_to_end(sentenza)
+            return entry
+        text, names = self.to_positional(sentenza)
+        name = f"sgbd_{next(self._names)}"
+        cur.execute(f"prepare {name} as {text}")
+        entry = self._prepared[sentenza] = (name, names)
+        while len(self._prepared) > self.maxsize:
+            _, (old, _) = self._prepared.popitem(last=False)
+            cur.execute(f"deallocate {old}")
+        return entry
+
+    def _execute(self, cur, sentenza, params):
+        name, names = self._prepare(cur, sentenza)
+        # para que TimedCursor rexistre o SQL orixinal e non o EXECUTE
+        cur.source = sentenza
+        if names:
+            cur.execute(f"execute {name} ({', '.join(['%s'] * len(names))})",
+                        [params[n] for n in names])
+        else:
+            cur.execute(f"execute {name}")
+
+    def execute(self, cur, sentenza, params=None):
+        """
+        Executa a sentenza preparada cos parámetros indicados. Se a sentenza
+        preparada xa non vale, vólvese preparar: se era a primeira da
+        transacción reintentase nunha nova, e se non a transacción falla e a
+        seguinte execución prepara de novo
+        :param cur: cursor da conexión
+        :param sentenza: SQL con parámetros %(nome)s
+        :param params: diccionario cos parámetros
+        """
+        first = cur.connection.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        try:
+            self._execute(cur, sentenza, params or {})
+        except psycopg2.Error as e:
+            if e.pgcode not in self.REPREPARE_PGCODES:
+                raise
+            self.clear()
+            if not first:
+                raise
+            cur.connection.rollback()
+            self._execute(cur, sentenza, params or {})
+
+    def clear(self):
+        """
+        Esquece as sentenzas preparadas; desalóxanse na seguinte execución
+        """
+        self._prepared.clear()
+        self._stale = True
+
+
+class CachingConnection(psycopg2.extensions.connection):
     """
-    Pecha a conexión ca BD
-    :param conn: a conexión aberta á bd
-    :return: Nada
+    Conexión que leva consigo a súa caché de sentenzas preparadas, de xeito
+    que ao reconectar se empeza cunha baleira
     """
-    conn.commit()
-    conn.close()
-    print('[✓] Conexión pechada.')
+    statements = None
 
 
-## ------------------------------------------------------------
-def get_emp_by_id(conn):
+## TEMPOS------------------------------------------------------
+class QueryTimer:
     """
-    Pide por teclado ao usuario o id dalgún empleado
-    :param conn: a conexion aberta á bd
-    :return: o codigo do empleado se exsite (None se no existe)
+    Rexistra o tempo, as filas e a operación de cada sentenza que executa
+    a ferramenta (ver TimedCursor). Agrega un histograma de tempos por
+    operación e escribe no rexistro de consultas lentas (unha liña JSON por
+    consulta) as que pasan de slow_ms, opcionalmente co seu EXPLAIN ANALYZE
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
-
-    id = request_id()
-    if id is None:
-        print(f"[✗] É obrigatorio especificar o id")
-        return None
+    # límites superiores (ms) dos intervalos do histograma
+    BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
 
-    sentenza_select = """select * from empleado where id=%(id)s"""
+    # sentenzas que se poden pasar a EXPLAIN
+    EXPLAINABLE = ('select', 'with', 'insert', 'update', 'delete', 'execute', 'values')
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    def __init__(self, slow_ms=None, slow_log=None, explain=False, histogram=False):
+        """
+        :param slow_ms: milisegundos a partir dos que unha sentenza é lenta
+        (None para non rexistrar ningunha)
+        :param slow_log: ficheiro do rexistro de consultas lentas (None para stderr)
+        :param explain: engadir o EXPLAIN ANALYZE das consultas lentas. A
+        sentenza execútase outra vez dentro dun savepoint que se desfai
+        :param histogram: mostrar o histograma ao saír
+        """
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.explain = explain
+        self.histogram = histogram
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+        self._labels = None
+        self._log = None
+
+    @contextmanager
+    def operation(self, name):
+        """
+        As sentenzas executadas dentro rexístranse coa operación name
+        """
+        stack = self._local.__dict__.setdefault('operations', [])
+        stack.append(name)
         try:
-            cur.execute(sentenza_select, {'id': id})
-            row = cur.fetchone()
+            yield
+        finally:
+            stack.pop()
 
-            if row is None:
-                print(f"[✓] Non existe o empregado con id {id}")
-                conn.commit()
-                return None
-            else:
-                comision = row['comision']
-                if comision is None:
-                    comision = '-'
-
-                id_xefe = row['id_jefe']
-                if id_xefe is None:
-                    id_xefe = '-'
-
-                id_departamento = row['id_departamento']
-                if id_departamento is None:
-                    id_departamento = '-'
-
-                print(f"[✓] 1 empregado atopado:")
-                print(f"\tId: {row['id']}")
-                print(f"\tNome: {row['nombre']}")
-                print(f"\tTraballo: {row['trabajo']}")
-                print(f"\tData contratación: {row['fecha_contratacion']}")
-                print(f"\tSalario: {row['salario']}")
-                print(f"\tComision: {comision}")
-                print(f"\tId xefe: {id_xefe}")
-                print(f"\tId departamento: {id_departamento}")
-
-                conn.commit()
-                return row[0]
+    @property
+    def current_operation(self):
+        stack = getattr(self._local, 'operations', None)
+        return stack[-1] if stack else None
 
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+    def label(self, sentenza):
+        """
+        :return: nome da constante SQL dos repositorios (p.ex.
+        EmpleadoRepo.SELECT) ou as primeiras palabras da sentenza. As
+        constantes que son modelos (con {campos}) recoñécense polas
+        combinacións que declara a clase en SQL_VARIANTS
+        """
+        if self._labels is None:
+            labels = {}
+            for cls in (EmpleadoRepo, DepartamentoRepo, ProyectoRepo, EmpleadoProyectoRepo,
+                        DepartamentoProyectoRepo, OrganigramaRepo, InformeRepo, BuscaRepo, Migrator):
+                for name, value in vars(cls).items():
+                    if name.isupper() and isinstance(value, str):
+                        labels.setdefault(value, f"{cls.__name__}.{name}")
+                for name, variants in getattr(cls, 'SQL_VARIANTS', {}).items():
+                    for kwargs in variants:
+                        labels.setdefault(getattr(cls, name).format(**kwargs), f"{cls.__name__}.{name}")
+            self._labels = labels
+        if isinstance(sentenza, bytes):
+            sentenza = sentenza.decode('utf-8', 'replace')
+        return self._labels.get(sentenza) or ' '.join(sentenza.split()[:3])[:60]
+
+    def record(self, cur, sentenza, params, seconds, rows, query=None, plan=None):
+        """
+        Rexistra unha sentenza executada
+        :param cur: cursor psycopg2 no que se executou (para o EXPLAIN), None
+        se quen chama xa fixo o EXPLAIN (ver sgbd_async._record)
+        :param sentenza: SQL orixinal
+        :param params: os seus parámetros
+        :param seconds: tempo de reloxo
+        :param rows: filas devoltas ou afectadas (-1 se non se saben)
+        :param query: SQL enviado ao servidor, None se a sentenza fallou
+        :param plan: EXPLAIN ANALYZE xa feito da sentenza, se o hai
+        """
+        label = self.label(sentenza)
+        operation = self.current_operation or label
+        ms = seconds * 1000
+        with self._lock:
+            stats = self._stats.setdefault(operation, {
+                'sentenzas': 0, 'filas': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'buckets': [0] * (len(self.BUCKETS_MS) + 1)})
+            stats['sentenzas'] += 1
+            stats['filas'] += max(rows, 0)
+            stats['total_ms'] += ms
+            stats['max_ms'] = max(stats['max_ms'], ms)
+            stats['buckets'][bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+        if self.slow_ms is not None and ms >= self.slow_ms:
+            self._log_slow(cur, operation, label, sentenza, params, ms, rows, query, plan)
+
+    def wants_plan(self, ms, query):
+        """
+        :return: True se unha sentenza que tardou ms milisegundos vai ao rexistro de
+        consultas lentas co seu EXPLAIN ANALYZE
+        """
+        if not self.explain or self.slow_ms is None or ms < self.slow_ms:
+            return False
+        if isinstance(query, bytes):
+            query = query.decode('utf-8', 'replace')
+        palabras = query.lstrip().split(None, 1)
+        return bool(palabras) and palabras[0].lower() in self.EXPLAINABLE
+
+    def _explain(self, cur, query):
+        """
+        EXPLAIN ANALYZE da sentenza nun savepoint, para desfacer os seus efectos
+        """
+        conn = cur.connection
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
             return None
+        with conn.cursor(cursor_factory=psycopg2.extensions.cursor) as ecur:
+            ecur.execute("savepoint sgbd_explain")
+            try:
+                ecur.execute("explain (analyze, buffers) " + query)
+                return '\n'.join(row[0] for row in ecur.fetchall())
+            except psycopg2.Error as e:
+                return f"EXPLAIN fallou: {e.pgcode}"
+            finally:
+                ecur.execute("rollback to savepoint sgbd_explain")
+                ecur.execute("release savepoint sgbd_explain")
+
+    def _log_slow(self, cur, operation, label, sentenza, params, ms, rows, query, plan):
+        if isinstance(sentenza, bytes):
+            sentenza = sentenza.decode('utf-8', 'replace')
+        entry = {'data': datetime.now().isoformat(timespec='milliseconds'), 'operacion': operation,
+                 'sentenza': label, 'ms': round(ms, 3), 'filas': rows,
+                 'sql': ' '.join(sentenza.split()), 'params': params}
+        if query is None:
+            entry['erro'] = True
+        elif plan is not None:
+            entry['plan'] = plan
+        elif cur is not None and self.wants_plan(ms, query):
+            if isinstance(query, bytes):
+                query = query.decode('utf-8', 'replace')
+            entry['plan'] = self._explain(cur, query)
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            if self._log is None:
+                self._log = open(self.slow_log, 'a', encoding='utf-8') if self.slow_log else sys.stderr
+            self._log.write(line + '\n')
+            self._log.flush()
+
+    def stats(self):
+        """
+        :return: diccionario operación -> {sentenzas, filas, total_ms, max_ms, buckets}
+        """
+        with self._lock:
+            return {op: dict(s, buckets=list(s['buckets'])) for op, s in self._stats.items()}
 
-
-## ------------------------------------------------------------
-def get_dept_by_id(conn):
+    def report(self):
+        """
+        :return: texto co histograma de tempos de cada operación
+        """
+        lines = ["-- Tempos por operación (ms)"]
+        limits = [f"<={b:g}" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]:g}"]
+        for op, s in sorted(self.stats().items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"\t{op}: {s['sentenzas']} sentenzas, {s['filas']} filas, "
+                         f"total {s['total_ms']:.1f}, media {s['total_ms'] / s['sentenzas']:.3f}, "
+                         f"máx {s['max_ms']:.3f}")
+            lines.append("\t\t" + '  '.join(f"{limit}: {n}" for limit, n in zip(limits, s['buckets']) if n))
+        return '\n'.join(lines)
+
+    def close(self):
+        with self._lock:
+            if self._log is not None and self._log is not sys.stderr:
+                self._log.close()
+            self._log = None
+
+
+class TimedCursor(psycopg2.extras.DictCursor):
     """
-    Pide por teclado ao usuario o id dalgún departamento
-    :param conn: a conexion aberta á bd
-    :return: o codigo do departamento se exsite (None se no existe)
+    Cursor que pasa ao QueryTimer (TimedCursor.timer) cada sentenza que
+    executa. Nos cursores do servidor mídese o tempo de ler as filas, xa
+    que o execute só as declara
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
+    # QueryTimer común, None para non medir nada
+    timer = None
+
+    # SQL orixinal cando se executa unha sentenza preparada (StatementCache)
+    source = None
+
+    def execute(self, query, vars=None):
+        timer = self.timer
+        if timer is None:
+            return super().execute(query, vars)
+        source, self.source = self.source, None
+        if self.name is not None:
+            self._timed = (source or query, vars, self.mogrify(query, vars))
+            return super().execute(query, vars)
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            result = super().execute(query, vars)
+            ok = True
+            return result
+        finally:
+            timer.record(self, source or query, vars, time.perf_counter() - inicio,
+                         self.rowcount if ok else -1, self.query if ok else None)
+
+    def copy_expert(self, sql, file, size=8192):
+        timer = self.timer
+        if timer is None:
+            return super().copy_expert(sql, file, size)
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            result = super().copy_expert(sql, file, size)
+            ok = True
+            return result
+        finally:
+            # COPY non se pode pasar a EXPLAIN
+            timer.record(self, sql, None, time.perf_counter() - inicio,
+                         self.rowcount if ok else -1, 'copy' if ok else None)
+
+    def __iter__(self):
+        timed = getattr(self, '_timed', None) if self.name is not None else None
+        if timed is None or self.timer is None:
+            yield from super().__iter__()
+            return
+        rows = super().__iter__()
+        seconds = 0.0
+        n = 0
+        while True:
+            inicio = time.perf_counter()
+            try:
+                row = next(rows)
+            except StopIteration:
+                seconds += time.perf_counter() - inicio
+                break
+            seconds += time.perf_counter() - inicio
+            n += 1
+            yield row
+        self._timed = None
+        self.timer.record(self, timed[0], timed[1], seconds, n, timed[2])
+
+
+def timed_operation(name):
+    """
+    Contexto no que as sentenzas rexistradas levan o nome da operación
+    """
+    if TimedCursor.timer is None:
+        return nullcontext()
+    return TimedCursor.timer.operation(name)
 
-    id = request_id()
-    if id is None:
-        print(f"[✗] É obrigatorio especificar o id")
-        return None
 
-    sentenza_select = """select * from departamento where id=%(id)s"""
+## CACHÉ-------------------------------------------------------
+class EntityCache:
+    """
+    Caché en memoria das filas de Empleado, Departamento e Proyecto buscadas
+    polo seu id. Cada entrada caduca aos ttl segundos e, se hai máis de
+    maxsize, bótase fóra a usada hai máis tempo. Os repositorios invalídana
+    cando escriben e, opcionalmente, un fío escoita as notificacións dos
+    triggers da migración 0002 para ver os cambios doutros clientes
+    """
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentenza_select, {'id': id})
-            row = cur.fetchone()
+    CHANNEL = 'sgbd_cambios'
 
-            if row is None:
-                print(f"[✓] Non existe o departamento con id {id}")
-                conn.commit()
-                return None
+    def __init__(self, maxsize=10000, ttl=60, notify=False):
+        """
+        :param maxsize: número máximo de entradas
+        :param ttl: segundos que dura cada entrada
+        :param notify: escoitar as notificacións de cambios (ver listen)
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.notify = notify
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._listener = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, table, id):
+        """
+        :return: par (atopado, copia do valor gardado)
+        """
+        with self._lock:
+            entry = self._data.get((table, id))
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[(table, id)]
+                    self.evictions += 1
+                self.misses += 1
+                return False, None
+            self._data.move_to_end((table, id))
+            self.hits += 1
+            return True, copy.copy(entry[1])
+
+    def put(self, table, id, value):
+        with self._lock:
+            self._data[(table, id)] = (time.monotonic() + self.ttl, copy.copy(value))
+            self._data.move_to_end((table, id))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, table, id=None):
+        """
+        Quita da caché unha fila ou, se id é None, todas as da táboa
+        """
+        with self._lock:
+            if id is not None:
+                keys = [(table, id)] if (table, id) in self._data else []
             else:
-                print(f"[✓] 1 departamento atopado:")
-                print(f"\tId: {row['id']}")
-                print(f"\tNome: {row['nombre']}")
-                print(f"\tLocalidade: {row['localidad']}")
+                keys = [k for k in self._data if k[0] == table]
+            for key in keys:
+                del self._data[key]
+            self.invalidations += 1
 
-                conn.commit()
-                return row[0]
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.invalidations += 1
 
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
-            return None
+    def stats(self):
+        """
+        :return: diccionario cos contadores de acertos, fallos, expulsións e
+        invalidacións e o tamaño actual
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'size': len(self._data)}
+
+    def _on_notify(self, payload):
+        """
+        Procesa unha notificación "táboa:id1,id2,..." ou "táboa:*"
+        """
+        table, _, ids = payload.partition(':')
+        if ids == '*':
+            self.invalidate(table)
+        else:
+            for id in ids.split(','):
+                if id:
+                    self.invalidate(table, int(id))
+
+    def listen(self, params):
+        """
+        Arranca un fío que escoita (LISTEN) as notificacións de cambios
+        cunha conexión propia e invalida as filas afectadas
+        :param params: parámetros de conexión de psycopg2
+        """
+        self._listener = CacheListener(self, params)
+        self._listener.start()
 
+    def close(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
 
-## ------------------------------------------------------------
-def get_pro_by_id(conn):
+
+class CacheListener(threading.Thread):
     """
-    Pide por teclado ao usuario o id dalgún proxecto
-    :param conn: a conexion aberta á bd
-    :return: o codigo do proxecto se exsite (None se no existe)
+    Fío que escoita as notificacións de cambios para EntityCache. Se perde
+    a conexión baléira a caché (puido perder notificacións) e reconecta
+    """
+
+    def __init__(self, cache, params, poll_timeout=1.0):
+        super().__init__(name='sgbd-cache-listener', daemon=True)
+        self.cache = cache
+        self.params = params
+        self.poll_timeout = poll_timeout
+        self._stopping = threading.Event()
+
+    def run(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            try:
+                conn = psycopg2.connect(**self.params)
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"listen {EntityCache.CHANNEL}")
+                self.cache.clear()
+                backoff = 0.5
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.cache._on_notify(conn.notifies.pop(0).payload)
+                conn.close()
+            except psycopg2.Error:
+                self.cache.clear()
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def stop(self):
+        self._stopping.set()
+        self.join(timeout=2 * self.poll_timeout)
+
+
+## POOL--------------------------------------------------------
+class PoolTimeout(Exception):
+    """
+    Non quedou ningunha conexión libre no pool dentro do tempo de espera
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
 
-    id = request_id()
-    if id is None:
-        print(f"[✗] É obrigatorio especificar o id")
-        return None
+class ConnectionPool:
+    """
+    Pool de conexións á BD. Cada operación colle unha conexión do pool
+    (checkout) e devólvea ao rematar, de xeito que varias operacións poden
+    executarse á vez e unha conexión caída non remata a sesión.
+    """
 
-    sentenza_select = """select * from proyecto where id=%(id)s"""
+    def __init__(self, params, minconn=1, maxconn=5, checkout_timeout=10,
+                 health_check_after=30, max_retries=5, backoff=0.5, statement_cache=64):
+        """
+        :param params: parámetros de conexión de psycopg2 (host, user, ...)
+        :param minconn: conexións que se abren ao crear o pool
+        :param maxconn: máximo de conexións abertas á vez
+        :param checkout_timeout: segundos a esperar por unha conexión libre
+        :param health_check_after: segundos de inactividade tras os que se
+        comproba a conexión antes de entregala
+        :param max_retries: intentos de conexión antes de rendirse
+        :param backoff: espera inicial (segundos) entre intentos, que se dobra
+        en cada intento
+        :param statement_cache: sentenzas preparadas por conexión (0 para non
+        preparar ningunha)
+        """
+        self.params = params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.statement_cache = statement_cache
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._closed = False
+
+        for _ in range(minconn):
+            self._idle.put((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        """
+        Abre unha conexión nova, reintentando con espera exponencial
+        :return: conexión ca BD
+        """
+        delay = self.backoff
+        for intento in range(1, self.max_retries + 1):
+            try:
+                conn = psycopg2.connect(connection_factory=CachingConnection,
+                                        cursor_factory=TimedCursor, **self.params)
+                conn.autocommit = False
+                if self.statement_cache > 0:
+                    conn.statements = StatementCache(self.statement_cache)
+                return conn
+            except psycopg2.OperationalError:
+                if intento == self.max_retries:
+                    raise
+                time.sleep(delay + random.uniform(0, delay))
+                delay *= 2
+
+    @staticmethod
+    def _healthy(conn):
+        """
+        Comproba que a conexión segue viva
+        :param conn: conexión a comprobar
+        :return: True ou False
+        """
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    @staticmethod
+    def _close(conn):
         try:
-            cur.execute(sentenza_select, {'id': id})
-            row = cur.fetchone()
+            conn.close()
+        except psycopg2.Error:
+            pass
 
-            if row is None:
-                print(f"[✓] Non existe o proxecto con id {id}")
-                conn.commit()
-                return None
+    def getconn(self):
+        """
+        Colle unha conexión do pool, abrindo unha nova se non hai ningunha
+        libre e aínda non se chegou a maxconn
+        :return: conexión ca BD
+        """
+        if self._closed:
+            raise PoolTimeout("O pool está pechado")
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise PoolTimeout(f"Non hai conexións libres tras {self.checkout_timeout} s")
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._connect()
+                    break
+                if time.monotonic() - last_used > self.health_check_after and not self._healthy(conn):
+                    self._close(conn)
+                    conn = None
+            with self._lock:
+                self._in_use += 1
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        """
+        Devolve unha conexión ao pool. Se quedou cunha transacción aberta
+        desfaise; se está rota péchase
+        :param conn: conexión collida con getconn()
+        :return: Nada
+        """
+        try:
+            if not conn.closed and not self._closed:
+                try:
+                    if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                    self._idle.put((conn, time.monotonic()))
+                except psycopg2.Error:
+                    self._close(conn)
             else:
-                print(f"[✓] 1 proxecto atopado:")
-                print(f"\tId: {row['id']}")
-                print(f"\tNome: {row['nombre']}")
-                print(f"\tLocalidade: {row['localidad']}")
+                self._close(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """
+        Checkout dunha conexión para unha operación:
+            with pool.connection() as conn: ...
+        """
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
 
-                conn.commit()
-                return row[0]
+    def stats(self):
+        """
+        :return: diccionario con conexións en uso, libres e o máximo
+        """
+        with self._lock:
+            return {'in_use': self._in_use, 'idle': self._idle.qsize(), 'max': self.maxconn}
 
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
-            return None
+    def closeall(self):
+        """
+        Pecha todas as conexións libres e impide novos checkouts
+        :return: Nada
+        """
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._close(conn)
 
 
-## ------------------------------------------------------------
-def get_emps_by_sal(conn):
+def split_pool_config(config):
     """
-    Pide por teclado ao usuario o salario dalgún empleado
-    :param conn: a conexión aberta á bd
-    :return: Devolve os detalles dos empleados que cumpren a restricción
-    de salario indicada (None se no existe)
+    Separa a sección "pool" de dbconfig.json dos parámetros de conexión,
+    pasando o statement_timeout do pool ás options da conexión
+    :param config: config da BD (ver read_config)
+    :return: par (parámetros de conexión, config do pool)
     """
+    params = dict(config)
+    pool_cfg = params.pop('pool', {})
+    statement_timeout = pool_cfg.get('statement_timeout')
+    if statement_timeout is not None:
+        params['options'] = f"{params.get('options', '')} -c statement_timeout={int(statement_timeout)}".strip()
+    return params, pool_cfg
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
 
-    salario = request_salario()
-    if salario is None:
-        print(f"[✗] É obrigatorio especificar o salario")
-        return None
+def create_pool(config):
+    """
+    Crea o pool de conexións a partir da config da BD. A sección "pool"
+    de dbconfig.json configura o pool; o resto son parámetros de conexión
+    :param config: config da BD (ver read_config)
+    :return: pool de conexións
+    """
+    params, pool_cfg = split_pool_config(config)
+    return ConnectionPool(params,
+                          minconn=pool_cfg.get('minconn', 1),
+                          maxconn=pool_cfg.get('maxconn', 5),
+                          checkout_timeout=pool_cfg.get('checkout_timeout', 10),
+                          health_check_after=pool_cfg.get('health_check_after', 30),
+                          max_retries=pool_cfg.get('max_retries', 5),
+                          backoff=pool_cfg.get('backoff', 0.5),
+                          statement_cache=pool_cfg.get('statement_cache', 64))
+
+
+def configure(config):
+    """
+    Aplica as opcións da ferramenta presentes na config da BD e quítaas
+    dela, deixando só os parámetros de conexión e a sección "pool"
+    :param config: config da BD (ver read_config)
+    :return: a config sen as opcións da ferramenta
+    """
+    config = dict(config)
+    Repo.itersize = config.pop('itersize', Repo.itersize)
+    MetricsExporter.config = config.pop('metrics', None)
+    timing_cfg = config.pop('timing', None)
+    if timing_cfg is not None and timing_cfg.get('enabled', True):
+        TimedCursor.timer = QueryTimer(slow_ms=timing_cfg.get('slow_ms'), slow_log=timing_cfg.get('slow_log'),
+                                       explain=timing_cfg.get('explain', False),
+                                       histogram=timing_cfg.get('histogram', False))
+    retry_cfg = config.pop('retry', None)
+    if retry_cfg is not None:
+        Repo.runner = None if not retry_cfg.get('enabled', True) else TransactionRunner(
+            max_attempts=retry_cfg.get('max_attempts', 5), backoff=retry_cfg.get('backoff', 0.05),
+            max_backoff=retry_cfg.get('max_backoff', 2.0), budget=retry_cfg.get('budget', 20),
+            budget_ratio=retry_cfg.get('budget_ratio', 0.1))
+    cache_cfg = config.pop('cache', None)
+    if cache_cfg is not None and cache_cfg.get('enabled', True):
+        Repo.cache = EntityCache(maxsize=cache_cfg.get('maxsize', 10000), ttl=cache_cfg.get('ttl', 60),
+                                 notify=cache_cfg.get('listen', False))
+    return config
 
-    sentencia_select = """
-        select id, nombre, salario from empleado where salario>%(salario)s
-        """
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_select, {'salario': salario})
-            row = cur.fetchone()
-            while row:
-                print(f"\tFila {cur.rownumber}: [id: {row[0]}, nome: {row[1]}, salario: {row[2]}]")
-                row = cur.fetchone()
-            print(f"[✓] Total de empregados: {cur.rowcount}")
-            conn.commit()
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+## ------------------------------------------------------------
+def connect_db():
+    """
+    Establece conexión ca BD
+    :return: pool de conexións ca BD
+    """
+    try:
+        config = configure(read_config('dbconfig.json'))
+        pool = create_pool(config)
+        if Repo.cache is not None and Repo.cache.notify:
+            Repo.cache.listen(pool.params)
+        print('[✓] Conectado.')
+        return pool
+    except psycopg2.OperationalError as e:
+        print(f"[✗] Imposible conectar: {e}")
+        sys.exit(-1)
 
 
 ## ------------------------------------------------------------
-def get_depts_by_loc(conn):
+def disconnect_db(pool):
     """
-    Pide por teclado ao usuario a localidade dalgún departamento
-    :param conn: a conexión aberta á bd
-    :return: Devolve os detalles dos departamentos que cumpren a restricción
-    de localidade indicada (None se no existe)
+    Pecha as conexións do pool ca BD
+    :param pool: o pool de conexións aberto á bd
+    :return: Nada
     """
+    if Repo.runner is not None:
+        for name, st in sorted(Repo.runner.stats().items()):
+            if st['reintentos'] or st['abortos']:
+                print(f"[✓] {name}: {st['chamadas']} transaccións, {st['reintentos']} reintentos, "
+                      f"{st['abortos']} abortadas")
+    if Repo.cache is not None:
+        Repo.cache.close()
+        st = Repo.cache.stats()
+        if st['hits'] or st['misses']:
+            print(f"[✓] Caché: {st['hits']} acertos, {st['misses']} fallos, "
+                  f"{st['evictions']} expulsións, {st['invalidations']} invalidacións")
+    pool.closeall()
+    print('[✓] Conexión pechada.')
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
 
-    localidade = request_localidade()
-    if localidade is None:
-        print(f"[✗] É obrigatorio especificar a localidade")
-        return None
+## MÉTRICAS----------------------------------------------------
+class MetricsExporter:
+    """
+    Expón a actividade da ferramenta en formato Prometheus/OpenMetrics:
+    sentenzas e latencias por operación (QueryTimer), ocupación do pool,
+    commits e rollbacks por código de erro, reintentos (TransactionRunner)
+    e acertos da caché. Sírvese por HTTP en /metrics nun porto local ou
+    escríbese cada interval segundos nun ficheiro para o textfile
+    collector de node_exporter. Para probalo:
+        curl -H 'Accept: application/openmetrics-text' localhost:PORTO/metrics
+    """
+
+    CONTENT_TYPE_OPENMETRICS = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+    CONTENT_TYPE_TEXT = 'text/plain; version=0.0.4; charset=utf-8'
+
+    # sección "metrics" de dbconfig.json (ver start_metrics)
+    config = None
 
-    sentencia_select = """
-        select id, nombre from departamento where localidad=%(localidade)s
+    def __init__(self, pool):
+        """
+        :param pool: pool de conexións (ConnectionPool ou
+        sgbd_async.AsyncConnectionPool)
+        """
+        self.pool = pool
+        self._server = None
+        self._writer = None
+        self._stop = threading.Event()
+
+    @staticmethod
+    def _labels(**labels):
+        def escape(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in labels.items()) + '}' if labels else ''
+
+    def render(self, openmetrics=True):
+        """
+        :param openmetrics: formato OpenMetrics 1.0 ou, se é False, o
+        formato de texto 0.0.4 de Prometheus
+        :return: texto coas métricas
+        """
+        lines = []
+
+        def family(name, kind, help):
+            # en OpenMetrics a familia dun contador non leva o sufixo _total
+            if kind == 'counter' and not openmetrics:
+                name += '_total'
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def sample(name, value, **labels):
+            lines.append(f"{name}{self._labels(**labels)} {value}")
+
+        timer = TimedCursor.timer
+        if timer is not None:
+            stats = timer.stats()
+            family('sgbd_statements', 'counter', "Sentenzas executadas por operación")
+            for op, st in sorted(stats.items()):
+                sample('sgbd_statements_total', st['sentenzas'], operation=op)
+            family('sgbd_statement_rows', 'counter', "Filas devoltas ou afectadas por operación")
+            for op, st in sorted(stats.items()):
+                sample('sgbd_statement_rows_total', st['filas'], operation=op)
+            family('sgbd_statement_duration_seconds', 'histogram', "Tempo de reloxo das sentenzas por operación")
+            for op, st in sorted(stats.items()):
+                acumulado = 0
+                for limit, n in zip(QueryTimer.BUCKETS_MS, st['buckets']):
+                    acumulado += n
+                    sample('sgbd_statement_duration_seconds_bucket', acumulado, operation=op, le=f"{limit / 1000:g}")
+                sample('sgbd_statement_duration_seconds_bucket', st['sentenzas'], operation=op, le='+Inf')
+                sample('sgbd_statement_duration_seconds_sum', f"{st['total_ms'] / 1000:.6f}", operation=op)
+                sample('sgbd_statement_duration_seconds_count', st['sentenzas'], operation=op)
+
+        pool = self.pool.stats()
+        family('sgbd_pool_connections', 'gauge', "Conexións do pool por estado")
+        sample('sgbd_pool_connections', pool['in_use'], state='in_use')
+        sample('sgbd_pool_connections', pool['idle'], state='idle')
+        family('sgbd_pool_max_connections', 'gauge', "Máximo de conexións do pool")
+        sample('sgbd_pool_max_connections', pool['max'])
+
+        tx = Repo.tx_stats.stats()
+        family('sgbd_transaction_commits', 'counter', "Transaccións confirmadas")
+        sample('sgbd_transaction_commits_total', tx['commits'])
+        family('sgbd_transaction_rollbacks', 'counter', "Transaccións desfeitas por motivo (código de erro)")
+        for motivo, n in sorted(tx['rollbacks'].items()):
+            sample('sgbd_transaction_rollbacks_total', n, reason=motivo)
+
+        if Repo.runner is not None:
+            retries = Repo.runner.stats()
+            family('sgbd_transaction_retries', 'counter', "Reintentos por serialization_failure/deadlock")
+            for op, st in sorted(retries.items()):
+                sample('sgbd_transaction_retries_total', st['reintentos'], operation=op)
+            family('sgbd_transaction_aborts', 'counter', "Transaccións abandonadas tras esgotar os reintentos")
+            for op, st in sorted(retries.items()):
+                sample('sgbd_transaction_aborts_total', st['abortos'], operation=op)
+
+        if Repo.cache is not None:
+            cache = Repo.cache.stats()
+            for key, help in (('hits', "Buscas por id servidas pola caché"),
+                              ('misses', "Buscas por id que foron á BD"),
+                              ('evictions', "Entradas da caché caducadas ou expulsadas")):
+                family(f'sgbd_cache_{key}', 'counter', help)
+                sample(f'sgbd_cache_{key}_total', cache[key])
+            family('sgbd_cache_entries', 'gauge', "Entradas na caché")
+            sample('sgbd_cache_entries', cache['size'])
+            family('sgbd_cache_hit_ratio', 'gauge', "Proporción de buscas servidas pola caché")
+            total = cache['hits'] + cache['misses']
+            sample('sgbd_cache_hit_ratio', f"{cache['hits'] / total:.6f}" if total else 0)
+
+        if openmetrics:
+            lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
         """
+        Serve as métricas en http://host:port/metrics nun fío
+        """
+        exporter = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+                body = exporter.render(openmetrics).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', exporter.CONTENT_TYPE_OPENMETRICS if openmetrics
+                                 else exporter.CONTENT_TYPE_TEXT)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name='sgbd-metrics', daemon=True).start()
+
+    def write_textfile(self, path):
+        """
+        Escribe as métricas no ficheiro (cambiándoo dunha vez, para que o
+        collector nunca lea un a medio escribir)
+        """
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.render(openmetrics=False))
+        os.replace(tmp, path)
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_select, {'localidade': localidade})
-            row = cur.fetchone()
-            while row:
-                print(f"\tFila {cur.rownumber}: [id: {row[0]}, nome: {row[1]}]")
-                row = cur.fetchone()
-            print(f"[✓] Total de departamentos: {cur.rowcount}")
-            conn.commit()
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+    def textfile(self, path, interval=15):
+        """
+        Reescribe o ficheiro de métricas cada interval segundos nun fío
+        """
+        def loop():
+            while not self._stop.wait(interval):
+                self.write_textfile(path)
+        self._textfile = path
+        self._writer = threading.Thread(target=loop, name='sgbd-metrics-textfile', daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """
+        Para o servidor e escribe o ficheiro por última vez
+        """
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._writer is not None:
+            self._writer.join()
+            self.write_textfile(self._textfile)
 
 
-## ------------------------------------------------------------
-def get_pros_by_loc(conn):
+def start_metrics(pool, config, port=None, textfile=None):
     """
-    Pide por teclado ao usuario a localidade dalgún proxecto
-    :param conn: a conexión aberta á bd
-    :return: Devolve os detalles dos departamentos que cumpren a restricción
-    de localidade indicada (None se no existe)
+    Arranca o exportador de métricas se a sección "metrics" de
+    dbconfig.json ou os argumentos o piden
+    :param config: sección "metrics" (port, host, textfile, interval) ou None
+    :return: MetricsExporter ou None
     """
-
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
-
-    localidade = request_localidade()
-    if localidade is None:
-        print(f"[✗] É obrigatorio especificar a localidade")
+    config = dict(config or {})
+    port = port if port is not None else config.get('port')
+    textfile = textfile if textfile is not None else config.get('textfile')
+    if port is None and textfile is None:
         return None
+    if TimedCursor.timer is None:
+        TimedCursor.timer = QueryTimer()
+    exporter = MetricsExporter(pool)
+    if port is not None:
+        exporter.serve(port, config.get('host', '127.0.0.1'))
+        print(f"[✓] Métricas en http://{config.get('host', '127.0.0.1')}:{port}/metrics")
+    if textfile is not None:
+        exporter.textfile(textfile, config.get('interval', 15))
+    return exporter
+
+
+## MODELO------------------------------------------------------
+@dataclass
+class Empleado:
+    id: int
+    nombre: str
+    trabajo: str
+    fecha_contratacion: date
+    salario: float
+    comision: Optional[float] = None
+    id_jefe: Optional[int] = None
+    id_departamento: Optional[int] = None
+
+
+@dataclass
+class Departamento:
+    id: int
+    nombre: str
+    localidad: str
+    id_director: Optional[int] = None
+
+
+@dataclass
+class Proyecto:
+    id: int
+    nombre: str
+    localidad: str
+
+
+@dataclass
+class EmpleadoFilter:
+    """
+    Conxunto de empregados para as actualizacións masivas. Os criterios
+    indicados combínanse con "e"; sen ningún selecciónanse todos
+    """
+    ids: Optional[list] = None
+    id_departamento: Optional[int] = None
+    trabajo: Optional[str] = None
+    salario_min: Optional[float] = None
+    salario_max: Optional[float] = None
 
-    sentencia_select = """
-        select id, nombre from proyecto where localidad=%(localidade)s
+    def where(self):
+        """
+        :return: par (condición SQL, parámetros) que selecciona os empregados
         """
+        conds = []
+        params = {}
+        if self.ids is not None:
+            conds.append("id = any(%(f_ids)s)")
+            params['f_ids'] = list(self.ids)
+        if self.id_departamento is not None:
+            conds.append("id_departamento = %(f_departamento)s")
+            params['f_departamento'] = self.id_departamento
+        if self.trabajo is not None:
+            conds.append("trabajo = %(f_trabajo)s")
+            params['f_trabajo'] = self.trabajo
+        if self.salario_min is not None:
+            conds.append("salario >= %(f_salario_min)s")
+            params['f_salario_min'] = self.salario_min
+        if self.salario_max is not None:
+            conds.append("salario <= %(f_salario_max)s")
+            params['f_salario_max'] = self.salario_max
+        return " and ".join(conds) or "true", params
+
+
+@dataclass
+class BulkResult:
+    """
+    Resultado dunha actualización masiva. En dry-run actualizados son as
+    filas que se cambiarían e os totais son a suma dos valores antes e
+    despois. violacions son as filas que incumprirían ch_salario/ch_comision
+    """
+    seleccionados: int = 0
+    actualizados: int = 0
+    total_actual: Optional[float] = None
+    total_novo: Optional[float] = None
+    violacions: list = field(default_factory=list)
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_select, {'localidade': localidade})
-            row = cur.fetchone()
-            while row:
-                print(f"\tFila {cur.rownumber}: [id: {row[0]}, nome: {row[1]}]")
-                row = cur.fetchone()
-            print(f"[✓] Total de departamentos: {cur.rowcount}")
-            conn.commit()
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+
+@dataclass
+class AccumulateResult:
+    """
+    Resultado dunha acumulación de horas. recibidas son os deltas lidos,
+    pares os pares (empregado, proxecto) distintos de cada lote e aplicadas
+    os pares actualizados ou creados. rexeitadas son os pares que non
+    existen ou que deixarían as horas en negativo (ch_horas)
+    """
+    recibidas: int = 0
+    pares: int = 0
+    aplicadas: int = 0
+    rexeitadas: list = field(default_factory=list)
 
 
-## ------------------------------------------------------------
-def update_emp_sal_by_percentage(conn):
+@dataclass
+class LookupResult:
     """
-    Pide por teclado ao usuario un porcentaxe para incrementar o salario
-    dun empleado
-    :param conn: a conexión aberta á bd
-    :return: Devolve os detalles do usuario co cambio aplicado (None se no existe)
+    Resultado dunha busca por varios ids: found ten as dataclasses polo seu
+    id e missing os ids que non existen, na orde na que se pediron
     """
+    found: dict = field(default_factory=dict)
+    missing: list = field(default_factory=list)
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
 
-    id = get_emp_by_id(conn)
+@dataclass
+class Page:
+    """
+    Páxina dun listado paxinado. token é o que hai que pasar para pedir a
+    seguinte páxina, ou None se esta é a última
+    """
+    rows: list
+    token: Optional[str] = None
 
-    if id is None:
-        conn.rollback()
-        return
 
-    porcentaxeStr = input("Introduce unha porcentaxe de aumento de salario (float): ")
-    porcentaxe = float(porcentaxeStr)
+def from_row(cls, row):
+    """
+    Crea a dataclass cls a partir dunha fila, ignorando as columnas que non
+    son campos seus (por exemplo columnas engadidas ao esquema despois)
+    """
+    return cls(**{f.name: row[f.name] for f in fields(cls) if f.name in row.keys()})
 
-    sentencia_update = "update empleado set salario = salario + salario * %(porc)s / 100 where id = %(id)s"
 
-    sentencia_select = """
-            select id, nombre, salario from empleado where id=%(id)s
-            """
+## ERROS-------------------------------------------------------
+class SgbdError(Exception):
+    """
+    Erro da capa de datos cunha mensaxe lexible para o usuario
+    """
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_select, {'id': id})
-            row = cur.fetchone()
-            print(f"RESULTADO: [id: {row[0]}, nome: {row[1]}, novo salario: {row[2] + row[2] * porcentaxe / 100}]")
-            confirmacion = request_changes_confirmation()
-            if confirmacion:
-                cur.execute(sentencia_update, {'id': id, 'porc': porcentaxe})
-                conn.commit()
-                print(f"[✓] Salario actualizado")
-            else:
-                conn.rollback()
-                print(f"[✗] Actualización cancelada polo usuario")
 
-        except psycopg2.Error as e:
-            if e.pgcode == psycopg2.errorcodes.CHECK_VIOLATION:
-                print("[✗]ERRO: O salario debe ser positivo")
-            else:
-                print(f"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+class NotFoundError(SgbdError):
+    """
+    Non existe o empregado, departamento, proxecto ou relación indicado
+    """
 
 
-## ------------------------------------------------------------
-def update_emp_comm(conn):
+class AlreadyExistsError(SgbdError):
     """
-    Pide por teclado ao usuario unha nova comisión para cambiarsela
-    ao usuario
-    :param conn: a conexión aberta á bd
-    :return: Devolve os detalles do usuario co cambio aplicado (None se no existe)
+    Xa existe a relación que se quere crear
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
 
-    id = get_emp_by_id(conn)
+class CycleError(SgbdError):
+    """
+    A xerarquía de xefes (id_jefe) ten un ciclo
+    """
 
-    if id is None:
-        conn.rollback()
-        return
 
-    commStr = input("Introduce a nova comisión (float): ")
-    if commStr == '':
-        comm = None
-    else:
-        comm = float(commStr)
+class ConflictError(SgbdError):
+    """
+    A fila cambiou entre que se leu e que se quixo escribir (a versión xa
+    non coincide)
+    """
+
+
+## TRANSACCIÓNS------------------------------------------------
+# erros de concorrencia das transaccións SERIALIZABLE que se arranxan repetindo
+RETRY_PGCODES = (psycopg2.errorcodes.SERIALIZATION_FAILURE, psycopg2.errorcodes.DEADLOCK_DETECTED)
+
+
+class TransactionRunner:
+    """
+    Repite as transaccións que fallan por serialization_failure ou
+    deadlock_detected, que nas escrituras SERIALIZABLE son esperables con
+    carga concorrente. Entre intentos espera un tempo aleatorio entre 0 e
+    un máximo que se dobra en cada intento (backoff exponencial con jitter).
+    Os reintentos gastan dun orzamento común que só se recarga coas
+    transaccións que saen á primeira, así con moita contención os
+    reintentos non multiplican a carga. Conta chamadas, reintentos e
+    abortos por operación para ver onde hai contención
+    """
+
+    def __init__(self, max_attempts=5, backoff=0.05, max_backoff=2.0, budget=20, budget_ratio=0.1):
+        """
+        :param max_attempts: intentos por transacción
+        :param backoff: espera máxima (segundos) antes do primeiro reintento
+        :param max_backoff: tope da espera máxima
+        :param budget: reintentos que se poden gastar de seguido
+        :param budget_ratio: reintentos que recupera cada transacción que
+        sae á primeira
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget
+        self.budget_ratio = budget_ratio
+        self._tokens = float(budget)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stats = {}
+
+    def _count(self, name, key):
+        with self._lock:
+            stats = self._stats.setdefault(name, {'chamadas': 0, 'reintentos': 0, 'abortos': 0})
+            stats[key] += 1
+
+    def _take_token(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def run(self, name, func, *args, **kwargs):
+        """
+        Executa func (unha transacción completa) repetíndoa se falla por un
+        erro de concorrencia
+        :param name: nome da operación para os contadores
+        :return: o que devolva func
+        """
+        self.started(name)
+        attempt = 0
+        while True:
+            attempt += 1
+            self._local.attempts = attempt
+            try:
+                result = func(*args, **kwargs)
+            except psycopg2.Error as e:
+                delay = self.retry_delay(name, e.pgcode, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            self.succeeded(attempt)
+            return result
+
+    # started, retry_delay e succeeded son os pasos de run, para quen
+    # executa as transaccións doutro xeito (ver sgbd_async.retry_transaction)
+    def started(self, name):
+        self._count(name, 'chamadas')
+
+    def retry_delay(self, name, pgcode, attempt):
+        """
+        Decide se se repite a transacción que fallou co código pgcode
+        :param attempt: o intento que fallou, desde 1
+        :return: segundos a esperar antes de repetila, ou None se non se repite
+        """
+        if pgcode not in RETRY_PGCODES:
+            return None
+        if attempt >= self.max_attempts or not self._take_token():
+            self._count(name, 'abortos')
+            return None
+        self._count(name, 'reintentos')
+        return random.uniform(0, min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+
+    def succeeded(self, attempt):
+        """
+        Rexistra que a transacción rematou no intento attempt: as que saen á
+        primeira recargan o orzamento
+        """
+        if attempt == 1:
+            with self._lock:
+                self._tokens = min(self.budget, self._tokens + self.budget_ratio)
+
+    @property
+    def attempts(self):
+        """
+        Intentos que levou a última transacción executada neste fío (0 se
+        non se executou ningunha desde reset_attempts)
+        """
+        return getattr(self._local, 'attempts', 0)
+
+    def reset_attempts(self):
+        self._local.attempts = 0
+
+    def stats(self):
+        """
+        :return: diccionario operación -> {chamadas, reintentos, abortos}
+        """
+        with self._lock:
+            return {name: dict(s) for name, s in self._stats.items()}
+
+
+class TransactionStats:
+    """
+    Contadores de commits e rollbacks das transaccións dos repositorios.
+    Os rollbacks sepáranse polo motivo: o nome do código de erro de
+    postgres (CHECK_VIOLATION, SERIALIZATION_FAILURE...) ou a clase da
+    excepción se non vén de postgres
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.commits = 0
+        self.rollbacks = {}
+
+    def commit(self):
+        with self._lock:
+            self.commits += 1
+
+    def rollback(self, error):
+        # psycopg 3 (sgbd_async) garda o código en sqlstate
+        pgcode = getattr(error, 'pgcode', None) or getattr(error, 'sqlstate', None)
+        motivo = (psycopg2.errorcodes.lookup(pgcode) or pgcode) if pgcode else type(error).__name__
+        with self._lock:
+            self.rollbacks[motivo] = self.rollbacks.get(motivo, 0) + 1
+
+    def stats(self):
+        """
+        :return: diccionario {commits, rollbacks: {motivo: n}}
+        """
+        with self._lock:
+            return {'commits': self.commits, 'rollbacks': dict(self.rollbacks)}
+
+
+def retry_transaction(method):
+    """
+    Decorador dos métodos dos repositorios que escriben: executa o método
+    co TransactionRunner do repositorio (Repo.runner)
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._retry(method.__qualname__, method, self, *args, **kwargs)
+    return wrapper
+
+
+## PAXINACIÓN--------------------------------------------------
+def encode_token(scope, key):
+    """
+    Token de continuación dun listado paxinado: a última clave devolta
+    (por exemplo [salario, id]) e o listado ao que pertence
+    :param scope: identifica o listado e os seus filtros
+    :param key: lista cos valores da clave de orde da última fila
+    :return: texto en base64 para URLs
+    """
+    data = json.dumps({'q': scope, 'k': key}, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_token(token, scope):
+    """
+    :return: a clave gardada no token
+    :raise SgbdError: se o token non é válido ou é doutro listado
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if data['q'] != scope:
+            raise ValueError(data['q'])
+        return data['k']
+    except (ValueError, TypeError, KeyError) as e:
+        raise SgbdError("Token de continuación non válido") from e
+
+
+## REPOSITORIOS------------------------------------------------
+class Repo:
+    """
+    Base dos repositorios. Cada método recibe argumentos tipados, executa
+    unha transacción completa sobre a conexión e devolve filas ou
+    dataclasses, sen input() nin print(). Os erros de postgres (psycopg2.Error)
+    propáganse despois de facer rollback.
+    """
+
+    # filas que trae cada viaxe ao servidor nos listados (ver _stream)
+    itersize = 2000
+
+    # caché das buscas por id (EntityCache), None para non usala
+    cache = None
+
+    # reintentos das escrituras (TransactionRunner), None para non reintentar
+    runner = TransactionRunner()
+
+    # commits e rollbacks de todas as transaccións
+    tx_stats = TransactionStats()
+
+    # ids por consulta = any() en get_many, e a partir de cantos se copian
+    # a unha táboa temporal e se fai un join
+    many_chunk = 10000
+    many_temp_threshold = 100000
+
+    _cursor_ids = itertools.count(1)
+
+    def __init__(self, conn):
+        """
+        :param conn: a conexión aberta á bd (por exemplo collida do pool)
+        """
+        self.conn = conn
+
+    @contextmanager
+    def _transaction(self, isolation_level=psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED):
+        """
+        Abre unha transacción co nivel de illamento indicado e devolve un
+        cursor. Fai commit ao rematar ou rollback se hai unha excepción
+        """
+        self.conn.isolation_level = isolation_level
+        try:
+            with self.conn.cursor(cursor_factory=TimedCursor) as cur:
+                yield cur
+            self.conn.commit()
+            self.tx_stats.commit()
+        except BaseException as e:
+            self.conn.rollback()
+            self.tx_stats.rollback(e)
+            raise
+
+    def _stream(self, sentenza, params):
+        """
+        Executa a consulta nun cursor do servidor (named cursor) e devolve as
+        filas a medida que chegan, itersize en cada viaxe, de xeito que a
+        memoria non depende do tamaño do resultado. A transacción remata ao
+        esgotar o xerador, polo que hai que consumilo antes de usar a
+        conexión para outra cousa
+        :return: xerador de filas
+        """
+        self.conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
+        try:
+            name = f"stream_{next(self._cursor_ids)}"
+            with self.conn.cursor(name=name, cursor_factory=TimedCursor) as cur:
+                cur.itersize = self.itersize
+                cur.execute(sentenza, params)
+                yield from cur
+            self.conn.commit()
+            self.tx_stats.commit()
+        except BaseException as e:
+            self.conn.rollback()
+            self.tx_stats.rollback(e)
+            raise
+
+    def _execute(self, cur, sentenza, params):
+        """
+        Executa a sentenza como sentenza preparada se a conexión ten caché
+        (ver StatementCache) ou directamente se non
+        """
+        statements = getattr(self.conn, 'statements', None)
+        if statements is None:
+            cur.execute(sentenza, params)
+        else:
+            statements.execute(cur, sentenza, params)
+
+    def _get(self, table, cls, sentenza, id):
+        """
+        Busca unha fila polo seu id pasando pola caché
+        :return: a dataclass cls ou None se non existe
+        """
+        if self.cache is not None:
+            found, value = self.cache.get(table, id)
+            if found:
+                return value
+        with self._transaction() as cur:
+            self._execute(cur, sentenza, {'id': id})
+            row = cur.fetchone()
+        value = None if row is None else from_row(cls, row)
+        if self.cache is not None and value is not None:
+            self.cache.put(table, id, value)
+        return value
+
+    def _get_many(self, table, cls, sentenza, sentenza_temp, ids, chunk_size=None):
+        """
+        Busca varias filas polo seu id pasando pola caché. Os ids que faltan
+        pídense nunha transacción, en consultas = any() de chunk_size ids ou,
+        se son moitos, copiándoos cun COPY a unha táboa temporal e facendo
+        un join (sentenza_temp)
+        :return: LookupResult
+        """
+        ids = list(dict.fromkeys(int(id) for id in ids))
+        chunk_size = chunk_size or self.many_chunk
+        found = {}
+        pending = []
+        for id in ids:
+            hit, value = self.cache.get(table, id) if self.cache is not None else (False, None)
+            if hit:
+                found[id] = value
+            else:
+                pending.append(id)
+        if pending:
+            with self._transaction() as cur:
+                if len(pending) > self.many_temp_threshold:
+                    cur.execute("create temp table if not exists _lookup_ids (id int primary key) on commit delete rows")
+                    cur.copy_expert("copy _lookup_ids (id) from stdin", io.StringIO("".join(f"{id}\n" for id in pending)))
+                    self._execute(cur, sentenza_temp, {})
+                    rows = cur.fetchall()
+                else:
+                    rows = []
+                    for i in range(0, len(pending), chunk_size):
+                        self._execute(cur, sentenza, {'ids': pending[i:i + chunk_size]})
+                        rows.extend(cur.fetchall())
+            for row in rows:
+                value = from_row(cls, row)
+                found[value.id] = value
+                if self.cache is not None:
+                    self.cache.put(table, value.id, value)
+        return LookupResult(found, [id for id in ids if id not in found])
+
+    def _invalidate(self, table, id=None):
+        """
+        Quita da caché a fila escrita (ou toda a táboa se id é None). Chámase
+        despois do commit para que ninguén volva cargar o valor vello
+        """
+        if self.cache is not None:
+            self.cache.invalidate(table, id)
+
+    def _retry(self, name, func, *args, **kwargs):
+        """
+        Executa a transacción func co TransactionRunner, se hai
+        """
+        if self.runner is None:
+            return func(*args, **kwargs)
+        return self.runner.run(name, func, *args, **kwargs)
+
+    def _page(self, sentenza, params, scope, keys, start, limit, token, require=None):
+        """
+        Unha páxina dun listado paxinado por clave (keyset): a sentenza
+        devolve as filas con clave maior que %(k_<columna>)s, ordenadas pola
+        clave, e como moito %(limit)s. Pídese unha fila de máis para saber
+        se hai outra páxina
+        :param scope: identifica o listado no token (ver encode_token)
+        :param keys: columnas da clave de orde, rematando nunha única
+        :param start: clave desde a que empeza a primeira páxina
+        :param limit: filas por páxina
+        :param token: token da páxina anterior ou None para a primeira
+        :param require: función(cur) que comproba os parámetros dentro da transacción
+        :return: Page
+        """
+        if limit < 1:
+            raise SgbdError("O tamaño de páxina ten que ser polo menos 1")
+        key = decode_token(token, scope) if token else start
+        if not isinstance(key, list) or len(key) != len(keys):
+            raise SgbdError("Token de continuación non válido")
+        params = dict(params, limit=limit + 1, **{f"k_{k}": v for k, v in zip(keys, key)})
+        with self._transaction() as cur:
+            if require is not None:
+                require(cur)
+            self._execute(cur, sentenza, params)
+            rows = cur.fetchall()
+        if len(rows) <= limit:
+            return Page(rows)
+        rows = rows[:limit]
+        return Page(rows, encode_token(scope, [rows[-1][k] for k in keys]))
+
+    def _exists(self, cur, sentenza, params):
+        self._execute(cur, sentenza, params)
+        return cur.rowcount > 0
+
+    def _require_empleado(self, cur, id, text=""):
+        if not self._exists(cur, EmpleadoRepo.SELECT_ID, {'id': id}):
+            raise NotFoundError(f"Non existe o empregado con id {id}{text}")
+
+    def _require_departamento(self, cur, id):
+        if not self._exists(cur, DepartamentoRepo.SELECT_ID, {'id': id}):
+            raise NotFoundError(f"Non existe o departamento con id {id}")
+
+    def _require_proyecto(self, cur, id):
+        if not self._exists(cur, ProyectoRepo.SELECT_ID, {'id': id}):
+            raise NotFoundError(f"Non existe o proxecto con id {id}")
+
+
+class EmpleadoRepo(Repo):
+    """
+    Acceso á táboa Empleado
+    """
+
+    SELECT_ID = """select id from empleado where id=%(id)s"""
+    SELECT = """select * from empleado where id=%(id)s"""
+    SELECT_MANY = """select * from empleado where id = any(%(ids)s::int[])"""
+    SELECT_MANY_TEMP = """select e.* from empleado e join _lookup_ids using (id)"""
+    SELECT_BY_SAL = """select id, nombre, salario from empleado where salario>%(salario)s"""
+    SELECT_DIRECTED_DEPTS = """select id, nombre from departamento where id_director=%(id)s"""
+    PAGE_BY_SAL = """
+        select id, nombre, salario from empleado
+        where (salario, id) > (%(k_salario)s, %(k_id)s)
+        order by salario, id limit %(limit)s
+    """
+    INSERT = """
+        insert into empleado(id, nombre, trabajo, fecha_contratacion, salario, comision, id_jefe, id_departamento)
+        values(%(id)s, %(nombre)s, %(trabajo)s, %(fecha_contratacion)s, %(salario)s, %(comision)s, %(id_jefe)s, %(id_departamento)s)
+    """
+    UPDATE_SAL = """
+        update empleado set salario = salario + salario * %(porc)s / 100 where id = %(id)s returning salario
+    """
+    UPDATE_COMM = """update empleado set comision = %(comm)s where id = %(id)s"""
+    # A versión é o xmin da fila: cambia con cada update, así que se non
+    # coincide alguén escribiu o empregado despois de lelo
+    SELECT_VERSION = """select *, xmin::text as version from empleado where id=%(id)s"""
+    UPDATE_SAL_VERSION = """
+        update empleado set salario = salario + salario * %(porc)s / 100
+        where id = %(id)s and xmin = %(version)s::xid returning salario
+    """
+    UPDATE_COMM_VERSION = """
+        update empleado set comision = %(comm)s where id = %(id)s and xmin = %(version)s::xid
+    """
+    DELETE = """delete from empleado where id=%(id)s"""
+
+    def get(self, id: int) -> Optional[Empleado]:
+        """
+        :return: o empregado co id indicado ou None se non existe
+        """
+        return self._get('empleado', Empleado, self.SELECT, id)
 
-    sentencia_update = "update empleado set comision = %(comm)s where id = %(id)s"
+    def get_many(self, ids, chunk_size: Optional[int] = None) -> LookupResult:
+        """
+        Busca varios empleados nunha viaxe ao servidor por cada chunk_size ids
+        :return: LookupResult cos empleados polo seu id e os ids que non existen
+        """
+        return self._get_many('empleado', Empleado, self.SELECT_MANY, self.SELECT_MANY_TEMP, ids, chunk_size)
+
+    def get_versioned(self, id: int) -> Optional[tuple]:
+        """
+        Le o empregado sen pasar pola caché xunto coa versión da fila, para
+        pasala despois a update_salario_by_percentage ou update_comision
+        :return: (Empleado, versión) ou None se non existe
+        """
+        with self._transaction() as cur:
+            self._execute(cur, self.SELECT_VERSION, {'id': id})
+            row = cur.fetchone()
+        if row is None:
+            return None
+        return from_row(Empleado, row), row['version']
+
+    def _versioned_update(self, cur, sentenza, params):
+        """
+        Executa un update condicionado á versión lida e distingue se o
+        empregado xa non existe ou se cambiou
+        """
+        self._execute(cur, sentenza, params)
+        if cur.rowcount == 0:
+            self._require_empleado(cur, params['id'])
+            raise ConflictError(f"O empregado con id {params['id']} cambiou despois de lelo")
+
+    def list_by_salario(self, salario: float) -> Iterator:
+        """
+        :return: xerador de filas (id, nombre, salario) dos empregados con
+        salario maior ao indicado
+        """
+        return self._stream(self.SELECT_BY_SAL, {'salario': salario})
+
+    def page_by_salario(self, salario: float, limit: int = 100, token: Optional[str] = None) -> Page:
+        """
+        Páxina dos empregados con salario maior ao indicado, ordenados por
+        salario e id
+        :param token: o da páxina anterior, ou None para a primeira
+        :return: Page con filas (id, nombre, salario)
+        """
+        # (salario, id) > (salario, máximo int) é o mesmo que salario > salario
+        return self._page(self.PAGE_BY_SAL, {}, f"empleado_salario:{float(salario)!r}",
+                          ['salario', 'id'], [float(salario), 2 ** 31 - 1], limit, token)
+
+    @retry_transaction
+    def insert(self, emp: Empleado) -> None:
+        """
+        Inserta o empregado comprobando que existan o seu xefe e departamento
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            if emp.id_jefe is not None:
+                self._require_empleado(cur, emp.id_jefe, " para engadir coma xefe")
+            if emp.id_departamento is not None:
+                self._require_departamento(cur, emp.id_departamento)
+            self._execute(cur, self.INSERT, asdict(emp))
+        self._invalidate('empleado', emp.id)
+
+    @retry_transaction
+    def update_salario_by_percentage(self, id: int, porcentaxe: float, version: Optional[str] = None) -> float:
+        """
+        Incrementa o salario do empregado nunha porcentaxe. Con version (a de
+        get_versioned) só se aplica se a fila non cambiou desde que se leu,
+        nunha transacción curta READ COMMITTED, e se cambiou lanza
+        ConflictError
+        :return: o novo salario
+        """
+        if version is not None:
+            with self._transaction() as cur:
+                self._versioned_update(cur, self.UPDATE_SAL_VERSION, {'id': id, 'porc': porcentaxe, 'version': version})
+                row = cur.fetchone()
+            self._invalidate('empleado', id)
+            return row['salario']
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.UPDATE_SAL, {'id': id, 'porc': porcentaxe})
+            row = cur.fetchone()
+            if row is None:
+                raise NotFoundError(f"Non existe o empregado con id {id}")
+        self._invalidate('empleado', id)
+        return row['salario']
+
+    @retry_transaction
+    def update_comision(self, id: int, comision: Optional[float], version: Optional[str] = None) -> None:
+        """
+        Cambia a comisión do empregado (None para quitala). Con version igual
+        que update_salario_by_percentage
+        """
+        if version is not None:
+            with self._transaction() as cur:
+                self._versioned_update(cur, self.UPDATE_COMM_VERSION, {'id': id, 'comm': comision, 'version': version})
+            self._invalidate('empleado', id)
+            return
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.UPDATE_COMM, {'id': id, 'comm': comision})
+            if cur.rowcount == 0:
+                raise NotFoundError(f"Non existe o empregado con id {id}")
+        self._invalidate('empleado', id)
+
+    @retry_transaction
+    def delete(self, id: int) -> int:
+        """
+        :return: número de filas eliminadas
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.DELETE, {'id': id})
+            n = cur.rowcount
+        # ON DELETE SET NULL cambia o id_jefe doutros empregados
+        self._invalidate('empleado')
+        return n
+
+    # Todo nunha sentenza e polo tanto nunha soa instantánea
+    SELECT_FICHA = """
+        select json_build_object(
+            'empleado', row_to_json(e),
+            'departamento', (select json_build_object('id', d.id, 'nombre', d.nombre, 'localidad', d.localidad)
+                             from departamento d where d.id = e.id_departamento),
+            'jefe', (select json_build_object('id', j.id, 'nombre', j.nombre, 'trabajo', j.trabajo)
+                     from empleado j where j.id = e.id_jefe),
+            'proyectos', coalesce((
+                select json_agg(json_build_object('id', p.id, 'nombre', p.nombre, 'localidad', p.localidad,
+                                                  'horas', ep.horas) order by p.id)
+                from EmpleadoProyecto ep join proyecto p on p.id = ep.id_proyecto
+                where ep.id_empleado = e.id), '[]'),
+            'horas', (select coalesce(sum(horas), 0) from EmpleadoProyecto where id_empleado = e.id),
+            'dirige', coalesce((
+                select json_agg(json_build_object('id', d.id, 'nombre', d.nombre) order by d.id)
+                from departamento d where d.id_director = e.id), '[]')
+        ) as ficha
+        from empleado e where e.id = %(id)s
+    """
+
+    def ficha(self, id: int) -> dict:
+        """
+        Todo o relativo a un empregado nunha soa consulta
+        :return: diccionario coas claves empleado, departamento, jefe (None
+        se non ten), proyectos (con horas), horas (o total) e dirige (os
+        departamentos que dirixe)
+        """
+        with self._transaction() as cur:
+            self._execute(cur, self.SELECT_FICHA, {'id': id})
+            row = cur.fetchone()
+        if row is None:
+            raise NotFoundError(f"Non existe o empregado con id {id}")
+        return row['ficha']
+
+    def directed_depts(self, id: int) -> list:
+        """
+        :return: filas (id, nombre) dos departamentos que dirixe o empregado
+        """
+        with self._transaction() as cur:
+            self._require_empleado(cur, id)
+            self._execute(cur, self.SELECT_DIRECTED_DEPTS, {'id': id})
+            return cur.fetchall()
+
+    # {column} é salario ou comision e {expr} o seu novo valor
+    BULK_UPDATE_CHUNK = """
+        with c as (
+            select id from empleado where {where} and id > %(ultimo)s order by id limit %(chunk)s
+        ),
+        upd as (
+            update empleado e set {column} = {expr}
+            from c where e.id = c.id and ({expr} is null or {expr} >= 0)
+            returning e.id
+        )
+        select (select max(id) from c) as ultimo,
+               (select count(*) from c) as seleccionados,
+               (select count(*) from upd) as actualizados,
+               (select json_agg(json_build_object('id', e.id, 'nombre', e.nombre,
+                                                  'actual', e.{column}, 'novo', {expr}) order by e.id)
+                from c join empleado e on e.id = c.id where {expr} < 0) as violacions
+    """
+    BULK_UPDATE_SUMMARY = """
+        select count(*) as seleccionados,
+               count(*) filter (where {expr} is null or {expr} >= 0) as actualizados,
+               sum({column}) filter (where {expr} is null or {expr} >= 0) as total_actual,
+               sum({expr}) filter (where {expr} is null or {expr} >= 0) as total_novo,
+               json_agg(json_build_object('id', id, 'nombre', nombre, 'actual', {column}, 'novo', {expr})
+                        order by id) filter (where {expr} < 0) as violacions
+        from empleado where {where}
+    """
+
+    def _bulk_update(self, column, expr, params, filtro, chunk_size, dry_run):
+        where, filter_params = filtro.where()
+        params = dict(params, **filter_params)
+        result = BulkResult()
+        if dry_run:
+            with self._transaction() as cur:
+                self._execute(cur, self.BULK_UPDATE_SUMMARY.format(column=column, expr=expr, where=where), params)
+                row = cur.fetchone()
+            return BulkResult(row['seleccionados'], row['actualizados'], row['total_actual'],
+                              row['total_novo'], row['violacions'] or [])
+
+        sentenza = self.BULK_UPDATE_CHUNK.format(column=column, expr=expr, where=where)
+
+        def update_chunk(ultimo):
+            with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+                self._execute(cur, sentenza, dict(params, ultimo=ultimo, chunk=chunk_size))
+                return cur.fetchone()
+
+        ultimo = -2 ** 31
+        while True:
+            # cada bloque é unha transacción que se repite por separado
+            row = self._retry(f"EmpleadoRepo.bulk_update_{column}", update_chunk, ultimo)
+            self._invalidate('empleado')
+            if row['ultimo'] is None:
+                return result
+            ultimo = row['ultimo']
+            result.seleccionados += row['seleccionados']
+            result.actualizados += row['actualizados']
+            result.violacions.extend(row['violacions'] or [])
+
+    def bulk_update_salario(self, filtro: EmpleadoFilter, porcentaxe: float,
+                            chunk_size: int = 1000, dry_run: bool = False) -> BulkResult:
+        """
+        Incrementa nunha porcentaxe o salario dos empregados do filtro, cunha
+        sentenza por bloque de chunk_size empregados (e un commit por bloque).
+        As filas que quedarían con salario negativo (ch_salario) non se
+        cambian e devólvense en violacions
+        :param dry_run: só calcula o resumo, sen cambiar nada
+        :return: BulkResult
+        """
+        return self._bulk_update('salario', "salario + salario * %(porc)s / 100", {'porc': porcentaxe},
+                                 filtro, chunk_size, dry_run)
+
+    def bulk_update_comision(self, filtro: EmpleadoFilter, comision: Optional[float],
+                             chunk_size: int = 1000, dry_run: bool = False) -> BulkResult:
+        """
+        Pon a comisión indicada (None para quitala) aos empregados do filtro.
+        Ver bulk_update_salario
+        :return: BulkResult
+        """
+        return self._bulk_update('comision', "%(comm)s::float", {'comm': comision},
+                                 filtro, chunk_size, dry_run)
+
+
+class DepartamentoRepo(Repo):
+    """
+    Acceso á táboa Departamento
+    """
+
+    SELECT_ID = """select id from departamento where id=%(id)s"""
+    SELECT = """select * from departamento where id=%(id)s"""
+    SELECT_MANY = """select * from departamento where id = any(%(ids)s::int[])"""
+    SELECT_MANY_TEMP = """select d.* from departamento d join _lookup_ids using (id)"""
+    SELECT_BY_LOC = """select id, nombre from departamento where localidad=%(localidade)s"""
+    PAGE_BY_LOC = """
+        select id, nombre from departamento
+        where localidad = %(localidade)s and id > %(k_id)s
+        order by id limit %(limit)s
+    """
+    INSERT = """
+        insert into departamento(id, nombre, localidad, id_director)
+        values(%(id)s, %(nombre)s, %(localidad)s, %(id_director)s)
+    """
+    UPDATE_DIRECTOR = """update departamento set id_director = %(id_emp)s where (id = %(id_dept)s)"""
+    # like con comodíns ós dous lados usa o índice de trigramas (ver BuscaRepo)
+    DELETE_BY_KEYWORD = """delete from departamento where nombre like %(pattern)s"""
+
+    def get(self, id: int) -> Optional[Departamento]:
+        """
+        :return: o departamento co id indicado ou None se non existe
+        """
+        return self._get('departamento', Departamento, self.SELECT, id)
+
+    def get_many(self, ids, chunk_size: Optional[int] = None) -> LookupResult:
+        """
+        Busca varios departamentos nunha viaxe ao servidor por cada chunk_size ids
+        :return: LookupResult cos departamentos polo seu id e os ids que non existen
+        """
+        return self._get_many('departamento', Departamento, self.SELECT_MANY, self.SELECT_MANY_TEMP, ids, chunk_size)
+
+    def list_by_localidad(self, localidade: str) -> Iterator:
+        """
+        :return: xerador de filas (id, nombre) dos departamentos da localidade
+        """
+        return self._stream(self.SELECT_BY_LOC, {'localidade': localidade})
+
+    def page_by_localidad(self, localidade: str, limit: int = 100, token: Optional[str] = None) -> Page:
+        """
+        Páxina dos departamentos da localidade, ordenados por id
+        :return: Page con filas (id, nombre)
+        """
+        return self._page(self.PAGE_BY_LOC, {'localidade': localidade}, f"departamento_localidad:{localidade}",
+                          ['id'], [-2 ** 31], limit, token)
+
+    @retry_transaction
+    def insert(self, dept: Departamento) -> None:
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.INSERT, asdict(dept))
+        self._invalidate('departamento', dept.id)
+
+    @retry_transaction
+    def update_director(self, id_dept: int, id_emp: int) -> None:
+        """
+        Pon ao empregado id_emp coma director do departamento id_dept
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._require_departamento(cur, id_dept)
+            self._require_empleado(cur, id_emp)
+            self._execute(cur, self.UPDATE_DIRECTOR, {'id_emp': id_emp, 'id_dept': id_dept})
+        self._invalidate('departamento', id_dept)
+
+    @retry_transaction
+    def delete_by_keyword(self, keyword: str) -> int:
+        """
+        Elimina os departamentos que conteñen keyword no seu nome
+        :return: número de filas eliminadas
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.DELETE_BY_KEYWORD, {'pattern': BuscaRepo.like_pattern(keyword)})
+            n = cur.rowcount
+        # ON DELETE SET NULL cambia o id_departamento dos seus empregados
+        self._invalidate('departamento')
+        self._invalidate('empleado')
+        return n
+
+
+class ProyectoRepo(Repo):
+    """
+    Acceso á táboa Proyecto
+    """
+
+    SELECT_ID = """select id from proyecto where id=%(id)s"""
+    SELECT = """select * from proyecto where id=%(id)s"""
+    SELECT_MANY = """select * from proyecto where id = any(%(ids)s::int[])"""
+    SELECT_MANY_TEMP = """select p.* from proyecto p join _lookup_ids using (id)"""
+    SELECT_BY_LOC = """select id, nombre from proyecto where localidad=%(localidade)s"""
+    PAGE_BY_LOC = """
+        select id, nombre from proyecto
+        where localidad = %(localidade)s and id > %(k_id)s
+        order by id limit %(limit)s
+    """
+    INSERT = """
+        insert into proyecto(id, nombre, localidad)
+        values(%(id)s, %(nombre)s, %(localidad)s)
+    """
+    DELETE_BY_LOC = """delete from proyecto where localidad like %(loc)s"""
+
+    def get(self, id: int) -> Optional[Proyecto]:
+        """
+        :return: o proxecto co id indicado ou None se non existe
+        """
+        return self._get('proyecto', Proyecto, self.SELECT, id)
+
+    def get_many(self, ids, chunk_size: Optional[int] = None) -> LookupResult:
+        """
+        Busca varios proyectos nunha viaxe ao servidor por cada chunk_size ids
+        :return: LookupResult cos proyectos polo seu id e os ids que non existen
+        """
+        return self._get_many('proyecto', Proyecto, self.SELECT_MANY, self.SELECT_MANY_TEMP, ids, chunk_size)
+
+    def list_by_localidad(self, localidade: str) -> Iterator:
+        """
+        :return: xerador de filas (id, nombre) dos proxectos da localidade
+        """
+        return self._stream(self.SELECT_BY_LOC, {'localidade': localidade})
+
+    def page_by_localidad(self, localidade: str, limit: int = 100, token: Optional[str] = None) -> Page:
+        """
+        Páxina dos proxectos da localidade, ordenados por id
+        :return: Page con filas (id, nombre)
+        """
+        return self._page(self.PAGE_BY_LOC, {'localidade': localidade}, f"proyecto_localidad:{localidade}",
+                          ['id'], [-2 ** 31], limit, token)
+
+    @retry_transaction
+    def insert(self, pro: Proyecto) -> None:
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.INSERT, asdict(pro))
+        self._invalidate('proyecto', pro.id)
+
+    @retry_transaction
+    def delete_by_localidad(self, localidade: str) -> int:
+        """
+        :return: número de filas eliminadas
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.DELETE_BY_LOC, {'loc': localidade})
+            n = cur.rowcount
+        self._invalidate('proyecto')
+        return n
+
+
+class EmpleadoProyectoRepo(Repo):
+    """
+    Acceso á relación EmpleadoProyecto. As escrituras resólvense nunha soa
+    sentenza que comproba e modifica á vez e devolve indicadores para
+    distinguir cada caso de erro (usan a clave primaria da migración 0001)
+    """
+
+    SELECT = """
+        select horas from EmpleadoProyecto where (id_empleado = %(emp_id)s) and (id_proyecto = %(pro_id)s)
+    """
+    SELECT_PROS_OF_EMP = """
+        select EmpleadoProyecto.id_proyecto, Proyecto.nombre, EmpleadoProyecto.horas from EmpleadoProyecto
+        left join proyecto on EmpleadoProyecto.id_proyecto=Proyecto.id
+        where EmpleadoProyecto.id_empleado=%(id)s
+    """
+    PAGE_PROS_OF_EMP = """
+        select ep.id_proyecto, p.nombre, ep.horas from EmpleadoProyecto ep
+        left join proyecto p on ep.id_proyecto = p.id
+        where ep.id_empleado = %(id)s and ep.id_proyecto > %(k_id_proyecto)s
+        order by ep.id_proyecto limit %(limit)s
+    """
+    SELECT_HORAS = """
+        select exists(select 1 from empleado where id = %(emp_id)s) as emp,
+               exists(select 1 from proyecto where id = %(pro_id)s) as pro,
+               (select horas from EmpleadoProyecto
+                where id_empleado = %(emp_id)s and id_proyecto = %(pro_id)s) as horas
+    """
+    INSERT = """
+        with e as (select id from empleado where id = %(emp_id)s),
+             p as (select id from proyecto where id = %(pro_id)s),
+             ins as (
+                insert into EmpleadoProyecto(id_empleado, id_proyecto, horas)
+                select e.id, p.id, 0 from e, p
+                on conflict (id_empleado, id_proyecto) do nothing
+                returning 1
+             )
+        select exists(select 1 from e) as emp, exists(select 1 from p) as pro,
+               exists(select 1 from ins) as done
+    """
+    UPDATE_HORAS = """
+        with e as (select id from empleado where id = %(emp_id)s),
+             p as (select id from proyecto where id = %(pro_id)s),
+             upd as (
+                update EmpleadoProyecto set horas = horas + %(horas)s
+                where (id_empleado = %(emp_id)s) and (id_proyecto = %(pro_id)s)
+                returning horas
+             )
+        select exists(select 1 from e) as emp, exists(select 1 from p) as pro,
+               (select horas from upd) as horas
+    """
+    REPLACE = """
+        with eo as (select id from empleado where id = %(emp_out_id)s),
+             ei as (select id from empleado where id = %(emp_in_id)s),
+             p as (select id from proyecto where id = %(pro_id)s),
+             ri as (select 1 from EmpleadoProyecto where id_empleado = %(emp_in_id)s and id_proyecto = %(pro_id)s),
+             del as (
+                delete from EmpleadoProyecto
+                where id_empleado = %(emp_out_id)s and id_proyecto = %(pro_id)s
+                  and exists(select 1 from ei) and not exists(select 1 from ri)
+                returning 1
+             ),
+             ins as (
+                insert into EmpleadoProyecto(id_empleado, id_proyecto, horas)
+                select %(emp_in_id)s, %(pro_id)s, 0 where exists(select 1 from del)
+                returning 1
+             )
+        select exists(select 1 from eo) as emp_out, exists(select 1 from ei) as emp_in,
+               exists(select 1 from p) as pro,
+               exists(select 1 from EmpleadoProyecto
+                      where id_empleado = %(emp_out_id)s and id_proyecto = %(pro_id)s) as rel_out,
+               exists(select 1 from ri) as rel_in, exists(select 1 from ins) as done
+    """
+
+    @staticmethod
+    def _check(row, emp_id, pro_id):
+        if not row['emp']:
+            raise NotFoundError(f"Non existe o empregado con id {emp_id}")
+        if not row['pro']:
+            raise NotFoundError(f"Non existe o proxecto con id {pro_id}")
+
+    @staticmethod
+    def _check_replace(row, emp_out_id, emp_in_id, pro_id):
+        if not row['emp_out']:
+            raise NotFoundError(f"Non existe o empregado con id {emp_out_id}")
+        if not row['emp_in']:
+            raise NotFoundError(f"Non existe o empregado con id {emp_in_id}")
+        if not row['pro']:
+            raise NotFoundError(f"Non existe o proxecto con id {pro_id}")
+        if not row['rel_out']:
+            raise NotFoundError(f"Non existe a relación entre empregado {emp_out_id} e proxecto {pro_id}")
+        if row['rel_in']:
+            raise AlreadyExistsError(f"Xa existe a relación entre empregado {emp_in_id} e proxecto {pro_id}")
+
+    def proyectos_de_empleado(self, emp_id: int) -> list:
+        """
+        :return: filas (id_proyecto, nombre, horas) dos proxectos do empregado
+        """
+        with self._transaction() as cur:
+            self._require_empleado(cur, emp_id)
+            self._execute(cur, self.SELECT_PROS_OF_EMP, {'id': emp_id})
+            return cur.fetchall()
+
+    def page_proyectos_de_empleado(self, emp_id: int, limit: int = 100, token: Optional[str] = None) -> Page:
+        """
+        Páxina dos proxectos do empregado, ordenados polo id do proxecto
+        :return: Page con filas (id_proyecto, nombre, horas)
+        """
+        return self._page(self.PAGE_PROS_OF_EMP, {'id': emp_id}, f"proyectos_de_empleado:{emp_id}",
+                          ['id_proyecto'], [-2 ** 31], limit, token,
+                          require=lambda cur: self._require_empleado(cur, emp_id))
+
+    def horas(self, emp_id: int, pro_id: int) -> int:
+        """
+        :return: as horas que leva o empregado no proxecto
+        """
+        with self._transaction() as cur:
+            self._execute(cur, self.SELECT_HORAS, {'emp_id': emp_id, 'pro_id': pro_id})
+            row = cur.fetchone()
+        self._check(row, emp_id, pro_id)
+        if row['horas'] is None:
+            raise NotFoundError(f"Non existe a relación entre empregado {emp_id} e proxecto {pro_id}")
+        return row['horas']
+
+    @retry_transaction
+    def insert(self, emp_id: int, pro_id: int) -> None:
+        """
+        Relaciona o empregado co proxecto con 0 horas
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.INSERT, {'emp_id': emp_id, 'pro_id': pro_id})
+            row = cur.fetchone()
+            self._check(row, emp_id, pro_id)
+            if not row['done']:
+                raise AlreadyExistsError("Xa existe esta relación")
+
+    @retry_transaction
+    def add_horas(self, emp_id: int, pro_id: int, horas: int) -> int:
+        """
+        Suma horas ás traballadas polo empregado no proxecto
+        :return: as horas resultantes
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.UPDATE_HORAS, {'horas': horas, 'emp_id': emp_id, 'pro_id': pro_id})
+            row = cur.fetchone()
+            self._check(row, emp_id, pro_id)
+            if row['horas'] is None:
+                raise NotFoundError(f"Non existe a relación entre empregado {emp_id} e proxecto {pro_id}")
+            return row['horas']
+
+    # Os deltas xa sumados por par chegan en tres arrays. Os pares cuxo
+    # empregado ou proxecto non existe ou que deixarían as horas en
+    # negativo non se escriben e devólvense co motivo en rexeitadas. As filas
+    # escríbense en orde de clave para que dous lotes á vez non se bloqueen
+    # en orde contraria
+    ACCUMULATE = """
+        with d as (
+            select * from unnest(%(emps)s::int[], %(pros)s::int[], %(horas)s::int[])
+                as d(id_empleado, id_proyecto, horas)
+        ),
+        ok as (
+            select d.* from d
+            join empleado e on e.id = d.id_empleado
+            join proyecto p on p.id = d.id_proyecto
+            left join EmpleadoProyecto ep using (id_empleado, id_proyecto)
+            where coalesce(ep.horas, 0) + d.horas >= 0
+        ),
+        ups as (
+            insert into EmpleadoProyecto(id_empleado, id_proyecto, horas)
+            select id_empleado, id_proyecto, horas from ok order by id_empleado, id_proyecto
+            on conflict (id_empleado, id_proyecto)
+                do update set horas = EmpleadoProyecto.horas + excluded.horas
+                where EmpleadoProyecto.horas + excluded.horas >= 0
+            returning id_empleado, id_proyecto
+        )
+        select (select count(*) from ups) as aplicadas,
+               (select json_agg(json_build_object(
+                           'emp_id', d.id_empleado, 'pro_id', d.id_proyecto, 'horas', d.horas,
+                           'motivo', case when e.id is null then 'empregado'
+                                          when p.id is null then 'proxecto'
+                                          else 'ch_horas' end)
+                       order by d.id_empleado, d.id_proyecto)
+                from d
+                left join ups using (id_empleado, id_proyecto)
+                left join empleado e on e.id = d.id_empleado
+                left join proyecto p on p.id = d.id_proyecto
+                where ups.id_empleado is null) as rexeitadas
+    """
+
+    @retry_transaction
+    def _accumulate(self, lote):
+        with self._transaction() as cur:
+            self._execute(cur, self.ACCUMULATE, {'emps': [k[0] for k in lote], 'pros': [k[1] for k in lote],
+                                                 'horas': list(lote.values())})
+            return cur.fetchone()
+
+    def accumulate_horas(self, deltas, batch_size: int = 10000) -> AccumulateResult:
+        """
+        Suma os deltas de horas (emp_id, pro_id, horas) ás relacións
+        EmpleadoProyecto, creándoas se non existen. En cada lote de
+        batch_size deltas súmanse primeiro en memoria os do mesmo par e
+        despois aplícanse todos cunha soa sentenza INSERT ... ON CONFLICT
+        DO UPDATE, sen ler antes as horas. Cada lote é unha transacción
+        :param deltas: iterable de tuplas (emp_id, pro_id, horas)
+        :return: AccumulateResult
+        """
+        result = AccumulateResult()
+        lote = {}
+
+        def flush():
+            row = self._accumulate(lote)
+            result.pares += len(lote)
+            result.aplicadas += row['aplicadas']
+            result.rexeitadas.extend(row['rexeitadas'] or [])
+            lote.clear()
+
+        for emp_id, pro_id, horas in deltas:
+            result.recibidas += 1
+            lote[(emp_id, pro_id)] = lote.get((emp_id, pro_id), 0) + horas
+            if result.recibidas % batch_size == 0:
+                flush()
+        if lote:
+            flush()
+        return result
+
+    @retry_transaction
+    def replace(self, emp_out_id: int, emp_in_id: int, pro_id: int) -> None:
+        """
+        Substitúe no proxecto ao empregado emp_out_id por emp_in_id (con 0 horas)
+        """
+        if emp_in_id == emp_out_id:
+            raise SgbdError("Un empregado no se pode sustituír a sí mesmo")
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.REPLACE, {'emp_out_id': emp_out_id, 'emp_in_id': emp_in_id, 'pro_id': pro_id})
+            self._check_replace(cur.fetchone(), emp_out_id, emp_in_id, pro_id)
+
+
+class DepartamentoProyectoRepo(Repo):
+    """
+    Acceso á relación DepartamentoProyecto
+    """
+
+    SELECT = """
+        select id_departamento from DepartamentoProyecto
+        where (id_departamento = %(dept_id)s) and (id_proyecto = %(pro_id)s)
+    """
+    SELECT_DEPTS_OF_PRO = """
+        select DepartamentoProyecto.id_departamento, Departamento.nombre from DepartamentoProyecto
+        left join departamento on DepartamentoProyecto.id_departamento=Departamento.id
+        where DepartamentoProyecto.id_proyecto=%(id)s
+    """
+    INSERT = """
+        with d as (select id from departamento where id = %(dept_id)s),
+             p as (select id from proyecto where id = %(pro_id)s),
+             ins as (
+                insert into DepartamentoProyecto(id_departamento, id_proyecto)
+                select d.id, p.id from d, p
+                on conflict (id_departamento, id_proyecto) do nothing
+                returning 1
+             )
+        select exists(select 1 from d) as dept, exists(select 1 from p) as pro,
+               exists(select 1 from ins) as done
+    """
+
+    def departamentos_de_proyecto(self, pro_id: int) -> list:
+        """
+        :return: filas (id_departamento, nombre) dos departamentos do proxecto
+        """
+        with self._transaction() as cur:
+            self._require_proyecto(cur, pro_id)
+            self._execute(cur, self.SELECT_DEPTS_OF_PRO, {'id': pro_id})
+            return cur.fetchall()
+
+    @retry_transaction
+    def insert(self, dept_id: int, pro_id: int) -> None:
+        """
+        Relaciona o departamento co proxecto
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            self._execute(cur, self.INSERT, {'dept_id': dept_id, 'pro_id': pro_id})
+            self._check(cur.fetchone(), dept_id, pro_id)
+
+    @staticmethod
+    def _check(row, dept_id, pro_id):
+        if not row['dept']:
+            raise NotFoundError(f"Non existe o departamento con id {dept_id}")
+        if not row['pro']:
+            raise NotFoundError(f"Non existe o proxecto con id {pro_id}")
+        if not row['done']:
+            raise AlreadyExistsError("Xa existe esta relación")
+
+
+class OrganigramaRepo(Repo):
+    """
+    Consultas sobre a xerarquía de Empleado.id_jefe: cadea de mando,
+    subordinados (directos e indirectos) e persoas e custo de cada
+    subárbore. Resólvense con CTE recursivas limitadas a max_depth niveis
+    que detectan os ciclos (CYCLE). Se existe a táboa de peche
+    EmpleadoXerarquia (ver enable_closure) úsase ela, que non percorre a
+    árbore nivel a nivel
+    """
+
+    MAX_DEPTH = 100
+
+    HAS_CLOSURE = """select to_regclass('empleadoxerarquia') is not null as closure"""
+    SELECT_CHAIN = """
+        with recursive cadea as (
+            select id, nombre, trabajo, id_jefe, 0 as nivel from empleado where id = %(id)s
+            union all
+            select e.id, e.nombre, e.trabajo, e.id_jefe, c.nivel + 1
+            from empleado e join cadea c on e.id = c.id_jefe
+            where c.nivel < %(max_depth)s
+        ) cycle id set ciclo using camino
+        select nivel, id, nombre, trabajo, ciclo from cadea where nivel > 0 order by nivel
+    """
+    SELECT_REPORTS = """
+        with recursive sub as (
+            select id, nombre, trabajo, id_jefe, 0 as nivel from empleado where id = %(id)s
+            union all
+            select e.id, e.nombre, e.trabajo, e.id_jefe, s.nivel + 1
+            from empleado e join sub s on e.id_jefe = s.id
+            where s.nivel < %(max_depth)s
+        ) search depth first by id set orde
+          cycle id set ciclo using camino
+        select nivel, id, nombre, trabajo, id_jefe from sub
+        where nivel > 0 and not ciclo order by orde
+    """
+    SELECT_SUBTREE_COST = """
+        with recursive sub as (
+            select id, salario, comision, 0 as nivel from empleado where id = %(id)s
+            union all
+            select e.id, e.salario, e.comision, s.nivel + 1
+            from empleado e join sub s on e.id_jefe = s.id
+            where s.nivel < %(max_depth)s
+        ) cycle id set ciclo using camino
+        select count(*) as persoas, sum(salario) as salario, coalesce(sum(comision), 0) as comision,
+               max(nivel) as profundidade
+        from sub where not ciclo
+    """
+    CLOSURE_CHAIN = """
+        select c.distancia as nivel, e.id, e.nombre, e.trabajo, false as ciclo
+        from EmpleadoXerarquia c join empleado e on e.id = c.id_superior
+        where c.id_empleado = %(id)s and c.distancia between 1 and %(max_depth)s
+        order by c.distancia
+    """
+    CLOSURE_REPORTS = """
+        select c.distancia as nivel, e.id, e.nombre, e.trabajo, e.id_jefe
+        from EmpleadoXerarquia c join empleado e on e.id = c.id_empleado
+        where c.id_superior = %(id)s and c.distancia between 1 and %(max_depth)s
+        order by c.distancia, e.id
+    """
+    CLOSURE_SUBTREE_COST = """
+        select count(*) as persoas, sum(e.salario) as salario, coalesce(sum(e.comision), 0) as comision,
+               max(c.distancia) as profundidade
+        from EmpleadoXerarquia c join empleado e on e.id = c.id_empleado
+        where c.id_superior = %(id)s and c.distancia <= %(max_depth)s
+    """
+
+    # Táboa de peche: unha fila por cada par (superior, empregado) da
+    # árbore, coa distancia entre eles (0 para o propio empregado). Os
+    # triggers mantéñena ao inserir empregados e ao cambiar id_jefe (movendo
+    # a subárbore enteira); os borrados e os cambios de id van polas claves
+    # foráneas. Mentres exista non se admiten ciclos en id_jefe
+    CLOSURE_DDL = """
+        create table EmpleadoXerarquia(
+            id_superior int not null references Empleado(id) on delete cascade on update cascade,
+            id_empleado int not null references Empleado(id) on delete cascade on update cascade,
+            distancia int not null,
+            constraint pk_empleadoxerarquia primary key (id_superior, id_empleado)
+        );
+        create index ix_empleadoxerarquia_empleado on EmpleadoXerarquia(id_empleado, distancia);
+
+        -- Por sentenza: nun insert de varias filas un subordinado pode vir
+        -- antes que o seu xefe, así que os camiños calcúlanse entre todas as
+        -- filas novas (x) e despois cólganse as subárbores novas dos
+        -- superiores que xa estaban na táboa
+        create or replace function sgbd_xerarquia_insert() returns trigger language plpgsql as $$
+        declare
+            en_ciclo int;
+        begin
+            with recursive x as (
+                select id, id_jefe from novas
+                union all
+                select x.id, n.id_jefe from x join novas n on n.id = x.id_jefe
+            ) cycle id_jefe set ciclo using camino
+            select min(id) into en_ciclo from x where ciclo;
+            if en_ciclo is not null then
+                raise exception 'O empregado % forma un ciclo na xerarquía', en_ciclo
+                    using errcode = 'check_violation';
+            end if;
+            insert into EmpleadoXerarquia
+                with recursive x as (
+                    select id as id_superior, id as id_empleado, 0 as distancia from novas
+                    union all
+                    select x.id_superior, n.id, x.distancia + 1
+                    from novas n join x on n.id_jefe = x.id_empleado
+                )
+                select id_superior, id_empleado, distancia from x
+                union all
+                select s.id_superior, x.id_empleado, s.distancia + x.distancia + 1
+                from x
+                join novas r on r.id = x.id_superior
+                join EmpleadoXerarquia s on s.id_empleado = r.id_jefe
+                where r.id_jefe not in (select id from novas);
+            return null;
+        end $$;
+
+        create or replace function sgbd_xerarquia_update() returns trigger language plpgsql as $$
+        begin
+            if new.id_jefe is not null and exists(
+                    select 1 from EmpleadoXerarquia where id_superior = new.id and id_empleado = new.id_jefe) then
+                raise exception 'O empregado % non pode ter coma xefe a % (ciclo na xerarquía)', new.id, new.id_jefe
+                    using errcode = 'check_violation';
+            end if;
+            -- sepárase a subárbore do empregado dos seus superiores antigos...
+            delete from EmpleadoXerarquia
+            where id_empleado in (select id_empleado from EmpleadoXerarquia where id_superior = new.id)
+              and id_superior in (select id_superior from EmpleadoXerarquia
+                                  where id_empleado = new.id and id_superior <> new.id);
+            -- ...e cólgase dos novos
+            if new.id_jefe is not null then
+                insert into EmpleadoXerarquia
+                    select s.id_superior, t.id_empleado, s.distancia + t.distancia + 1
+                    from EmpleadoXerarquia s, EmpleadoXerarquia t
+                    where s.id_empleado = new.id_jefe and t.id_superior = new.id;
+            end if;
+            return null;
+        end $$;
+
+        create trigger tr_empleado_xerarquia_ins after insert on Empleado
+            referencing new table as novas
+            for each statement execute function sgbd_xerarquia_insert();
+        create trigger tr_empleado_xerarquia_upd after update of id_jefe on Empleado
+            for each row when (old.id_jefe is distinct from new.id_jefe)
+            execute function sgbd_xerarquia_update();
+
+        insert into EmpleadoXerarquia
+            with recursive x as (
+                select id as id_superior, id as id_empleado, 0 as distancia from empleado
+                union all
+                select x.id_superior, e.id, x.distancia + 1
+                from empleado e join x on e.id_jefe = x.id_empleado
+            ) cycle id_empleado set ciclo using camino
+            select id_superior, id_empleado, distancia from x where not ciclo;
+        analyze EmpleadoXerarquia;
+    """
+    CLOSURE_DROP = """
+        drop trigger if exists tr_empleado_xerarquia_ins on Empleado;
+        drop trigger if exists tr_empleado_xerarquia_upd on Empleado;
+        drop function if exists sgbd_xerarquia_insert();
+        drop function if exists sgbd_xerarquia_update();
+        drop table if exists EmpleadoXerarquia;
+    """
+    FIND_CYCLE = """
+        with recursive x as (
+            select id, id_jefe from empleado
+            union all
+            select x.id, e.id_jefe from x join empleado e on e.id = x.id_jefe
+        ) cycle id_jefe set ciclo using camino
+        select min(id) as id from x where ciclo
+    """
+
+    def _has_closure(self, cur):
+        self._execute(cur, self.HAS_CLOSURE, {})
+        return cur.fetchone()['closure']
+
+    def cadea_de_mando(self, id: int, max_depth: int = MAX_DEPTH) -> list:
+        """
+        :return: filas (nivel, id, nombre, trabajo) dos xefes do empregado,
+        desde o directo (nivel 1) ata o máis alto
+        :raise CycleError: se subindo volve aparecer un empregado
+        """
+        with self._transaction() as cur:
+            self._require_empleado(cur, id)
+            sentenza = self.CLOSURE_CHAIN if self._has_closure(cur) else self.SELECT_CHAIN
+            self._execute(cur, sentenza, {'id': id, 'max_depth': max_depth})
+            rows = cur.fetchall()
+        for row in rows:
+            if row['ciclo']:
+                raise CycleError(f"Ciclo na xerarquía: o empregado {row['id']} volve aparecer na cadea de mando")
+        return rows
+
+    def subordinados(self, id: int, max_depth: int = MAX_DEPTH) -> list:
+        """
+        :return: filas (nivel, id, nombre, trabajo, id_jefe) de todos os
+        subordinados directos e indirectos ata max_depth niveis, en orde de
+        árbore (cada xefe antes dos seus subordinados). Sen a táboa de peche
+        as ramas con ciclos córtanse
+        """
+        with self._transaction() as cur:
+            self._require_empleado(cur, id)
+            sentenza = self.CLOSURE_REPORTS if self._has_closure(cur) else self.SELECT_REPORTS
+            self._execute(cur, sentenza, {'id': id, 'max_depth': max_depth})
+            return cur.fetchall()
+
+    def custo_subarbore(self, id: int, max_depth: int = MAX_DEPTH) -> dict:
+        """
+        :return: diccionario con persoas (o empregado e os seus
+        subordinados), salario e comision totais e profundidade da subárbore
+        """
+        with self._transaction() as cur:
+            self._require_empleado(cur, id)
+            sentenza = self.CLOSURE_SUBTREE_COST if self._has_closure(cur) else self.SELECT_SUBTREE_COST
+            self._execute(cur, sentenza, {'id': id, 'max_depth': max_depth})
+            return dict(cur.fetchone())
+
+    def enable_closure(self) -> None:
+        """
+        Crea e enche a táboa de peche e os triggers que a manteñen
+        :raise CycleError: se a xerarquía actual ten ciclos
+        """
+        with self._transaction(psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE) as cur:
+            if self._has_closure(cur):
+                raise AlreadyExistsError("A táboa de peche xa existe")
+            cur.execute("lock table empleado in share row exclusive mode")
+            cur.execute(self.FIND_CYCLE)
+            ciclo = cur.fetchone()['id']
+            if ciclo is not None:
+                raise CycleError(f"Ciclo na xerarquía desde o empregado {ciclo}")
+            cur.execute(self.CLOSURE_DDL)
+
+    def disable_closure(self) -> None:
+        with self._transaction() as cur:
+            cur.execute(self.CLOSURE_DROP)
+
+
+class InformeRepo(Repo):
+    """
+    Informes de horas e custo por proxecto, por departamento e por
+    empregado. Lense das vistas materializadas da migración 0004, que hai
+    que refrescar (refresh) para ver os últimos cambios
+    """
+
+    # orde de refresco: mv_informe_departamento lee de mv_informe_proyecto
+    VIEWS = ['mv_informe_proyecto', 'mv_informe_departamento', 'mv_informe_empleado']
+
+    REFRESH = """refresh materialized view {concurrently}{view}"""
+    # para QueryTimer.label
+    SQL_VARIANTS = {'REFRESH': [{'concurrently': c, 'view': v}
+                                for c, v in itertools.product(('', 'concurrently '), VIEWS)]}
+
+    SELECT_PROYECTOS = """
+        select id_proyecto, nombre, localidad, horas, empregados, round(custo::numeric, 2) as custo
+        from mv_informe_proyecto order by horas desc, id_proyecto limit %(limit)s
+    """
+    SELECT_CUSTO_PROYECTOS = """
+        select id_proyecto, nombre, localidad, horas, empregados, round(custo::numeric, 2) as custo
+        from mv_informe_proyecto order by custo desc, id_proyecto limit %(limit)s
+    """
+    SELECT_DEPARTAMENTOS = """
+        select id_departamento, nombre, localidad, proxectos, horas, round(custo::numeric, 2) as custo
+        from mv_informe_departamento order by horas desc, id_departamento limit %(limit)s
+    """
+    SELECT_TOP_EMPLEADOS = """
+        select id_empleado, nombre, id_departamento, horas, proxectos, round(custo::numeric, 2) as custo
+        from mv_informe_empleado order by horas desc, id_empleado limit %(limit)s
+    """
+
+    def _report(self, sentenza, limit):
+        with self._transaction() as cur:
+            self._execute(cur, sentenza, {'limit': limit})
+            return cur.fetchall()
+
+    def horas_por_proyecto(self, limit: Optional[int] = None) -> list:
+        """
+        :param limit: número de proxectos, None para todos
+        :return: filas (id_proyecto, nombre, localidad, horas, empregados,
+        custo) ordenadas por horas
+        """
+        return self._report(self.SELECT_PROYECTOS, limit)
+
+    def custo_por_proyecto(self, limit: Optional[int] = None) -> list:
+        """
+        :return: as mesmas filas que horas_por_proyecto ordenadas polo custo
+        (horas por salario/160 de cada empregado)
+        """
+        return self._report(self.SELECT_CUSTO_PROYECTOS, limit)
+
+    def horas_por_departamento(self, limit: Optional[int] = None) -> list:
+        """
+        :return: filas (id_departamento, nombre, localidad, proxectos, horas,
+        custo) cos totais dos proxectos de cada departamento
+        """
+        return self._report(self.SELECT_DEPARTAMENTOS, limit)
+
+    def top_empleados(self, n: int = 10) -> list:
+        """
+        :return: filas (id_empleado, nombre, id_departamento, horas,
+        proxectos, custo) dos n empregados con máis horas
+        """
+        return self._report(self.SELECT_TOP_EMPLEADOS, n)
+
+    def refresh(self, concurrently: bool = True) -> dict:
+        """
+        Refresca as vistas, cada unha na súa transacción. Con concurrently
+        as lecturas seguen vendo os datos anteriores mentres tanto
+        :return: diccionario vista -> segundos
+        """
+        tempos = {}
+        for view in self.VIEWS:
+            inicio = time.perf_counter()
+            with self._transaction() as cur:
+                cur.execute(self.REFRESH.format(concurrently='concurrently ' if concurrently else '', view=view))
+            tempos[view] = round(time.perf_counter() - inicio, 3)
+        return tempos
+
+
+class BuscaRepo(Repo):
+    """
+    Busca por nome en Departamento, Proyecto e Empleado con resultados
+    ordenados por relevancia. Hai tres modos:
+    - substring: o nome contén o texto (sen distinguir maiúsculas), primeiro
+      os nomes nos que o texto ocupa máis
+    - aprox: busca aproximada por trigramas (pg_trgm), que tolera erros
+      de escritura
+    - texto: texto completo por palabras, sen acentos se hai unaccent
+    Os índices créanse na migración 0005_busca.sql se o servidor ten as
+    extensións. Sen eles substring e texto funcionan igual pero
+    percorrendo a táboa
+    """
+
+    TABLES = ('departamento', 'proyecto', 'empleado')
+    MODES = ('substring', 'aprox', 'texto')
+
+    HAS_EXTENSIONS = """
+        select exists(select 1 from pg_extension where extname = 'pg_trgm') as trgm,
+               to_regprocedure('sgbd_unaccent(text)') is not null as unaccent
+    """
+    SEARCH_SUBSTRING = """
+        select id, nombre, length(%(texto)s)::float / length(nombre) as rank
+        from {table} where nombre ilike %(pattern)s
+        order by rank desc, id limit %(limit)s
+    """
+    SEARCH_APROX = """
+        select id, nombre, word_similarity(%(texto)s, nombre) as rank
+        from {table} where %(texto)s <%% nombre
+        order by rank desc, id limit %(limit)s
+    """
+    # a expresión do where ten que ser a mesma que a do índice
+    SEARCH_TEXTO = """
+        select id, nombre, ts_rank(to_tsvector('simple', {unaccent}(nombre)), q) as rank
+        from {table}, plainto_tsquery('simple', {unaccent}(%(texto)s)) q
+        where to_tsvector('simple', {unaccent}(nombre)) @@ q
+        order by rank desc, id limit %(limit)s
+    """
+    # para QueryTimer.label
+    SQL_VARIANTS = {
+        'SEARCH_SUBSTRING': [{'table': t} for t in TABLES],
+        'SEARCH_APROX': [{'table': t} for t in TABLES],
+        'SEARCH_TEXTO': [{'table': t, 'unaccent': u} for t, u in itertools.product(TABLES, ('sgbd_unaccent', ''))],
+    }
+
+    @staticmethod
+    def like_pattern(texto: str) -> str:
+        """
+        :return: patrón like que atopa texto en calquera parte, escapando
+        os comodíns % e _ que leve
+        """
+        return "%" + texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    def _extensions(self, cur):
+        self._execute(cur, self.HAS_EXTENSIONS, {})
+        return cur.fetchone()
+
+    def search(self, table: str, texto: str, mode: str = 'substring', limit: int = 20) -> list:
+        """
+        :param table: departamento, proyecto ou empleado
+        :param mode: substring, aprox ou texto (ver a clase)
+        :return: filas (id, nombre, rank) ordenadas por rank de maior a menor
+        """
+        if table not in self.TABLES:
+            raise SgbdError(f"Non se pode buscar en {table}")
+        if mode not in self.MODES:
+            raise SgbdError(f"Modo de busca descoñecido: {mode}")
+        if not texto:
+            raise SgbdError("O texto a buscar non pode estar baleiro")
+        with self._transaction() as cur:
+            if mode == 'substring':
+                sentenza = self.SEARCH_SUBSTRING.format(table=table)
+            else:
+                ext = self._extensions(cur)
+                if mode == 'aprox':
+                    if not ext['trgm']:
+                        raise SgbdError("A busca aproximada necesita a extensión pg_trgm no servidor")
+                    sentenza = self.SEARCH_APROX.format(table=table)
+                else:
+                    sentenza = self.SEARCH_TEXTO.format(table=table, unaccent='sgbd_unaccent' if ext['unaccent'] else '')
+            self._execute(cur, sentenza, {'texto': texto, 'pattern': self.like_pattern(texto), 'limit': limit})
+            return cur.fetchall()
+
+
+# nomes das táboas de BuscaRepo para o usuario
+SEARCH_TABLES = {'departamentos': 'departamento', 'proxectos': 'proyecto', 'empregados': 'empleado'}
+
+
+## IMPORTACIÓN-------------------------------------------------
+def parse_int(value):
+    return int(value)
+
+
+def parse_float(value):
+    return float(value)
+
+
+def parse_date(value):
+    return date.fromisoformat(str(value).replace('/', '-'))
+
+
+def parse_text(value):
+    return str(value)
+
+
+class ImportSpec:
+    """
+    Describe como se importa unha táboa: columnas co seu tipo, columnas
+    obrigatorias, columnas que non poden ser negativas (restricións ch_*),
+    claves foráneas a comprobar e columnas que se aplican nun paso posterior
+    (id_director, id_jefe) porque referencian filas aínda non cargadas
+    """
+
+    def __init__(self, table, columns, key, not_null=(), non_negative=(), fks=(), deferred=None):
+        """
+        :param table: nome da táboa
+        :param columns: pares (columna, función de conversión)
+        :param key: columnas que identifican a fila
+        :param not_null: columnas obrigatorias
+        :param non_negative: pares (columna, restrición) que deben ser >= 0
+        :param fks: pares (columna, táboa referenciada)
+        :param deferred: par (columna, táboa referenciada) que se aplica ao final
+        """
+        self.table = table
+        self.columns = columns
+        self.names = [c for c, _ in columns]
+        self.key = key
+        self.not_null = not_null
+        self.non_negative = non_negative
+        self.fks = fks
+        self.deferred = deferred
+
+    @property
+    def loaded_names(self):
+        """
+        Columnas que se cargan no primeiro paso
+        """
+        if self.deferred is None:
+            return self.names
+        return [c for c in self.names if c != self.deferred[0]]
+
+
+IMPORT_SPECS = {
+    'departamento': ImportSpec(
+        'departamento',
+        [('id', parse_int), ('nombre', parse_text), ('localidad', parse_text), ('id_director', parse_int)],
+        key=['id'], not_null=['id', 'nombre', 'localidad'],
+        deferred=('id_director', 'empleado')),
+    'empleado': ImportSpec(
+        'empleado',
+        [('id', parse_int), ('nombre', parse_text), ('trabajo', parse_text), ('fecha_contratacion', parse_date),
+         ('salario', parse_float), ('comision', parse_float), ('id_jefe', parse_int), ('id_departamento', parse_int)],
+        key=['id'], not_null=['id', 'nombre', 'trabajo', 'fecha_contratacion', 'salario'],
+        non_negative=[('salario', 'ch_salario'), ('comision', 'ch_comision')],
+        fks=[('id_departamento', 'departamento')],
+        deferred=('id_jefe', 'empleado')),
+    'proyecto': ImportSpec(
+        'proyecto',
+        [('id', parse_int), ('nombre', parse_text), ('localidad', parse_text)],
+        key=['id'], not_null=['id', 'nombre', 'localidad']),
+    'empleadoproyecto': ImportSpec(
+        'empleadoproyecto',
+        [('id_empleado', parse_int), ('id_proyecto', parse_int), ('horas', parse_int)],
+        key=['id_empleado', 'id_proyecto'], not_null=['id_empleado', 'id_proyecto', 'horas'],
+        non_negative=[('horas', 'ch_horas')],
+        fks=[('id_empleado', 'empleado'), ('id_proyecto', 'proyecto')]),
+    'departamentoproyecto': ImportSpec(
+        'departamentoproyecto',
+        [('id_departamento', parse_int), ('id_proyecto', parse_int)],
+        key=['id_departamento', 'id_proyecto'], not_null=['id_departamento', 'id_proyecto'],
+        fks=[('id_departamento', 'departamento'), ('id_proyecto', 'proyecto')]),
+}
+
+# Orde de carga: as táboas referenciadas primeiro. id_director e id_jefe
+# aplícanse despois de cargar Empleado
+IMPORT_ORDER = ['departamento', 'empleado', 'proyecto', 'empleadoproyecto', 'departamentoproyecto']
+
+
+def read_records(file):
+    """
+    Le un ficheiro CSV (con cabeceira) ou JSONL fila a fila
+    :param file: path do ficheiro
+    :return: xerador de pares (número de liña, diccionario)
+    """
+    with open(file, newline='', encoding='utf-8') as f:
+        if file.endswith('.jsonl') or file.endswith('.json'):
+            for n, line in enumerate(f, start=1):
+                if line.strip():
+                    yield n, json.loads(line)
+        else:
+            for n, record in enumerate(csv.DictReader(f), start=2):
+                yield n, record
+
+
+class Importer:
+    """
+    Carga masiva de ficheiros nas táboas da BD mediante COPY FROM STDIN.
+    Cada bloque de chunk_size filas cópiase a unha táboa temporal, quítanse
+    as filas que violan restricións ou claves foráneas (que van ao ficheiro
+    de rexeitadas) e o resto insértase na táboa cun commit por bloque
+    """
+
+    def __init__(self, conn, chunk_size=10000, rejects=None):
+        """
+        :param conn: a conexión aberta á bd
+        :param chunk_size: filas por bloque (e por commit)
+        :param rejects: ficheiro aberto onde escribir as filas rexeitadas
+        """
+        self.conn = conn
+        self.chunk_size = chunk_size
+        self.rejects = csv.writer(rejects) if rejects is not None else None
+        if self.rejects is not None:
+            self.rejects.writerow(['taboa', 'linha', 'motivo', 'fila'])
+        self.stats = {}
+
+    def _reject(self, table, linha, motivo, record):
+        self.stats[table]['rexeitadas'] += 1
+        if self.rejects is not None:
+            self.rejects.writerow([table, linha, motivo, json.dumps(record, default=str, ensure_ascii=False)])
+
+    def _parse(self, spec, linha, record):
+        """
+        Converte e valida unha fila do ficheiro
+        :return: diccionario de valores ou None se se rexeitou
+        """
+        values = {}
+        for column, parse in spec.columns:
+            raw = record.get(column)
+            if raw is None or raw == '':
+                values[column] = None
+                continue
+            try:
+                values[column] = parse(raw)
+            except (TypeError, ValueError):
+                self._reject(spec.table, linha, f"formato: {column}", record)
+                return None
+        for column in spec.not_null:
+            if values[column] is None:
+                self._reject(spec.table, linha, f"obrigatorio: {column}", record)
+                return None
+        for column, constraint in spec.non_negative:
+            if values[column] is not None and values[column] < 0:
+                self._reject(spec.table, linha, constraint, record)
+                return None
+        return values
+
+    def _create_stage(self, cur, spec):
+        cur.execute(f"create temp table if not exists _stage_{spec.table} "
+                    f"(like {spec.table}, _linha bigint) on commit delete rows")
+        if spec.deferred is not None:
+            column = spec.deferred[0]
+            cur.execute(f"create temp table if not exists _deferred_{spec.table} "
+                        f"(id int, {column} int, _linha bigint)")
+
+    @staticmethod
+    def _copy(cur, table, names, rows):
+        """
+        Copia as filas á táboa temporal nun só COPY FROM STDIN
+        """
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerows(rows)
+        buf.seek(0)
+        cur.copy_expert(f"copy {table} ({', '.join(names)}) from stdin with (format csv)", buf)
+
+    def _discard(self, cur, spec, motivo, condition):
+        """
+        Quita da táboa temporal as filas que cumpren a condición e rexéitaas
+        """
+        cur.execute(f"delete from _stage_{spec.table} s where {condition} returning s.*")
+        for row in cur.fetchall():
+            record = {c: row[c] for c in spec.names if c in row.keys()}
+            self._reject(spec.table, row['_linha'], motivo, record)
+
+    def _flush(self, cur, spec, chunk):
+        self._copy(cur, f"_stage_{spec.table}", spec.names + ['_linha'],
+                   ([values[c] for c in spec.names] + [linha] for linha, values in chunk))
+
+        key_match = " and ".join(f"t.{k} = s.{k}" for k in spec.key)
+        self._discard(cur, spec, "duplicada",
+                      f"exists (select 1 from {spec.table} t where {key_match})")
+        self._discard(cur, spec, "duplicada",
+                      f"exists (select 1 from _stage_{spec.table} t where {key_match} and t._linha < s._linha)")
+        for column, ref in spec.fks:
+            self._discard(cur, spec, f"fk: {column}",
+                          f"s.{column} is not null and not exists (select 1 from {ref} r where r.id = s.{column})")
+
+        loaded = ", ".join(spec.loaded_names)
+        cur.execute(f"insert into {spec.table} ({loaded}) select {loaded} from _stage_{spec.table}")
+        self.stats[spec.table]['importadas'] += cur.rowcount
+        if spec.deferred is not None:
+            column = spec.deferred[0]
+            cur.execute(f"insert into _deferred_{spec.table} (id, {column}, _linha) "
+                        f"select id, {column}, _linha from _stage_{spec.table} where {column} is not null")
+        self.conn.commit()
+
+    def load(self, table, file):
+        """
+        Carga un ficheiro na táboa indicada, en bloques de chunk_size filas
+        :param table: nome da táboa (ver IMPORT_SPECS)
+        :param file: path do ficheiro CSV ou JSONL
+        :return: Nada
+        """
+        spec = IMPORT_SPECS[table]
+        self.stats[table] = {'importadas': 0, 'rexeitadas': 0}
+        self.conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
+        with self.conn.cursor(cursor_factory=TimedCursor) as cur:
+            try:
+                self._create_stage(cur, spec)
+                self.conn.commit()
+                chunk = []
+                for linha, record in read_records(file):
+                    values = self._parse(spec, linha, record)
+                    if values is not None:
+                        chunk.append((linha, values))
+                    if len(chunk) >= self.chunk_size:
+                        self._flush(cur, spec, chunk)
+                        chunk = []
+                if chunk:
+                    self._flush(cur, spec, chunk)
+            except BaseException:
+                self.conn.rollback()
+                raise
+
+    def apply_deferred(self, table):
+        """
+        Aplica as columnas pospostas (id_director de Departamento, id_jefe
+        de Empleado) unha vez cargados os empregados. As referencias a
+        empregados inexistentes rexéitanse e a fila queda sen ese valor
+        :param table: departamento ou empleado
+        :return: Nada
+        """
+        spec = IMPORT_SPECS[table]
+        column, ref = spec.deferred
+        with self.conn.cursor(cursor_factory=TimedCursor) as cur:
+            try:
+                cur.execute(f"delete from _deferred_{table} s "
+                            f"where not exists (select 1 from {ref} r where r.id = s.{column}) "
+                            f"or not exists (select 1 from {table} t where t.id = s.id) returning s.*")
+                for row in cur.fetchall():
+                    self._reject(table, row['_linha'], f"fk: {column}", {'id': row['id'], column: row[column]})
+                cur.execute(f"update {table} t set {column} = s.{column} from _deferred_{table} s where t.id = s.id")
+                cur.execute(f"truncate _deferred_{table}")
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+
+
+def import_files(conn, files, chunk_size=10000, rejects=None):
+    """
+    Importa os ficheiros indicados na orde de dependencias:
+    Departamento → Empleado → id_director/id_jefe → Proyecto → relacións
+    :param conn: a conexión aberta á bd
+    :param files: diccionario táboa -> path do ficheiro
+    :param chunk_size: filas por bloque
+    :param rejects: ficheiro aberto para as filas rexeitadas
+    :return: estatísticas por táboa (importadas, rexeitadas)
+    """
+    importer = Importer(conn, chunk_size, rejects)
+    try:
+        for table in IMPORT_ORDER:
+            if files.get(table):
+                importer.load(table, files[table])
+            if table == 'empleado':
+                for deferred in ('departamento', 'empleado'):
+                    if files.get(deferred):
+                        importer.apply_deferred(deferred)
+    finally:
+        if Repo.cache is not None:
+            Repo.cache.clear()
+    return importer.stats
+
+
+## EXPORTACIÓN-------------------------------------------------
+# tipo de Arrow (Parquet) de cada columna segundo a función coa que se importa
+ARROW_TYPES = {parse_int: 'int32', parse_float: 'float64', parse_date: 'date32', parse_text: 'string'}
+
+EXPORT_FORMATS = ('csv', 'parquet')
+
+
+class Exporter:
+    """
+    Exporta as táboas da BD a CSV ou Parquet con COPY TO STDOUT. Cada
+    táboa vólcase nun fío cunha conexión propia, e todas as conexións usan
+    a mesma instantánea (pg_export_snapshot) dunha transacción REPEATABLE
+    READ, así o resultado é consistente aínda que se escriba na BD mentres.
+    Os datos pasan en bloques do COPY ao ficheiro, de xeito que a memoria
+    non depende do tamaño das táboas
+    """
+
+    def __init__(self, params, directory, formato='csv', workers=4, block_size=1 << 20):
+        """
+        :param params: parámetros de conexión de psycopg2
+        :param directory: directorio onde escribir <táboa>.csv ou <táboa>.parquet
+        :param formato: csv ou parquet (necesita pyarrow)
+        :param workers: táboas que se exportan á vez
+        :param block_size: bytes de CSV por lote de Parquet
+        """
+        if formato not in EXPORT_FORMATS:
+            raise SgbdError(f"Formato descoñecido: {formato}")
+        self.params = params
+        self.directory = directory
+        self.formato = formato
+        self.workers = workers
+        self.block_size = block_size
+
+    def _connect(self):
+        conn = psycopg2.connect(cursor_factory=TimedCursor, **self.params)
+        conn.autocommit = True
+        return conn
+
+    @staticmethod
+    def _copy_sql(spec):
+        columns = ', '.join(name for name, _ in spec.columns)
+        return (f"copy (select {columns} from {spec.table} order by {', '.join(spec.key)}) "
+                f"to stdout with (format csv, header true)")
+
+    def _dump_csv(self, cur, spec, path):
+        with open(path, 'wb') as f:
+            cur.copy_expert(self._copy_sql(spec), f)
+        return cur.rowcount
+
+    def _dump_parquet(self, cur, spec, path):
+        """
+        O COPY escribe nun pipe desde outro fío e Arrow le o CSV do outro
+        extremo por bloques, escribindo cada un coma un row group
+        """
+        import pyarrow
+        import pyarrow.csv
+        import pyarrow.parquet
+
+        schema = pyarrow.schema([(name, getattr(pyarrow, ARROW_TYPES[parse])())
+                                 for name, parse in spec.columns])
+        read_fd, write_fd = os.pipe()
+        copied = {}
+
+        def produce():
+            try:
+                with os.fdopen(write_fd, 'wb') as pipe:
+                    cur.copy_expert(self._copy_sql(spec), pipe)
+                copied['filas'] = cur.rowcount
+            except BaseException as e:
+                copied['erro'] = e
+
+        producer = threading.Thread(target=produce, name=f"sgbd-export-{spec.table}")
+        producer.start()
+        try:
+            with os.fdopen(read_fd, 'rb') as pipe:
+                reader = pyarrow.csv.open_csv(
+                    pipe, read_options=pyarrow.csv.ReadOptions(block_size=self.block_size),
+                    convert_options=pyarrow.csv.ConvertOptions(
+                        column_types=schema, null_values=[''], strings_can_be_null=True,
+                        quoted_strings_can_be_null=False))
+                with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+                    for batch in reader:
+                        writer.write_batch(batch)
+        finally:
+            producer.join()
+        if 'erro' in copied:
+            raise copied['erro']
+        return copied['filas']
+
+    def _dump(self, snapshot, table):
+        """
+        Exporta unha táboa na instantánea indicada
+        :return: diccionario con filas, bytes e segundos
+        """
+        spec = IMPORT_SPECS[table]
+        path = os.path.join(self.directory, f"{table}.{self.formato}")
+        inicio = time.perf_counter()
+        conn = self._connect()
+        try:
+            with conn.cursor() as cur, timed_operation('export'):
+                cur.execute("begin isolation level repeatable read read only")
+                cur.execute("set transaction snapshot %s", (snapshot,))
+                cur.execute("set local statement_timeout = 0")
+                if self.formato == 'csv':
+                    filas = self._dump_csv(cur, spec, path)
+                else:
+                    filas = self._dump_parquet(cur, spec, path)
+                cur.execute("commit")
+        finally:
+            conn.close()
+        return {'filas': filas, 'bytes': os.path.getsize(path),
+                'segundos': round(time.perf_counter() - inicio, 3)}
+
+    def export(self, tables=IMPORT_ORDER):
+        """
+        Exporta as táboas en paralelo
+        :return: diccionario táboa -> {filas, bytes, segundos}
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        coordinator = self._connect()
+        try:
+            with coordinator.cursor() as cur:
+                # a instantánea vale mentres esta transacción siga aberta
+                cur.execute("begin isolation level repeatable read read only")
+                cur.execute("select pg_export_snapshot()")
+                snapshot = cur.fetchone()[0]
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    futures = {table: executor.submit(self._dump, snapshot, table) for table in tables}
+                    stats = {table: future.result() for table, future in futures.items()}
+                cur.execute("commit")
+            return stats
+        finally:
+            coordinator.close()
+
+
+## MIGRACIÓNS--------------------------------------------------
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+
+class Migrator:
+    """
+    Aplica os scripts de migrations/ (NNNN_nome.sql) na orde do seu número.
+    As versións aplicadas gárdanse na táboa schema_version e cada script
+    execútase nunha transacción propia
+    """
+
+    CREATE_VERSION_TABLE = """
+        create table if not exists schema_version(
+            version int constraint pk_schema_version primary key,
+            nombre text not null,
+            aplicada timestamptz not null default now()
+        )
+    """
+    SELECT_VERSIONS = """select version from schema_version"""
+    INSERT_VERSION = """insert into schema_version(version, nombre) values(%(version)s, %(nombre)s)"""
+
+    # consultas representativas para comparar os plans antes e despois
+    EXPLAIN_QUERIES = [
+        ('get_emps_by_sal', EmpleadoRepo.SELECT_BY_SAL),
+        ('get_depts_by_loc', DepartamentoRepo.SELECT_BY_LOC),
+        ('get_pros_by_loc', ProyectoRepo.SELECT_BY_LOC),
+        ('get_pros_of_emp', EmpleadoProyectoRepo.SELECT_PROS_OF_EMP),
+        ('get_depts_of_pro', DepartamentoProyectoRepo.SELECT_DEPTS_OF_PRO),
+        ('get_directed_depts_by_id', EmpleadoRepo.SELECT_DIRECTED_DEPTS),
+        ('delete_emp_by_id (cascade)', """select 1 from EmpleadoProyecto where id_empleado=%(id)s"""),
+        ('delete_emp_by_id (id_jefe)', """select 1 from Empleado where id_jefe=%(id)s"""),
+        ('delete_pros_by_loc (cascade)', """select 1 from EmpleadoProyecto where id_proyecto=%(id)s"""),
+        ('delete_depts_by_keyword', """select 1 from departamento where nombre like %(pattern)s"""),
+    ]
+
+    def __init__(self, conn, directory=MIGRATIONS_DIR):
+        """
+        :param conn: a conexión aberta á bd
+        :param directory: directorio cos scripts de migración
+        """
+        self.conn = conn
+        self.directory = directory
+
+    def available(self):
+        """
+        :return: lista ordenada de (versión, nome, path) dos scripts
+        """
+        found = []
+        for file in os.listdir(self.directory):
+            match = re.match(r'^(\d+)_(.+)\.sql$', file)
+            if match:
+                found.append((int(match.group(1)), match.group(2), os.path.join(self.directory, file)))
+        return sorted(found)
+
+    def applied(self):
+        """
+        :return: conxunto das versións xa aplicadas
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(self.CREATE_VERSION_TABLE)
+            cur.execute(self.SELECT_VERSIONS)
+            versions = {row[0] for row in cur.fetchall()}
+        self.conn.commit()
+        return versions
+
+    def pending(self):
+        """
+        :return: lista de (versión, nome, path) aínda sen aplicar
+        """
+        applied = self.applied()
+        return [m for m in self.available() if m[0] not in applied]
+
+    def apply(self, version, nombre, path):
+        """
+        Executa un script de migración e rexistra a súa versión
+        """
+        with open(path, encoding='utf-8') as f:
+            sql = f.read()
+        self.conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
+        with self.conn.cursor() as cur:
+            try:
+                cur.execute(sql)
+                cur.execute(self.INSERT_VERSION, {'version': version, 'nombre': nombre})
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+
+    def explain(self):
+        """
+        Obtén os plans das consultas representativas, cuns valores tomados
+        da propia BD (un salario alto para que o rango sexa selectivo)
+        :return: diccionario nome da consulta -> plan
+        """
+        plans = {}
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                select (select percentile_disc(0.99) within group (order by salario) from empleado),
+                       (select localidad from departamento limit 1),
+                       (select id from empleado limit 1),
+                       (select nombre from departamento limit 1)
+            """)
+            salario, localidade, id, nome = cur.fetchone()
+            params = {'salario': salario or 0, 'localidade': localidade or '', 'id': id or 0,
+                      'pattern': BuscaRepo.like_pattern(nome or '')}
+            for name, sentenza in self.EXPLAIN_QUERIES:
+                cur.execute("explain " + sentenza, params)
+                plans[name] = "\n".join(row[0] for row in cur.fetchall())
+        self.conn.rollback()
+        return plans
+
+
+## LOTES-------------------------------------------------------
+def _row(row):
+    return None if row is None else asdict(row) if hasattr(row, '__dataclass_fields__') else dict(row)
+
+
+def _rows(rows):
+    return [dict(r) for r in rows]
+
+
+def _lookup(result):
+    return {'found': {id: asdict(v) for id, v in result.found.items()}, 'missing': result.missing}
+
+
+def _page(page):
+    return {'rows': _rows(page.rows), 'token': page.token}
+
+
+def _empleado(a):
+    return Empleado(a['id'], a['nombre'], a['trabajo'], parse_date(a['fecha_contratacion']), a['salario'],
+                    a.get('comision'), a.get('id_jefe'), a.get('id_departamento'))
+
+
+# operacións dos ficheiros de lotes: mesmos nomes que as funcións do menú,
+# cada unha recibe a conexión e o obxecto JSON da liña
+BATCH_OPS = {
+    'get_emp_by_id': lambda conn, a: _row(EmpleadoRepo(conn).get(a['id'])),
+    'get_dept_by_id': lambda conn, a: _row(DepartamentoRepo(conn).get(a['id'])),
+    'get_pro_by_id': lambda conn, a: _row(ProyectoRepo(conn).get(a['id'])),
+    'get_emps_by_ids': lambda conn, a: _lookup(EmpleadoRepo(conn).get_many(a['ids'])),
+    'get_depts_by_ids': lambda conn, a: _lookup(DepartamentoRepo(conn).get_many(a['ids'])),
+    'get_pros_by_ids': lambda conn, a: _lookup(ProyectoRepo(conn).get_many(a['ids'])),
+    'get_emp_profile': lambda conn, a: EmpleadoRepo(conn).ficha(a['id']),
+    'get_emps_by_sal': lambda conn, a: _rows(EmpleadoRepo(conn).list_by_salario(a['salario'])),
+    'get_depts_by_loc': lambda conn, a: _rows(DepartamentoRepo(conn).list_by_localidad(a['localidad'])),
+    'get_pros_by_loc': lambda conn, a: _rows(ProyectoRepo(conn).list_by_localidad(a['localidad'])),
+    'update_emp_sal_by_percentage':
+        lambda conn, a: EmpleadoRepo(conn).update_salario_by_percentage(a['id'], a['porcentaxe'], a.get('version')),
+    'update_emp_comm': lambda conn, a: EmpleadoRepo(conn).update_comision(a['id'], a.get('comision'), a.get('version')),
+    'insert_emp': lambda conn, a: EmpleadoRepo(conn).insert(_empleado(a)),
+    'insert_dept': lambda conn, a: DepartamentoRepo(conn).insert(
+        Departamento(a['id'], a['nombre'], a['localidad'], a.get('id_director'))),
+    'insert_pro': lambda conn, a: ProyectoRepo(conn).insert(Proyecto(a['id'], a['nombre'], a['localidad'])),
+    'delete_emp_by_id': lambda conn, a: EmpleadoRepo(conn).delete(a['id']),
+    'delete_depts_by_keyword': lambda conn, a: DepartamentoRepo(conn).delete_by_keyword(a['keyword']),
+    'delete_pros_by_loc': lambda conn, a: ProyectoRepo(conn).delete_by_localidad(a['localidad']),
+    'insert_rel_emp_pro': lambda conn, a: EmpleadoProyectoRepo(conn).insert(a['emp_id'], a['pro_id']),
+    'insert_rel_dept_pro': lambda conn, a: DepartamentoProyectoRepo(conn).insert(a['dept_id'], a['pro_id']),
+    'get_pros_of_emp': lambda conn, a: _rows(EmpleadoProyectoRepo(conn).proyectos_de_empleado(a['emp_id'])),
+    'get_depts_of_pro': lambda conn, a: _rows(DepartamentoProyectoRepo(conn).departamentos_de_proyecto(a['pro_id'])),
+    'update_hours_emppro':
+        lambda conn, a: EmpleadoProyectoRepo(conn).add_horas(a['emp_id'], a['pro_id'], a['horas']),
+    'update_reemplazar_emp_emppro':
+        lambda conn, a: EmpleadoProyectoRepo(conn).replace(a['emp_out_id'], a['emp_in_id'], a['pro_id']),
+    'page_emps_by_sal': lambda conn, a: _page(EmpleadoRepo(conn).page_by_salario(
+        a['salario'], a.get('limit', 100), a.get('token'))),
+    'page_depts_by_loc': lambda conn, a: _page(DepartamentoRepo(conn).page_by_localidad(
+        a['localidad'], a.get('limit', 100), a.get('token'))),
+    'page_pros_by_loc': lambda conn, a: _page(ProyectoRepo(conn).page_by_localidad(
+        a['localidad'], a.get('limit', 100), a.get('token'))),
+    'page_pros_of_emp': lambda conn, a: _page(EmpleadoProyectoRepo(conn).page_proyectos_de_empleado(
+        a['emp_id'], a.get('limit', 100), a.get('token'))),
+    'get_chain_of_command': lambda conn, a: _rows(OrganigramaRepo(conn).cadea_de_mando(
+        a['id'], a.get('max_depth', OrganigramaRepo.MAX_DEPTH))),
+    'get_reports': lambda conn, a: _rows(OrganigramaRepo(conn).subordinados(
+        a['id'], a.get('max_depth', OrganigramaRepo.MAX_DEPTH))),
+    'get_subtree_cost': lambda conn, a: OrganigramaRepo(conn).custo_subarbore(
+        a['id'], a.get('max_depth', OrganigramaRepo.MAX_DEPTH)),
+    'report_hours_by_project': lambda conn, a: _rows(InformeRepo(conn).horas_por_proyecto(a.get('limit'))),
+    'report_cost_by_project': lambda conn, a: _rows(InformeRepo(conn).custo_por_proyecto(a.get('limit'))),
+    'report_hours_by_dept': lambda conn, a: _rows(InformeRepo(conn).horas_por_departamento(a.get('limit'))),
+    'report_top_emps_by_hours': lambda conn, a: _rows(InformeRepo(conn).top_empleados(a.get('n', 10))),
+    'report_refresh': lambda conn, a: InformeRepo(conn).refresh(a.get('concurrently', True)),
+    'accumulate_hours': lambda conn, a: asdict(EmpleadoProyectoRepo(conn).accumulate_horas(
+        [tuple(d) for d in a['deltas']], a.get('batch_size', 10000))),
+    'search': lambda conn, a: _rows(BuscaRepo(conn).search(a['table'], a['texto'], a.get('mode', 'substring'),
+                                                           a.get('limit', 20))),
+    'get_directed_depts_by_id': lambda conn, a: _rows(EmpleadoRepo(conn).directed_depts(a['id'])),
+    'update_dept_director': lambda conn, a: DepartamentoRepo(conn).update_director(a['dept_id'], a['emp_id']),
+}
+
+
+def _json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} non se pode pasar a JSON")
+
+
+class BatchRunner:
+    """
+    Executa un ficheiro de operacións (unha liña JSON por operación, co
+    nome en "op") con varios fíos, cada un collendo conexións do pool.
+    As transaccións que fallan por serialization_failure ou
+    deadlock_detected repíteas o TransactionRunner dos repositorios.
+    Escribe unha liña JSON co resultado de cada operación
+    """
 
-    sentencia_select = """
-            select id, nombre, comision from empleado where id=%(id)s
-            """
+    def __init__(self, pool, workers=4):
+        """
+        :param pool: pool de conexións (ConnectionPool)
+        :param workers: operacións executándose á vez
+        """
+        self.pool = pool
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.stats = {'ok': 0, 'erros': 0, 'reintentos': 0, 'por_op': {}}
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    def _run_one(self, linha, record):
+        """
+        :return: diccionario co resultado da operación
+        """
+        op = record.get('op') if isinstance(record, dict) else None
+        if op is not None and not isinstance(op, str):
+            op = json.dumps(op)
+        result = {'linha': linha, 'op': op}
+        func = BATCH_OPS.get(op)
+        inicio = time.perf_counter()
+        runner = Repo.runner
+        intento = 0
         try:
-            cur.execute(sentencia_select, {'id': id})
-            row = cur.fetchone()
-            print(f"RESULTADO: [id: {row[0]}, nome: {row[1]}, nova comisión: {comm}]")
-            confirmacion = request_changes_confirmation()
-            if confirmacion:
-                cur.execute(sentencia_update, {'id': id, 'comm': comm})
-                conn.commit()
-                print(f"[✓] Comisión actualizada")
+            if not isinstance(record, dict):
+                raise SgbdError("A liña non é un obxecto JSON")
+            if 'json' in record:
+                raise SgbdError(f"Liña JSON incorrecta: {record['json']}")
+            if func is None:
+                raise SgbdError(f"Operación descoñecida: {op}")
+            if runner is not None:
+                runner.reset_attempts()
+            intento = 1
+            with self.pool.connection() as conn, timed_operation(op):
+                result['resultado'] = func(conn, record)
+            result['estado'] = 'ok'
+        except SgbdError as e:
+            result.update(estado='erro', erro=str(e))
+        except psycopg2.Error as e:
+            result.update(estado='erro', pgcode=e.pgcode, erro=(e.pgerror or str(e)).strip())
+        except (KeyError, TypeError, ValueError) as e:
+            result.update(estado='erro', erro=f"Argumentos incorrectos: {e!r}")
+        except PoolTimeout as e:
+            result.update(estado='erro', erro=str(e))
+        except Exception as e:
+            # calquera outro erro só falla esta liña, non o lote
+            result.update(estado='erro', erro=f"{type(e).__name__}: {e}")
+        if runner is not None and runner.attempts:
+            intento = runner.attempts
+        result['intentos'] = intento
+        result['ms'] = round((time.perf_counter() - inicio) * 1000, 3)
+
+        estado = 'ok' if result['estado'] == 'ok' else 'erros'
+        with self._lock:
+            self.stats[estado] += 1
+            self.stats['reintentos'] += max(intento - 1, 0)
+            self.stats['por_op'].setdefault(op, {'ok': 0, 'erros': 0})[estado] += 1
+        return result
+
+    def run(self, lines, out):
+        """
+        :param lines: iterable de liñas JSON
+        :param out: ficheiro onde escribir os resultados (JSONL)
+        :return: diccionario coas estatísticas, os segundos e as operacións por segundo
+        """
+        inicio = time.perf_counter()
+        # como moito 2 * workers operacións lidas e sen rematar, para que a
+        # memoria non dependa do tamaño do ficheiro
+        pending = threading.BoundedSemaphore(2 * self.workers)
+
+        def task(linha, record):
+            try:
+                result = self._run_one(linha, record)
+                with self._lock:
+                    out.write(json.dumps(result, ensure_ascii=False, default=_json_default) + '\n')
+            finally:
+                pending.release()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for linha, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = {'op': None, 'json': str(e)}
+                pending.acquire()
+                executor.submit(task, linha, record)
+        segundos = time.perf_counter() - inicio
+        total = self.stats['ok'] + self.stats['erros']
+        return dict(self.stats, total=total, segundos=round(segundos, 3),
+                    ops_por_segundo=round(total / segundos, 1) if segundos > 0 else None)
+
+
+## SAÍDA-------------------------------------------------------
+OUTPUT_FORMATS = ('table', 'csv', 'jsonl', 'tsv')
+
+
+class RowWriter:
+    """
+    Escribe os listados en formato table (unha liña "Fila N: [...]" para
+    ler), csv, jsonl ou tsv (para outras ferramentas), na saída estándar
+    ou nun ficheiro. Escríbese a través dun buffer grande que só se baleira
+    ao rematar cada listado, non en cada fila. Nos formatos csv e tsv a
+    primeira liña leva os nomes das columnas; no tsv os nulos son \\N e
+    escápanse tabuladores e saltos de liña coma no COPY de postgres
+    """
+
+    # o que usa print_rows, ver main
+    current = None
+
+    buffer_size = 1 << 20
+
+    TSV_SPECIAL = re.compile(r'[\\\t\n\r]')
+    TSV_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+    def __init__(self, formato='table', path=None):
+        """
+        :param formato: un de OUTPUT_FORMATS
+        :param path: ficheiro onde escribir, None para a saída estándar
+        """
+        if formato not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de saída descoñecido: {formato}")
+        self.formato = formato
+        self.path = path
+        # cóllese agora para seguir escribindo nela aínda que despois se
+        # mande o resto ao stderr (ver messages)
+        self._stdout = sys.stdout
+        self._file = None
+
+    def _open(self):
+        if self._file is None:
+            if self.path is not None:
+                self._file = open(self.path, 'w', buffering=self.buffer_size, encoding='utf-8', newline='')
             else:
-                conn.rollback()
+                try:
+                    self._file = open(self._stdout.fileno(), 'w', buffering=self.buffer_size,
+                                      encoding=self._stdout.encoding, newline='', closefd=False)
+                except (AttributeError, OSError, io.UnsupportedOperation):
+                    self._file = self._stdout
+        return self._file
+
+    def messages(self):
+        """
+        Se as filas van á saída estándar nun formato para outras
+        ferramentas, manda o resto do que se imprime ao stderr para que non
+        se mesture con elas
+        :return: context manager
+        """
+        if self.formato != 'table' and self.path is None:
+            return redirect_stdout(sys.stderr)
+        return nullcontext()
+
+    def _tsv(self, value):
+        if value is None:
+            return '\\N'
+        if isinstance(value, str):
+            return value.translate(self.TSV_ESCAPES) if self.TSV_SPECIAL.search(value) else value
+        return str(value)
+
+    def _write_rows(self, out, rows, fields):
+        columns = [col for col, _ in fields]
+        n = 0
+        if self.formato == 'table':
+            for n, row in enumerate(rows, start=1):
+                values = ", ".join(f"{label}: {row[col]}" for col, label in fields)
+                out.write(f"\tFila {n}: [{values}]\n")
+        elif self.formato == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(columns)
+            for n, row in enumerate(rows, start=1):
+                writer.writerow(['' if row[col] is None else row[col] for col in columns])
+        elif self.formato == 'tsv':
+            out.write("\t".join(columns) + "\n")
+            for n, row in enumerate(rows, start=1):
+                out.write("\t".join([self._tsv(row[col]) for col in columns]) + "\n")
+        else:
+            encode = json.JSONEncoder(default=_json_default, ensure_ascii=False).encode
+            for n, row in enumerate(rows, start=1):
+                out.write(encode({col: row[col] for col in columns}) + "\n")
+        out.flush()
+        return n
+
+    def write(self, rows, fields):
+        """
+        :param rows: filas (ou diccionarios) a escribir
+        :param fields: pares (columna, etiqueta) a escribir de cada fila
+        :return: número de filas escritas
+        """
+        self._stdout.flush()
+        out = self._open()
+        try:
+            return self._write_rows(out, rows, fields)
+        except BrokenPipeError:
+            self._broken_pipe(out)
+            if hasattr(rows, 'close'):
+                rows.close()
+            return 0
+
+    def write_document(self, document):
+        """
+        Escribe un documento JSON nunha liña, para as vistas que non son
+        unha soa táboa e polo tanto non caben en csv ou tsv (ver
+        get_emp_profile)
+        :param document: diccionario a escribir
+        """
+        self._stdout.flush()
+        out = self._open()
+        try:
+            out.write(json.dumps(document, default=_json_default, ensure_ascii=False) + "\n")
+            out.flush()
+        except BrokenPipeError:
+            self._broken_pipe(out)
+
+    @staticmethod
+    def _broken_pipe(out):
+        # quen le pechou a tubería (por exemplo head): o que quede no
+        # buffer vai a /dev/null para que ao pechar non volva fallar
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        try:
+            os.dup2(devnull, out.fileno())
+        finally:
+            os.close(devnull)
+
+    def close(self):
+        if self._file is not None and self._file is not self._stdout:
+            self._file.close()
+        self._file = None
+
+
+## REPL--------------------------------------------------------
+def print_pg_error(e):
+    print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
+
+
+def print_rows(rows, fields):
+    """
+    Imprime unha fila por liña co RowWriter actual (por defecto en formato
+    table na saída estándar) e devolve o número de filas impresas
+    :param rows: filas a imprimir
+    :param fields: pares (columna, etiqueta) a mostrar de cada fila
+    :return: número de filas
+    """
+    if RowWriter.current is None:
+        RowWriter.current = RowWriter()
+    return RowWriter.current.write(rows, fields)
+
+
+## ------------------------------------------------------------
+def get_emp_by_id(conn):
+    """
+    Pide por teclado ao usuario o id dalgún empleado
+    :param conn: a conexion aberta á bd
+    :return: o codigo do empleado se exsite (None se no existe)
+    """
+
+    id = request_id()
+    if id is None:
+        print(f"[✗] É obrigatorio especificar o id")
+        return None
+
+    try:
+        emp = EmpleadoRepo(conn).get(id)
+    except psycopg2.Error as e:
+        print_pg_error(e)
+        return None
+
+    if emp is None:
+        print(f"[✓] Non existe o empregado con id {id}")
+        return None
+
+    print(f"[✓] 1 empregado atopado:")
+    print(f"\tId: {emp.id}")
+    print(f"\tNome: {emp.nombre}")
+    print(f"\tTraballo: {emp.trabajo}")
+    print(f"\tData contratación: {emp.fecha_contratacion}")
+    print(f"\tSalario: {emp.salario}")
+    print(f"\tComision: {'-' if emp.comision is None else emp.comision}")
+    print(f"\tId xefe: {'-' if emp.id_jefe is None else emp.id_jefe}")
+    print(f"\tId departamento: {'-' if emp.id_departamento is None else emp.id_departamento}")
+    return emp.id
+
+
+## ------------------------------------------------------------
+def get_emp_profile(conn):
+    """
+    Pide por teclado ao usuario o id dalgún empleado
+    :param conn: a conexion aberta á bd
+    :return: Nada. Imprime o empregado co seu departamento, xefe, proxectos
+    e departamentos que dirixe
+    """
+
+    id = request_id()
+    if id is None:
+        print(f"[✗] É obrigatorio especificar o id")
+        return
+
+    try:
+        ficha = EmpleadoRepo(conn).ficha(id)
+    except SgbdError as e:
+        print(f"[✗] {e}")
+        return
+    except psycopg2.Error as e:
+        print_pg_error(e)
+        return
+
+    # a ficha son varias táboas: nos formatos para outras ferramentas vai
+    # enteira como un só documento JSON
+    if RowWriter.current is not None and RowWriter.current.formato != 'table':
+        RowWriter.current.write_document(ficha)
+        return
+
+    emp, dept, xefe = ficha['empleado'], ficha['departamento'], ficha['jefe']
+    print(f"[✓] Empregado {emp['id']}:")
+    print(f"\tNome: {emp['nombre']}")
+    print(f"\tTraballo: {emp['trabajo']}")
+    print(f"\tData contratación: {emp['fecha_contratacion']}")
+    print(f"\tSalario: {emp['salario']}")
+    print(f"\tComision: {'-' if emp['comision'] is None else emp['comision']}")
+    if xefe is not None:
+        print(f"\tXefe: {xefe['nombre']} ({xefe['id']})")
+    else:
+        print(f"\tXefe: -")
+    if dept is not None:
+        print(f"\tDepartamento: {dept['nombre']} ({dept['id']}, {dept['localidad']})")
+    else:
+        print(f"\tDepartamento: -")
+    print(f"\tProxectos ({ficha['horas']} horas):")
+    print_rows(ficha['proyectos'], [('id', 'id'), ('nombre', 'nome'), ('horas', 'horas')])
+    print(f"\tDirixe:")
+    print_rows(ficha['dirige'], [('id', 'id'), ('nombre', 'nome')])
+
+
+## ------------------------------------------------------------
+def get_dept_by_id(conn):
+    """
+    Pide por teclado ao usuario o id dalgún departamento
+    :param conn: a conexion aberta á bd
+    :return: o codigo do departamento se exsite (None se no existe)
+    """
+
+    id = request_id()
+    if id is None:
+        print(f"[✗] É obrigatorio especificar o id")
+        return None
+
+    try:
+        dept = DepartamentoRepo(conn).get(id)
+    except psycopg2.Error as e:
+        print_pg_error(e)
+        return None
+
+    if dept is None:
+        print(f"[✓] Non existe o departamento con id {id}")
+        return None
+
+    print(f"[✓] 1 departamento atopado:")
+    print(f"\tId: {dept.id}")
+    print(f"\tNome: {dept.nombre}")
+    print(f"\tLocalidade: {dept.localidad}")
+    return dept.id
+
+
+## ------------------------------------------------------------
+def get_pro_by_id(conn):
+    """
+    Pide por teclado ao usuario o id dalgún proxecto
+    :param conn: a conexion aberta á bd
+    :return: o codigo do proxecto se exsite (None se no existe)
+    """
+
+    id = request_id()
+    if id is None:
+        print(f"[✗] É obrigatorio especificar o id")
+        return None
+
+    try:
+        pro = ProyectoRepo(conn).get(id)
+    except psycopg2.Error as e:
+        print_pg_error(e)
+        return None
+
+    if pro is None:
+        print(f"[✓] Non existe o proxecto con id {id}")
+        return None
+
+    print(f"[✓] 1 proxecto atopado:")
+    print(f"\tId: {pro.id}")
+    print(f"\tNome: {pro.nombre}")
+    print(f"\tLocalidade: {pro.localidad}")
+    return pro.id
+
+
+## ------------------------------------------------------------
+def get_emps_by_sal(conn):
+    """
+    Pide por teclado ao usuario o salario dalgún empleado
+    :param conn: a conexión aberta á bd
+    :return: Nada. Imprime os detalles dos empleados que cumpren a restricción
+    de salario indicada
+    """
+
+    salario = request_salario()
+    if salario is None:
+        print(f"[✗] É obrigatorio especificar o salario")
+        return None
+
+    try:
+        rows = EmpleadoRepo(conn).list_by_salario(salario)
+        total = print_rows(rows, [('id', 'id'), ('nombre', 'nome'), ('salario', 'salario')])
+        print(f"[✓] Total de empregados: {total}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+def get_depts_by_loc(conn):
+    """
+    Pide por teclado ao usuario a localidade dalgún departamento
+    :param conn: a conexión aberta á bd
+    :return: Nada. Imprime os detalles dos departamentos que cumpren a restricción
+    de localidade indicada
+    """
+
+    localidade = request_localidade()
+    if localidade is None:
+        print(f"[✗] É obrigatorio especificar a localidade")
+        return None
+
+    try:
+        rows = DepartamentoRepo(conn).list_by_localidad(localidade)
+        total = print_rows(rows, [('id', 'id'), ('nombre', 'nome')])
+        print(f"[✓] Total de departamentos: {total}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+def get_pros_by_loc(conn):
+    """
+    Pide por teclado ao usuario a localidade dalgún proxecto
+    :param conn: a conexión aberta á bd
+    :return: Nada. Imprime os detalles dos proxectos que cumpren a restricción
+    de localidade indicada
+    """
+
+    localidade = request_localidade()
+    if localidade is None:
+        print(f"[✗] É obrigatorio especificar a localidade")
+        return None
+
+    try:
+        rows = ProyectoRepo(conn).list_by_localidad(localidade)
+        total = print_rows(rows, [('id', 'id'), ('nombre', 'nome')])
+        print(f"[✓] Total de proxectos: {total}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+def update_emp_sal_by_percentage(conn):
+    """
+    Pide por teclado ao usuario un porcentaxe para incrementar o salario
+    dun empleado
+    :param conn: a conexión aberta á bd
+    :return: Nada
+    """
+
+    id = get_emp_by_id(conn)
+    if id is None:
+        return
+
+    porcentaxeStr = input("Introduce unha porcentaxe de aumento de salario (float): ")
+    porcentaxe = float(porcentaxeStr)
+
+    repo = EmpleadoRepo(conn)
+    try:
+        # Non se mantén ningunha transacción aberta mentres se agarda a
+        # confirmación: se o empregado cambia entrementres vólvese preguntar
+        while True:
+            found = repo.get_versioned(id)
+            if found is None:
+                print(f"[✗] Non existe o empregado con id {id}")
+                return
+            emp, version = found
+            print(f"RESULTADO: [id: {emp.id}, nome: {emp.nombre}, novo salario: {emp.salario + emp.salario * porcentaxe / 100}]")
+            if not request_changes_confirmation():
                 print(f"[✗] Actualización cancelada polo usuario")
+                return
+            try:
+                repo.update_salario_by_percentage(id, porcentaxe, version)
+                break
+            except ConflictError:
+                print(f"[✗] O empregado cambiou mentres se confirmaba, volve confirmar cos datos actuais")
+        print(f"[✓] Salario actualizado")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.CHECK_VIOLATION:
+            print("[✗]ERRO: O salario debe ser positivo")
+        else:
+            print(f"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
-        except psycopg2.Error as e:
-            if e.pgcode == psycopg2.errorcodes.CHECK_VIOLATION:
-                print("[✗]ERRO: A comisión debe ser positiva")
-            else:
-                print(f"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+
+## ------------------------------------------------------------
+def update_emp_comm(conn):
+    """
+    Pide por teclado ao usuario unha nova comisión para cambiarsela
+    ao usuario
+    :param conn: a conexión aberta á bd
+    :return: Nada
+    """
+
+    id = get_emp_by_id(conn)
+    if id is None:
+        return
+
+    commStr = input("Introduce a nova comisión (float): ")
+    if commStr == '':
+        comm = None
+    else:
+        comm = float(commStr)
+
+    repo = EmpleadoRepo(conn)
+    try:
+        while True:
+            found = repo.get_versioned(id)
+            if found is None:
+                print(f"[✗] Non existe o empregado con id {id}")
+                return
+            emp, version = found
+            print(f"RESULTADO: [id: {emp.id}, nome: {emp.nombre}, comisión: {emp.comision}, nova comisión: {comm}]")
+            if not request_changes_confirmation():
+                print(f"[✗] Actualización cancelada polo usuario")
+                return
+            try:
+                repo.update_comision(id, comm, version)
+                break
+            except ConflictError:
+                print(f"[✗] O empregado cambiou mentres se confirmaba, volve confirmar cos datos actuais")
+        print(f"[✓] Comisión actualizada")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.CHECK_VIOLATION:
+            print("[✗]ERRO: A comisión debe ser positiva")
+        else:
+            print(f"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -527,8 +4005,6 @@ def insert_emp(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     id = request_id()
     if id is None:
         print(f"[✗] É obrigatorio especificar o id")
@@ -541,62 +4017,28 @@ def insert_emp(conn):
     if traballo is None:
         print(f"[✗] É obrigatorio especificar o traballo")
         return None
-
-    now = datetime.now()
-    data_contratacion = now.strftime("%Y/%m/%d")
-
     salario = request_salario()
     if salario is None:
-        print(f"[✗] É obrigatorio especificar o id")
+        print(f"[✗] É obrigatorio especificar o salario")
         return None
     comision = request_comision()
     id_xefe = request_id_of("do xefe")
     id_departamento = request_id_of("do departamento")
 
-    sentenza_select_xefe = """
-            select id from empleado where (id = %(id_xefe)s)
-        """
-
-    sentenza_select_departamento = """
-            select id from departamento where (id = %(id_departamento)s)
-        """
-
-    sentenza_insert = """
-        insert into empleado(id, nombre, trabajo, fecha_contratacion, salario, comision, id_jefe, id_departamento)
-        values(%(id)s, %(nome)s, %(traballo)s, %(data_contratacion)s, %(salario)s, %(comision)s, %(id_xefe)s, %(id_departamento)s)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if id_xefe is not None:
-                cur.execute(sentenza_select_xefe, {'id_xefe': id_xefe})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o empregado con id " + str(id_xefe) + " para engadir coma xefe")
-                    return None
-            if id_departamento is not None:
-                cur.execute(sentenza_select_departamento, {'id_departamento': id_departamento})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o departamento con id " + str(id_departamento))
-                    return None
-
-            cur.execute(sentenza_insert,
-                        {'id': id, 'nome': nome, 'traballo': traballo, 'data_contratacion': data_contratacion,
-                         'salario': salario, 'comision': comision, 'id_xefe': id_xefe,
-                         'id_departamento': id_departamento})
-
-            conn.commit()
-            print(f"[✓] Empregado insertado")
-
-        except psycopg2.Error as e:
-            if e.pgcode == psycopg2.errorcodes.CHECK_VIOLATION:
-                print(f"[✗] O salario e a comisión deben ser positivos")
-            elif e.pgcode == psycopg2.errorcodes.UNIQUE_VIOLATION:
-                print(f"[✗] Xa existe un empregado co id " + str(id))
-            else:
-                print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+    emp = Empleado(id=id, nombre=nome, trabajo=traballo, fecha_contratacion=datetime.now().date(),
+                   salario=salario, comision=comision, id_jefe=id_xefe, id_departamento=id_departamento)
+    try:
+        EmpleadoRepo(conn).insert(emp)
+        print(f"[✓] Empregado insertado")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.CHECK_VIOLATION:
+            print(f"[✗] O salario e a comisión deben ser positivos")
+        elif e.pgcode == psycopg2.errorcodes.UNIQUE_VIOLATION:
+            print(f"[✗] Xa existe un empregado co id " + str(id))
+        else:
+            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -607,8 +4049,6 @@ def insert_dept(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     id = request_id()
     if id is None:
         print(f"[✗] É obrigatorio especificar o id")
@@ -622,23 +4062,14 @@ def insert_dept(conn):
         print(f"[✗] É obrigatorio especificar a localidade")
         return None
 
-    sentenza_insert = """
-        insert into departamento(id, nombre, localidad)
-        values(%(id)s, %(nome)s, %(localidade)s)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentenza_insert, {'id': id, 'nome': nome, 'localidade': localidade})
-            conn.commit()
-            print(f"[✓] Departamento insertado")
-
-        except psycopg2.Error as e:
-            if e.pgcode == psycopg2.errorcodes.UNIQUE_VIOLATION:
-                print(f"[✗] Xa existe un departamento co id " + str(id))
-            else:
-                print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+    try:
+        DepartamentoRepo(conn).insert(Departamento(id=id, nombre=nome, localidad=localidade))
+        print(f"[✓] Departamento insertado")
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.UNIQUE_VIOLATION:
+            print(f"[✗] Xa existe un departamento co id " + str(id))
+        else:
+            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -649,8 +4080,6 @@ def insert_pro(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     id = request_id()
     if id is None:
         print(f"[✗] É obrigatorio especificar o id")
@@ -664,23 +4093,14 @@ def insert_pro(conn):
         print(f"[✗] É obrigatorio especificar a localidade")
         return None
 
-    sentenza_insert = """
-        insert into proyecto(id, nombre, localidad)
-        values(%(id)s, %(nome)s, %(localidade)s)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentenza_insert, {'id': id, 'nome': nome, 'localidade': localidade})
-            conn.commit()
-            print(f"[✓] Proxecto insertado")
-
-        except psycopg2.Error as e:
-            if e.pgcode == psycopg2.errorcodes.UNIQUE_VIOLATION:
-                print(f"[✗] Xa existe un proxecto co id " + str(id))
-            else:
-                print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+    try:
+        ProyectoRepo(conn).insert(Proyecto(id=id, nombre=nome, localidad=localidade))
+        print(f"[✓] Proxecto insertado")
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.UNIQUE_VIOLATION:
+            print(f"[✗] Xa existe un proxecto co id " + str(id))
+        else:
+            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -691,57 +4111,39 @@ def delete_emp_by_id(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     id = request_id()
     if id is None:
         print(f"[✗] É obrigatorio especificar o id")
         return
 
-    sentencia_delete = """
-        delete from empleado where id=%(id)s
-        """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_delete, {'id': id})
-            conn.commit()
-            print(f"[✓] {cur.rowcount} fila(s) eliminadas")
-        except psycopg2.Error as e:
-            if e.pgcode == psycopg2.errorcodes.FOREIGN_KEY_VIOLATION:
-                print(f"[✗] Non se pode eliminar ao empregado {id} porque é director dalgún departamento")
-            else:
-                print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+    try:
+        n = EmpleadoRepo(conn).delete(id)
+        print(f"[✓] {n} fila(s) eliminadas")
+    except psycopg2.Error as e:
+        if e.pgcode == psycopg2.errorcodes.FOREIGN_KEY_VIOLATION:
+            print(f"[✗] Non se pode eliminar ao empregado {id} porque é director dalgún departamento")
+        else:
+            print_pg_error(e)
 
 
 ## ------------------------------------------------------------
 def delete_depts_by_keyword(conn):
     """
-    Elimina unha fila na táboa departamento polo seu id
+    Elimina as filas da táboa departamento que conteñen a palabra clave no nome
     :param conn: a conexión aberta á bd
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     keyword = request_keyword()
     if keyword is None:
         print(f"[✗] É obrigatorio especificar a palabra clave")
         return
 
-    sentencia_delete = """
-            delete from departamento where nombre like %(keyword)s
-            """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_delete, {'keyword': "%" + keyword + "%"})
-            conn.commit()
-            print(f"[✓] {cur.rowcount} fila(s) eliminadas")
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+    try:
+        n = DepartamentoRepo(conn).delete_by_keyword(keyword)
+        print(f"[✓] {n} fila(s) eliminadas")
+    except psycopg2.Error as e:
+        print_pg_error(e)
 
 
 ## ------------------------------------------------------------
@@ -752,25 +4154,16 @@ def delete_pros_by_loc(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     loc = request_localidade()
     if loc is None:
         print(f"[✗] É obrigatorio especificar a localidade")
         return
 
-    sentencia_delete = """
-        delete from proyecto where localidad like %(loc)s
-        """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            cur.execute(sentencia_delete, {'loc': loc})
-            conn.commit()
-            print(f"[✓] {cur.rowcount} fila(s) eliminadas")
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
+    try:
+        n = ProyectoRepo(conn).delete_by_localidad(loc)
+        print(f"[✓] {n} fila(s) eliminadas")
+    except psycopg2.Error as e:
+        print_pg_error(e)
 
 
 ## ------------------------------------------------------------
@@ -782,8 +4175,6 @@ def insert_rel_emp_pro(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     emp_id = request_id_of("do empregado")
     if emp_id is None:
         print(f"[✗] É obrigatorio especificar o id do empregado")
@@ -793,52 +4184,13 @@ def insert_rel_emp_pro(conn):
         print(f"[✗] É obrigatorio especificar o id do proxecto")
         return None
 
-    sentenza_select_emppro = """
-                select id_empleado from EmpleadoProyecto where (id_empleado = %(emp_id)s) and (id_proyecto = %(pro_id)s)
-            """
-
-    sentenza_select_empregado = """
-            select id from empleado where (id = %(emp_id)s)
-        """
-
-    sentenza_select_proxecto = """
-            select id from proyecto where (id = %(pro_id)s)
-        """
-
-    sentenza_insert = """
-        insert into EmpleadoProyecto(id_empleado, id_proyecto, horas)
-        values(%(emp_id)s, %(pro_id)s, 0)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if emp_id is not None:
-                cur.execute(sentenza_select_empregado, {'emp_id': emp_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o empregado con id " + str(emp_id))
-                    return None
-            if pro_id is not None:
-                cur.execute(sentenza_select_proxecto, {'pro_id': pro_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o proxecto con id " + str(pro_id))
-                    return None
-
-            cur.execute(sentenza_select_emppro, {'emp_id': emp_id, 'pro_id': pro_id})
-            if cur.rowcount > 0:
-                conn.rollback()
-                print(f"[✗] Xa existe esta relación")
-                return None
-
-            cur.execute(sentenza_insert, {'emp_id': emp_id, 'pro_id': pro_id})
-
-            conn.commit()
-            print(f"[✓] Relación creada")
-
-        except psycopg2.Error as e:
-            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+    try:
+        EmpleadoProyectoRepo(conn).insert(emp_id, pro_id)
+        print(f"[✓] Relación creada")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -850,8 +4202,6 @@ def insert_rel_dept_pro(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     dept_id = request_id_of("do departamento")
     if dept_id is None:
         print(f"[✗] É obrigatorio especificar o id do departamento")
@@ -861,52 +4211,13 @@ def insert_rel_dept_pro(conn):
         print(f"[✗] É obrigatorio especificar o id do proxecto")
         return None
 
-    sentenza_select_deptpro = """
-                select id_departamento from DepartamentoProyecto where (id_departamento = %(dept_id)s) and (id_proyecto = %(pro_id)s)
-            """
-
-    sentenza_select_departamento = """
-            select id from departamento where (id = %(dept_id)s)
-        """
-
-    sentenza_select_proxecto = """
-            select id from proyecto where (id = %(pro_id)s)
-        """
-
-    sentenza_insert = """
-        insert into DepartamentoProyecto(id_departamento, id_proyecto)
-        values(%(dept_id)s, %(pro_id)s)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if dept_id is not None:
-                cur.execute(sentenza_select_departamento, {'dept_id': dept_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o departamento con id " + str(dept_id))
-                    return None
-            if pro_id is not None:
-                cur.execute(sentenza_select_proxecto, {'pro_id': pro_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o proxecto con id " + str(pro_id))
-                    return None
-
-            cur.execute(sentenza_select_deptpro, {'dept_id': dept_id, 'pro_id': pro_id})
-            if cur.rowcount > 0:
-                conn.rollback()
-                print(f"[✗] Xa existe esta relación")
-                return None
-
-            cur.execute(sentenza_insert, {'dept_id': dept_id, 'pro_id': pro_id})
-
-            conn.commit()
-            print(f"[✓] Relación creada")
-
-        except psycopg2.Error as e:
-            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+    try:
+        DepartamentoProyectoRepo(conn).insert(dept_id, pro_id)
+        print(f"[✓] Relación creada")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -914,46 +4225,22 @@ def get_pros_of_emp(conn):
     """
     Pide por teclado o id de empregado
     :param conn: a conexion aberta á bd
-    :return: Proxectos no que traballa o empleado (None se no existe)
+    :return: Nada. Imprime os proxectos no que traballa o empleado
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
-
     id = request_id_of("do empregado")
     if id is None:
         print(f"[✗] É obrigatorio especificar o id do empregado")
         return None
 
-    sentenza_select_empregado = """
-            select id from empleado where (id = %(id)s)
-        """
-
-    sentenza_select_principal = """select EmpleadoProyecto.id_proyecto, Proyecto.nombre, EmpleadoProyecto.horas from EmpleadoProyecto 
-                            left join proyecto on EmpleadoProyecto.id_proyecto=Proyecto.id
-                            where EmpleadoProyecto.id_empleado=%(id)s"""
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if id is not None:
-                cur.execute(sentenza_select_empregado, {'id': id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o empregado con id " + str(id))
-                    return None
-
-            cur.execute(sentenza_select_principal, {'id': id})
-
-            row = cur.fetchone()
-            while row:
-                print(f"\tFila {cur.rownumber}: [id: {row[0]}, nome: {row[1]} , horas: {row[2]}]")
-                row = cur.fetchone()
-            print(f"[✓] Total de proxectos: {cur.rowcount}")
-            conn.commit()
-
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
-            return None
+    try:
+        rows = EmpleadoProyectoRepo(conn).proyectos_de_empleado(id)
+        total = print_rows(rows, [('id_proyecto', 'id'), ('nombre', 'nome'), ('horas', 'horas')])
+        print(f"[✓] Total de proxectos: {total}")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
 
 
 ## ------------------------------------------------------------
@@ -961,46 +4248,22 @@ def get_depts_of_pro(conn):
     """
     Pide por teclado o id de proxecto
     :param conn: a conexion aberta á bd
-    :return: Departamentos que traballan nos proxectos (None se no existe)
+    :return: Nada. Imprime os departamentos que traballan no proxecto
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
-
     id = request_id_of("do proxecto")
     if id is None:
         print(f"[✗] É obrigatorio especificar o id do proxecto")
         return None
 
-    sentenza_select_proxecto = """
-            select id from proyecto where (id = %(id)s)
-        """
-
-    sentenza_select_principal = """select DepartamentoProyecto.id_departamento, Departamento.nombre from DepartamentoProyecto 
-                            left join departamento on DepartamentoProyecto.id_departamento=Departamento.id
-                            where DepartamentoProyecto.id_proyecto=%(id)s """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if id is not None:
-                cur.execute(sentenza_select_proxecto, {'id': id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o proxecto con id " + str(id))
-                    return None
-
-            cur.execute(sentenza_select_principal, {'id': id})
-
-            row = cur.fetchone()
-            while row:
-                print(f"\tFila {cur.rownumber}: [id: {row[0]}, nome: {row[1]}]")
-                row = cur.fetchone()
-            print(f"[✓] Total de departamentos: {cur.rowcount}")
-            conn.commit()
-
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
-            return None
+    try:
+        rows = DepartamentoProyectoRepo(conn).departamentos_de_proyecto(id)
+        total = print_rows(rows, [('id_departamento', 'id'), ('nombre', 'nome')])
+        print(f"[✓] Total de departamentos: {total}")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
 
 
 ## ------------------------------------------------------------
@@ -1012,8 +4275,6 @@ def update_hours_emppro(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     emp_id = request_id_of("do empregado")
     if emp_id is None:
         print(f"[✗] É obrigatorio especificar o id do empregado")
@@ -1027,58 +4288,19 @@ def update_hours_emppro(conn):
         print(f"[✗] É obrigatorio especificar as horas a sumar")
         return None
 
-    sentenza_select_emppro = """
-                select horas from EmpleadoProyecto where (id_empleado = %(emp_id)s) and (id_proyecto = %(pro_id)s)
-            """
-
-    sentenza_select_empregado = """
-            select id from empleado where (id = %(emp_id)s)
-        """
-
-    sentenza_select_proxecto = """
-            select id from proyecto where (id = %(pro_id)s)
-        """
-
-    sentenza_update = """
-        update EmpleadoProyecto set horas = horas + %(horas)s where (id_empleado = %(emp_id)s) and (id_proyecto = %(pro_id)s)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if emp_id is not None:
-                cur.execute(sentenza_select_empregado, {'emp_id': emp_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o empregado con id " + str(emp_id))
-                    return None
-            if pro_id is not None:
-                cur.execute(sentenza_select_proxecto, {'pro_id': pro_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o proxecto con id " + str(pro_id))
-                    return None
-
-            cur.execute(sentenza_select_emppro, {'emp_id': emp_id, 'pro_id': pro_id})
-            if cur.rowcount == 0:
-                conn.rollback()
-                print(f"[✗] Non existe a relación entre empregado " + str(emp_id) + " e proxecto " + str(pro_id))
-                return None
-
-            row = cur.fetchone()
-            print(f"RESULTADO: [id_empregado: {emp_id}, id_proxecto: {pro_id}, horas resultantes: {row[0] + horas}]")
-            confirmacion = request_changes_confirmation()
-
-            if confirmacion:
-                cur.execute(sentenza_update, {'horas': horas, 'emp_id': emp_id, 'pro_id': pro_id})
-                conn.commit()
-                print(f"[✓] Horas actualizadas")
-            else:
-                conn.rollback()
-                print(f"[✗] Actualización cancelada polo usuario")
-
-        except psycopg2.Error as e:
-            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
+    repo = EmpleadoProyectoRepo(conn)
+    try:
+        actuais = repo.horas(emp_id, pro_id)
+        print(f"RESULTADO: [id_empregado: {emp_id}, id_proxecto: {pro_id}, horas resultantes: {actuais + horas}]")
+        if not request_changes_confirmation():
+            print(f"[✗] Actualización cancelada polo usuario")
+            return
+        repo.add_horas(emp_id, pro_id, horas)
+        print(f"[✓] Horas actualizadas")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
 
 ## ------------------------------------------------------------
@@ -1089,8 +4311,6 @@ def update_reemplazar_emp_emppro(conn):
     :return: Nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     emp_out_id = request_id_of("do empregado a retirar do proxecto")
     if emp_out_id is None:
         print(f"[✗] É obrigatorio especificar o id do empregado a retirar")
@@ -1107,77 +4327,14 @@ def update_reemplazar_emp_emppro(conn):
         print(f"[✗] É obrigatorio especificar o id do proxecto")
         return None
 
-    sentenza_select_emppro_out = """
-                select id_empleado from EmpleadoProyecto where (id_empleado = %(emp_out_id)s) and (id_proyecto = %(pro_id)s)
-            """
-
-    sentenza_select_emppro_in = """
-                select id_empleado from EmpleadoProyecto where (id_empleado = %(emp_in_id)s) and (id_proyecto = %(pro_id)s)
-            """
-
-    sentenza_select_empregado_out = """
-            select id from empleado where (id = %(emp_out_id)s)
-        """
-
-    sentenza_select_empregado_in = """
-            select id from empleado where (id = %(emp_in_id)s)
-        """
-
-    sentenza_select_proxecto = """
-            select id from proyecto where (id = %(pro_id)s)
-        """
-
-    sentenza_delete_out = """
-        delete from EmpleadoProyecto where id_empleado=%(emp_out_id)s and id_proyecto=%(pro_id)s
-    """
-
-    sentenza_insert_in = """
-        insert into EmpleadoProyecto(id_empleado, id_proyecto, horas)
-        values(%(emp_in_id)s, %(pro_id)s, 0)
-    """
-
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        try:
-            if emp_out_id is not None and emp_in_id is not None:
-                cur.execute(sentenza_select_empregado_out, {'emp_out_id': emp_out_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o empregado con id " + str(emp_out_id))
-                    return None
-                cur.execute(sentenza_select_empregado_in, {'emp_in_id': emp_in_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o empregado con id " + str(emp_out_id))
-                    return None
-
-            if pro_id is not None:
-                cur.execute(sentenza_select_proxecto, {'pro_id': pro_id})
-                if cur.rowcount == 0:
-                    conn.rollback()
-                    print(f"[✗] Non existe o proxecto con id " + str(pro_id))
-                    return None
-
-            cur.execute(sentenza_select_emppro_out, {'emp_out_id': emp_out_id, 'pro_id': pro_id})
-            if cur.rowcount == 0:
-                conn.rollback()
-                print(f"[✗] Non existe a relación entre empregado " + str(emp_out_id) + " e proxecto " + str(pro_id))
-                return None
-
-            cur.execute(sentenza_select_emppro_in, {'emp_in_id': emp_in_id, 'pro_id': pro_id})
-            if cur.rowcount > 0:
-                conn.rollback()
-                print(f"[✗] Xa existe a relación entre empregado " + str(emp_out_id) + " e proxecto " + str(pro_id))
-                return None
-
-            cur.execute(sentenza_delete_out, {'emp_out_id': emp_out_id, 'pro_id': pro_id})
-            cur.execute(sentenza_insert_in, {'emp_in_id': emp_in_id, 'pro_id': pro_id})
-
-            conn.commit()
-            print(f"[✓] Empregado reemprazado")
+    try:
+        EmpleadoProyectoRepo(conn).replace(emp_out_id, emp_in_id, pro_id)
+        print(f"[✓] Empregado reemprazado")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
 
-        except psycopg2.Error as e:
-            print(F"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
-            conn.rollback()
 
 ## ------------------------------------------------------------
 def get_directed_depts_by_id(conn):
@@ -1188,46 +4345,26 @@ def get_directed_depts_by_id(conn):
     :return: nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_READ_COMMITTED
-
     id = request_id()
     if id is None:
         print(f"[✗] É obrigatorio especificar o id")
         return None
 
-    sentenza_select_emp = """select id from empleado where id=%(id)s"""
-    sentenza_select_depts = """select id, nombre from departamento where id_director=%(id)s"""
-
-    with conn.cursor(cursor_factory = psycopg2.extras.DictCursor) as cur:
-        try:
-
-            cur.execute(sentenza_select_emp, {'id': id})
-            row = cur.fetchone()
-            if row is None:
-                print(f"[✓] Non existe o empregado con id {id}")
-                conn.commit()
-                return None
-            else:
-                cur.execute(sentenza_select_depts, {'id': id})
-                row = cur.fetchone()
-
-                if row is None:
-                    print(f"[✓] O empregado {id} non dirixe ningún departamento")
-                    conn.commit()
-                    return None
-                else:
-                    while row:
-                        print(f"\tFila {cur.rownumber}: [id: {row[0]}, nome: {row[1]}]")
-                        row = cur.fetchone()
-                    print(f"[✓] Total de departamentos dirixidos polo empregado {id}: {cur.rowcount}")
+    try:
+        rows = EmpleadoRepo(conn).directed_depts(id)
+    except NotFoundError as e:
+        print(f"[✓] {e}")
+        return None
+    except psycopg2.Error as e:
+        print_pg_error(e)
+        return None
 
-                    conn.commit()
-                    return None
+    if not rows:
+        print(f"[✓] O empregado {id} non dirixe ningún departamento")
+        return None
+    total = print_rows(rows, [('id', 'id'), ('nombre', 'nome')])
+    print(f"[✓] Total de departamentos dirixidos polo empregado {id}: {total}")
 
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
-            return None
 
 ## ------------------------------------------------------------
 def update_dept_director(conn):
@@ -1238,53 +4375,56 @@ def update_dept_director(conn):
     :return: nada
     """
 
-    conn.isolation_level = psycopg2.extensions.ISOLATION_LEVEL_SERIALIZABLE
-
     id_dept = request_id_of("do departamento")
     if id_dept is None:
         print(f"[✗] É obrigatorio especificar o id do departamento")
         return None
     id_emp = request_id_of("do novo director")
-    if id_dept is None:
+    if id_emp is None:
         print(f"[✗] É obrigatorio especificar o id do novo director")
         return None
 
-    sentenza_select_dept = """select id from departamento where id=%(id)s"""
-    sentenza_select_emp = """select id from empleado where id=%(id)s"""
-    sentenza_update = """update departamento set id_director = %(id_emp)s where (id = %(id_dept)s)"""
-
-    with conn.cursor(cursor_factory = psycopg2.extras.DictCursor) as cur:
-        try:
+    try:
+        DepartamentoRepo(conn).update_director(id_dept, id_emp)
+        print(f"[✓] Director actualizado")
+    except NotFoundError as e:
+        print(f"[✓] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
 
-            cur.execute(sentenza_select_dept, {'id': id_dept})
-            row = cur.fetchone()
-            if row is None:
-                print(f"[✓] Non existe o departamento {id_dept}")
-                conn.commit()
-                return None
 
-            cur.execute(sentenza_select_emp, {'id': id_emp})
-            row = cur.fetchone()
-            if row is None:
-                print(f"[✓] Non existe o empregado con id {id_emp}")
-                conn.commit()
-                return None
+## ------------------------------------------------------------
+def search_by_name(conn):
+    """
+    Pide por teclado onde buscar e un texto e busca nos nomes
+    :param conn: a conexión aberta á bd
+    :return: Nada. Imprime os resultados de máis a menos relevantes
+    """
 
-            cur.execute(sentenza_update, {'id_emp': id_emp, 'id_dept': id_dept})
+    taboa = input("[OB] Buscar en (departamentos/proxectos/empregados): ")
+    if taboa not in SEARCH_TABLES:
+        print(f"[✗] É obrigatorio especificar departamentos, proxectos ou empregados")
+        return
+    texto = request_keyword()
+    if texto is None:
+        print(f"[✗] É obrigatorio especificar o texto a buscar")
+        return
 
-            conn.commit()
-            print(f"[✓] Director actualizado")
-            return None
+    try:
+        rows = BuscaRepo(conn).search(SEARCH_TABLES[taboa], texto)
+        total = print_rows(rows, [('id', 'id'), ('nombre', 'nome')])
+        print(f"[✓] Total de resultados: {total}")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
 
-        except psycopg2.Error as e:
-            print(f"[✗] Erro xeral de postgres: {e.pgcode} - {e.pgerror}")
-            conn.rollback()
-            return None
 
 ## ------------------------------------------------------------
-def menu(conn):
+def menu(pool):
     """
-    Imprime un menú de opcións, solicita a opción e executa a función asociada.
+    Imprime un menú de opcións, solicita a opción e executa a función asociada
+    cunha conexión collida do pool.
     'q' para saír.
     """
 
@@ -1312,68 +4452,499 @@ def menu(conn):
     20 - Eliminar os proxectos cuxa localidade sexa a indicada
     21 - Relacionar empregado con proxecto
     22 - Relacionar departamento con proxecto
+    23 - Buscar por nome
+    24 - Obter a ficha completa dun empregado
     q  - Saír   
     """
+    opcions = {
+        '1': get_emp_by_id,
+        '2': get_dept_by_id,
+        '3': get_pro_by_id,
+        '4': get_emps_by_sal,
+        '5': get_depts_by_loc,
+        '6': get_pros_by_loc,
+        '7': get_pros_of_emp,
+        '8': get_depts_of_pro,
+        '9': get_directed_depts_by_id,
+        '10': insert_emp,
+        '11': insert_dept,
+        '12': insert_pro,
+        '13': update_emp_sal_by_percentage,
+        '14': update_emp_comm,
+        '15': update_dept_director,
+        '16': update_hours_emppro,
+        '17': update_reemplazar_emp_emppro,
+        '18': delete_emp_by_id,
+        '19': delete_depts_by_keyword,
+        '20': delete_pros_by_loc,
+        '21': insert_rel_emp_pro,
+        '22': insert_rel_dept_pro,
+        '23': search_by_name,
+        '24': get_emp_profile,
+    }
     while True:
         print(MENU_TEXT)
         tecla = input('Opción> ')
         if tecla == 'q':
             break
-        elif tecla == '1':
-            get_emp_by_id(conn)
-        elif tecla == '2':
-            get_dept_by_id(conn)
-        elif tecla == '3':
-            get_pro_by_id(conn)
-        elif tecla == '4':
-            get_emps_by_sal(conn)
-        elif tecla == '5':
-            get_depts_by_loc(conn)
-        elif tecla == '6':
-            get_pros_by_loc(conn)
-        elif tecla == '7':
-            get_pros_of_emp(conn)
-        elif tecla == '8':
-            get_depts_of_pro(conn)
-        elif tecla == '9':
-            get_directed_depts_by_id(conn)
-        elif tecla == '10':
-            insert_emp(conn)
-        elif tecla == '11':
-            insert_dept(conn)
-        elif tecla == '12':
-            insert_pro(conn)
-        elif tecla == '13':
-            update_emp_sal_by_percentage(conn)
-        elif tecla == '14':
-            update_emp_comm(conn)
-        elif tecla == '15':
-            update_dept_director(conn)
-        elif tecla == '16':
-            update_hours_emppro(conn)
-        elif tecla == '17':
-            update_reemplazar_emp_emppro(conn)
-        elif tecla == '18':
-            delete_emp_by_id(conn)
-        elif tecla == '19':
-            delete_depts_by_keyword(conn)
-        elif tecla == '20':
-            delete_pros_by_loc(conn)
-        elif tecla == '21':
-            insert_rel_emp_pro(conn)
-        elif tecla == '22':
-            insert_rel_dept_pro(conn)
+        operacion = opcions.get(tecla)
+        if operacion is None:
+            continue
+        try:
+            with pool.connection() as conn, timed_operation(operacion.__name__):
+                operacion(conn)
+        except PoolTimeout as e:
+            print(f"[✗] {e}")
+        except psycopg2.OperationalError as e:
+            print(f"[✗] Conexión perdida: {e}")
+
+## ------------------------------------------------------------
+def cmd_import(pool, args):
+    """
+    Subcomando import: carga masiva de ficheiros CSV/JSONL
+    """
+    files = {table: getattr(args, table) for table in IMPORT_ORDER}
+    rejects = open(args.rejects, 'w', newline='', encoding='utf-8') if args.rejects else None
+    try:
+        with pool.connection() as conn:
+            stats = import_files(conn, files, args.chunk_size, rejects)
+        for table, s in stats.items():
+            print(f"[✓] {table}: {s['importadas']} fila(s) importadas, {s['rexeitadas']} rexeitadas")
+    except (OSError, psycopg2.Error) as e:
+        print(f"[✗] Erro na importación: {e}")
+    finally:
+        if rejects is not None:
+            rejects.close()
+
+
+## ------------------------------------------------------------
+def check_schema(pool):
+    """
+    Comproba que non haxa migracións pendentes: as sentenzas dos
+    repositorios contan coas claves e índices que crean (por exemplo ON
+    CONFLICT precisa as claves primarias das táboas de relación)
+    :return: True se o esquema está ao día
+    """
+    with pool.connection() as conn:
+        pending = Migrator(conn).pending()
+    if pending:
+        print(f"[✗] Hai {len(pending)} migración(s) pendentes, desde {pending[0][0]:04d}_{pending[0][1]}: "
+              f"executa 'python3 sgbd.py migrate'")
+        return False
+    return True
+
+
+## ------------------------------------------------------------
+def cmd_migrate(pool, args):
+    """
+    Subcomando migrate: aplica as migracións pendentes
+    """
+    try:
+        with pool.connection() as conn:
+            migrator = Migrator(conn)
+            pending = migrator.pending()
+            if not pending:
+                print("[✓] O esquema está ao día")
+                return
+            for version, nombre, _ in pending:
+                print(f"\tPendente: {version:04d}_{nombre}")
+            if args.dry_run:
+                return
+            before = migrator.explain() if args.explain else None
+            for version, nombre, path in pending:
+                migrator.apply(version, nombre, path)
+                print(f"[✓] Aplicada a migración {version:04d}_{nombre}")
+            if Repo.cache is not None:
+                Repo.cache.clear()
+            if before is not None:
+                after = migrator.explain()
+                for name in before:
+                    print(f"-- {name}")
+                    print(f"   antes:\n{textwrap.indent(before[name], chr(9))}")
+                    print(f"   despois:\n{textwrap.indent(after[name], chr(9))}")
+    except (OSError, psycopg2.Error) as e:
+        print(f"[✗] Erro na migración: {e}")
+
+
+## ------------------------------------------------------------
+def cmd_bulk_update(pool, args):
+    """
+    Subcomando bulk-update: cambia o salario ou a comisión dun conxunto de
+    empregados
+    """
+    filtro = EmpleadoFilter(
+        ids=args.ids,
+        id_departamento=args.departamento, trabajo=args.trabajo,
+        salario_min=args.salario_min, salario_max=args.salario_max)
+    try:
+        with pool.connection() as conn:
+            repo = EmpleadoRepo(conn)
+            if args.salario_porcentaxe is not None:
+                constraint = 'ch_salario'
+                result = repo.bulk_update_salario(filtro, args.salario_porcentaxe, args.chunk_size, args.dry_run)
+            else:
+                constraint = 'ch_comision'
+                result = repo.bulk_update_comision(filtro, args.comision, args.chunk_size, args.dry_run)
+    except psycopg2.Error as e:
+        print(f"[✗]Error xenérico: {e.pgcode}: {e.pgerror}")
+        return
+
+    for v in result.violacions:
+        print(f"\t{constraint}: [id: {v['id']}, nome: {v['nombre']}, actual: {v['actual']}, novo: {v['novo']}]")
+    if args.dry_run:
+        print(f"[✓] Simulación: {result.seleccionados} empregados seleccionados, "
+              f"{result.actualizados} cambiarían, {len(result.violacions)} incumpren {constraint}")
+        print(f"\tTotal actual: {result.total_actual}, total novo: {result.total_novo}")
+    else:
+        print(f"[✓] {result.actualizados} de {result.seleccionados} empregados actualizados, "
+              f"{len(result.violacions)} incumpren {constraint}")
+
+
+## ------------------------------------------------------------
+def cmd_batch(pool, args):
+    """
+    Subcomando batch: executa en paralelo as operacións dun ficheiro JSONL
+    """
+    if args.max_retries is not None and Repo.runner is not None:
+        Repo.runner.max_attempts = args.max_retries + 1
+    runner = BatchRunner(pool, workers=args.workers or pool.maxconn)
+    try:
+        with open(args.file, encoding='utf-8') as lines, \
+                (open(args.output, 'w', encoding='utf-8') if args.output else nullcontext(sys.stdout)) as out:
+            stats = runner.run(lines, out)
+    except OSError as e:
+        print(f"[✗] Erro no lote: {e}")
+        return
+    for op, s in sorted(stats['por_op'].items(), key=lambda item: str(item[0])):
+        print(f"\t{op}: {s['ok']} ok, {s['erros']} erros")
+    print(f"[✓] {stats['total']} operacións ({stats['ok']} ok, {stats['erros']} erros, "
+          f"{stats['reintentos']} reintentos) en {stats['segundos']} s: {stats['ops_por_segundo']} ops/s")
+
+
+## ------------------------------------------------------------
+def cmd_export(pool, args):
+    """
+    Subcomando export: vorca as táboas a CSV ou Parquet
+    """
+    tables = args.tables.split(',') if args.tables else IMPORT_ORDER
+    unknown = [t for t in tables if t not in IMPORT_SPECS]
+    if unknown:
+        print(f"[✗] Táboas descoñecidas: {', '.join(unknown)}")
+        return
+    if args.format == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+        print("[✗] O formato parquet necesita pyarrow (pip install pyarrow)")
+        return
+    exporter = Exporter(pool.params, args.dir, args.format, args.workers)
+    inicio = time.perf_counter()
+    try:
+        stats = exporter.export(tables)
+    except (OSError, psycopg2.Error) as e:
+        print(f"[✗] Erro na exportación: {e}")
+        return
+    for table, st in stats.items():
+        print(f"\t{table}: {st['filas']} filas, {st['bytes']} bytes en {st['segundos']} s")
+    print(f"[✓] Exportadas {len(stats)} táboas en {args.dir} ({time.perf_counter() - inicio:.3f} s)")
+
+
+## ------------------------------------------------------------
+def cmd_org(pool, args):
+    """
+    Subcomando org: consultas sobre a xerarquía de xefes
+    """
+    try:
+        with pool.connection() as conn:
+            repo = OrganigramaRepo(conn)
+            if args.accion == 'closure':
+                if args.disable:
+                    repo.disable_closure()
+                    print("[✓] Eliminada a táboa de peche EmpleadoXerarquia")
+                else:
+                    repo.enable_closure()
+                    print("[✓] Creada a táboa de peche EmpleadoXerarquia")
+                return
+            if args.id is None:
+                print("[✗] É obrigatorio especificar o id do empregado")
+                return
+            if args.accion == 'cadea':
+                rows = repo.cadea_de_mando(args.id, args.max_depth)
+                total = print_rows(rows, [('nivel', 'nivel'), ('id', 'id'), ('nombre', 'nome'),
+                                          ('trabajo', 'traballo')])
+                print(f"[✓] Total de xefes: {total}")
+            elif args.accion == 'subordinados':
+                rows = repo.subordinados(args.id, args.max_depth)
+                total = print_rows(rows, [('nivel', 'nivel'), ('id', 'id'), ('nombre', 'nome'),
+                                          ('id_jefe', 'xefe')])
+                print(f"[✓] Total de subordinados: {total}")
+            else:
+                custo = repo.custo_subarbore(args.id, args.max_depth)
+                print(f"[✓] Subárbore de {args.id}: {custo['persoas']} persoas, {custo['profundidade']} niveis, "
+                      f"salarios {custo['salario']}, comisións {custo['comision']}")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+# listado -> (función que devolve as filas, columnas), ver cmd_list
+LISTINGS = {
+    'empregados-salario': (lambda conn, v: EmpleadoRepo(conn).list_by_salario(float(v)),
+                           [('id', 'id'), ('nombre', 'nome'), ('salario', 'salario')]),
+    'departamentos-localidade': (lambda conn, v: DepartamentoRepo(conn).list_by_localidad(v),
+                                 [('id', 'id'), ('nombre', 'nome')]),
+    'proxectos-localidade': (lambda conn, v: ProyectoRepo(conn).list_by_localidad(v),
+                             [('id', 'id'), ('nombre', 'nome')]),
+    'proxectos-empregado': (lambda conn, v: EmpleadoProyectoRepo(conn).proyectos_de_empleado(int(v)),
+                            [('id_proyecto', 'id'), ('nombre', 'nome'), ('horas', 'horas')]),
+    'departamentos-proxecto': (lambda conn, v: DepartamentoProyectoRepo(conn).departamentos_de_proyecto(int(v)),
+                               [('id_departamento', 'id'), ('nombre', 'nome')]),
+}
+
+
+def cmd_list(pool, args):
+    """
+    Subcomando list: os listados do menú sen preguntar, para usalos con
+    --output-format e --output-file
+    """
+    listar, fields = LISTINGS[args.listado]
+    try:
+        with pool.connection() as conn:
+            total = print_rows(listar(conn, args.valor), fields)
+        print(f"[✓] Total de filas: {total}")
+    except ValueError as e:
+        print(f"[✗] Valor incorrecto: {e}")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+def cmd_search(pool, args):
+    """
+    Subcomando search: busca por nome en departamentos, proxectos ou empregados
+    """
+    try:
+        with pool.connection() as conn:
+            rows = BuscaRepo(conn).search(SEARCH_TABLES[args.taboa], args.texto, args.modo, args.n)
+        for row in rows:
+            row['rank'] = round(row['rank'], 3)
+        total = print_rows(rows, [('id', 'id'), ('nombre', 'nome'), ('rank', 'relevancia')])
+        print(f"[✓] Total de resultados: {total}")
+    except SgbdError as e:
+        print(f"[✗] {e}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+def cmd_report(pool, args):
+    """
+    Subcomando report: informes de horas e custo
+    """
+    try:
+        with pool.connection() as conn:
+            repo = InformeRepo(conn)
+            if args.refresh or args.informe == 'refresh':
+                for view, segundos in repo.refresh(not args.blocking).items():
+                    print(f"[✓] Refrescada {view} en {segundos} s")
+            if args.informe == 'proxectos':
+                rows = repo.horas_por_proyecto(args.n)
+                fields = [('id_proyecto', 'id'), ('nombre', 'nome'), ('horas', 'horas'),
+                          ('empregados', 'empregados'), ('custo', 'custo')]
+            elif args.informe == 'custo':
+                rows = repo.custo_por_proyecto(args.n)
+                fields = [('id_proyecto', 'id'), ('nombre', 'nome'), ('custo', 'custo'), ('horas', 'horas')]
+            elif args.informe == 'departamentos':
+                rows = repo.horas_por_departamento(args.n)
+                fields = [('id_departamento', 'id'), ('nombre', 'nome'), ('proxectos', 'proxectos'),
+                          ('horas', 'horas'), ('custo', 'custo')]
+            elif args.informe == 'top':
+                rows = repo.top_empleados(args.n or 10)
+                fields = [('id_empleado', 'id'), ('nombre', 'nome'), ('horas', 'horas'),
+                          ('proxectos', 'proxectos'), ('custo', 'custo')]
+            else:
+                return
+        total = print_rows(rows, fields)
+        print(f"[✓] Total de filas: {total}")
+    except psycopg2.Error as e:
+        print_pg_error(e)
+
+
+## ------------------------------------------------------------
+def cmd_hours(pool, args):
+    """
+    Subcomando hours: acumula os deltas de horas dun ficheiro CSV/JSONL con
+    columnas id_empleado, id_proyecto e horas
+    """
+    def deltas():
+        for linha, record in read_records(args.file):
+            try:
+                yield int(record['id_empleado']), int(record['id_proyecto']), int(record['horas'])
+            except (KeyError, TypeError, ValueError):
+                print(f"[✗] Liña {linha} incorrecta: {record}")
+
+    inicio = time.perf_counter()
+    try:
+        with pool.connection() as conn:
+            result = EmpleadoProyectoRepo(conn).accumulate_horas(deltas(), args.batch_size)
+    except (OSError, ValueError) as e:
+        print(f"[✗] Erro lendo {args.file}: {e}")
+        return
+    except psycopg2.Error as e:
+        print_pg_error(e)
+        return
+    segundos = time.perf_counter() - inicio
+    for r in result.rexeitadas:
+        print(f"\tRexeitada ({r['motivo']}): [empregado: {r['emp_id']}, proxecto: {r['pro_id']}, horas: {r['horas']}]")
+    print(f"[✓] {result.recibidas} deltas en {result.pares} pares: {result.aplicadas} aplicados, "
+          f"{len(result.rexeitadas)} rexeitados ({result.recibidas / segundos:.0f} deltas/s)")
+
+
+## ------------------------------------------------------------
+def optional_float(value):
+    """
+    Tipo de argparse: un float ou None para a cadea baleira
+    """
+    return None if value == '' else float(value)
+
+
+def id_list(value):
+    """
+    Tipo de argparse: lista de ids separados por comas
+    """
+    return [int(i) for i in value.split(',')]
+
+
+def build_parser():
+    """
+    Argumentos da liña de comandos. Sen subcomando execútase o menú
+    """
+    parser = argparse.ArgumentParser(description="Xestión da BD empresa")
+    parser.add_argument('--histograma', action='store_true',
+                        help="mostra ao saír o histograma de tempos por operación")
+    parser.add_argument('--metrics-port', type=int, metavar='PORTO',
+                        help="serve as métricas Prometheus en http://127.0.0.1:PORTO/metrics")
+    parser.add_argument('--metrics-textfile', metavar='FICHEIRO',
+                        help="escribe as métricas Prometheus neste ficheiro")
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, default='table',
+                        help="formato dos listados; con csv, jsonl ou tsv as mensaxes van ao stderr "
+                             "e a ficha dun empregado sae como un documento JSON")
+    parser.add_argument('--output-file', metavar='FICHEIRO',
+                        help="escribe os listados neste ficheiro en vez de na saída estándar")
+    sub = parser.add_subparsers(dest='command')
+
+    p = sub.add_parser('import', help="carga masiva de ficheiros CSV/JSONL con COPY")
+    for table in IMPORT_ORDER:
+        p.add_argument(f"--{table}", metavar='FICHEIRO', help=f"ficheiro para a táboa {table}")
+    p.add_argument('--chunk-size', type=int, default=10000, help="filas por commit")
+    p.add_argument('--rejects', metavar='FICHEIRO', help="CSV onde gardar as filas rexeitadas")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser('migrate', help="aplica as migracións pendentes do esquema")
+    p.add_argument('--dry-run', action='store_true', help="só lista as migracións pendentes")
+    p.add_argument('--explain', action='store_true', help="mostra os plans das consultas antes e despois")
+    p.set_defaults(func=cmd_migrate)
+
+    p = sub.add_parser('bulk-update', help="cambia o salario ou a comisión de moitos empregados")
+    change = p.add_mutually_exclusive_group(required=True)
+    change.add_argument('--salario-porcentaxe', type=float, metavar='PORC', help="porcentaxe de aumento de salario")
+    # sen default para que '' (None) conte coma indicado no grupo obrigatorio
+    change.add_argument('--comision', type=optional_float, default=argparse.SUPPRESS, metavar='VALOR',
+                        help="nova comisión ('' para quitala)")
+    p.add_argument('--ids', type=id_list, help="lista de ids separados por comas")
+    p.add_argument('--departamento', type=int, help="id do departamento")
+    p.add_argument('--trabajo', help="traballo")
+    p.add_argument('--salario-min', type=float, help="salario mínimo (incluído)")
+    p.add_argument('--salario-max', type=float, help="salario máximo (incluído)")
+    p.add_argument('--chunk-size', type=int, default=1000, help="empregados por sentenza e commit")
+    p.add_argument('--dry-run', action='store_true', help="mostra o resumo sen aplicar os cambios")
+    p.set_defaults(func=cmd_bulk_update)
+
+    p = sub.add_parser('export', help="vorca as táboas a CSV ou Parquet nunha instantánea consistente")
+    p.add_argument('--dir', required=True, help="directorio de saída")
+    p.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="formato dos ficheiros")
+    p.add_argument('--tables', help=f"táboas separadas por comas (por defecto {','.join(IMPORT_ORDER)})")
+    p.add_argument('--workers', type=int, default=4, help="táboas que se exportan á vez")
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser('org', help="cadea de mando, subordinados e custo por subárbore")
+    p.add_argument('accion', choices=['cadea', 'subordinados', 'custo', 'closure'],
+                   help="closure crea (ou con --disable elimina) a táboa de peche")
+    p.add_argument('id', type=int, nargs='?', help="id do empregado")
+    p.add_argument('--max-depth', type=int, default=OrganigramaRepo.MAX_DEPTH, help="niveis como máximo")
+    p.add_argument('--disable', action='store_true', help="con closure, elimina a táboa de peche")
+    p.set_defaults(func=cmd_org)
+
+    p = sub.add_parser('list', help="listados do menú para outras ferramentas (ver --output-format)")
+    p.add_argument('listado', choices=list(LISTINGS))
+    p.add_argument('valor', help="salario mínimo, localidade ou id segundo o listado")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser('search', help="busca por nome en departamentos, proxectos ou empregados")
+    p.add_argument('taboa', choices=list(SEARCH_TABLES), help="onde buscar")
+    p.add_argument('texto', help="texto a buscar")
+    p.add_argument('--modo', choices=BuscaRepo.MODES, default='substring',
+                   help="substring (contén o texto), aprox (tolera erros, con pg_trgm) ou texto (por palabras)")
+    p.add_argument('-n', type=int, default=20, help="número de resultados")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser('report', help="informes de horas e custo por proxecto, departamento e empregado")
+    p.add_argument('informe', choices=['proxectos', 'custo', 'departamentos', 'top', 'refresh'],
+                   help="refresh só refresca as vistas materializadas")
+    p.add_argument('-n', type=int, help="número de filas (top: 10 por defecto)")
+    p.add_argument('--refresh', action='store_true', help="refresca as vistas antes do informe")
+    p.add_argument('--blocking', action='store_true', help="refresca sen CONCURRENTLY (máis rápido, bloquea as lecturas)")
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('hours', help="suma deltas de horas (CSV/JSONL id_empleado, id_proyecto, horas)")
+    p.add_argument('file', metavar='FICHEIRO', help="ficheiro cos deltas")
+    p.add_argument('--batch-size', type=int, default=10000, help="deltas por lote e transacción")
+    p.set_defaults(func=cmd_hours)
+
+    p = sub.add_parser('batch', help="executa en paralelo un ficheiro de operacións JSONL")
+    p.add_argument('file', metavar='FICHEIRO', help='unha operación por liña, p.ex. {"op": "get_emp_by_id", "id": 1}')
+    p.add_argument('--workers', type=int, help="operacións á vez (por defecto o maxconn do pool)")
+    p.add_argument('--max-retries', type=int, help="reintentos por serialization_failure/deadlock "
+                                                   "(por defecto os da sección retry de dbconfig.json)")
+    p.add_argument('-o', '--output', metavar='FICHEIRO', help="ficheiro JSONL para os resultados (por defecto stdout)")
+    p.set_defaults(func=cmd_batch)
+
+    return parser
+
 
 ## ------------------------------------------------------------
 def main():
     """
-    Función principal. Conecta á bd e executa o menú.
-    Cando sae do menú, desconecta da bd e remata o programa
+    Función principal. Conecta á bd e executa o subcomando indicado
+    ou, se non se indica ningún, o menú.
+    Cando remata, desconecta da bd e remata o programa
     """
-    print('Conectando a PosgreSQL...')
-    conn = connect_db()
-    menu(conn)
-    disconnect_db(conn)
+    args = build_parser().parse_args()
+    RowWriter.current = writer = RowWriter(args.output_format, args.output_file)
+    with writer.messages():
+        print('Conectando a PosgreSQL...')
+        pool = connect_db()
+        exporter = None
+        try:
+            exporter = start_metrics(pool, MetricsExporter.config, args.metrics_port, args.metrics_textfile)
+            if args.command != 'migrate' and not check_schema(pool):
+                return
+            if args.command is None:
+                menu(pool)
+            else:
+                with timed_operation(args.command):
+                    args.func(pool, args)
+        finally:
+            if exporter is not None:
+                exporter.close()
+            disconnect_db(pool)
+            writer.close()
+            timer = TimedCursor.timer
+            if timer is not None:
+                if args.histograma or timer.histogram:
+                    print(timer.report())
+                timer.close()
 
 
 ## ------------------------------------------------------------
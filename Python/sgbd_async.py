@@ -0,0 +1,694 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+#
+# Autores:
+#   - Joaquín Solla Vázquez (joaquin.solla@udc.es)
+#   - Lucas Campos Camiña (lucas.campos@udc.es)
+
+# Data de creación: 18-10-2026
+#
+# Variante asíncrona (asyncio) da capa de acceso a datos de sgbd.py sobre
+# psycopg 3. Expón as mesmas operacións que os repositorios de sgbd.py
+# coma corrutinas, de xeito que un só proceso (por exemplo un servizo web)
+# pode ter centos de consultas en curso sen un fío por petición:
+#
+#   pool = await create_pool(sgbd.configure(sgbd.read_config('dbconfig.json')))
+#   async with pool.connection() as conn:
+#       emp = await EmpleadoRepo(conn).get(1)
+#
+# As sentenzas SQL, os modelos, os erros, a caché, os tempos das sentenzas
+# (TimedCursor.timer) e os reintentos das escrituras SERIALIZABLE
+# (Repo.runner) son os de sgbd.py. Os commits, os rollbacks e o pool contan
+# nas métricas (--metrics-port, --metrics-textfile; ver sgbd.MetricsExporter).
+# psycopg 3 prepara no servidor as sentenzas que se repiten (prepare_threshold),
+# que fai o papel de StatementCache.
+#
+#   python3 sgbd_async.py --requests 10000 --concurrency 500
+#
+# lanza buscas de empregados por id concorrentes e mostra o throughput.
+
+import argparse
+import asyncio
+import functools
+import itertools
+import random
+import sys
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import AsyncIterator, Optional
+
+import psycopg
+from psycopg.rows import dict_row
+
+import sgbd
+from sgbd import (Empleado, Departamento, Proyecto, from_row,
+                  SgbdError, NotFoundError, AlreadyExistsError, PoolTimeout)
+
+
+## CURSORES---------------------------------------------------
+async def _explain(conn, sentenza, params):
+    """
+    EXPLAIN ANALYZE da sentenza nun savepoint, para desfacer os seus efectos
+    (ver sgbd.QueryTimer._explain)
+    """
+    if conn.info.transaction_status != psycopg.pq.TransactionStatus.INTRANS:
+        return None
+    async with psycopg.AsyncCursor(conn) as ecur:
+        await ecur.execute("savepoint sgbd_explain")
+        try:
+            await ecur.execute("explain (analyze, buffers) " + sentenza, params)
+            return '\n'.join(row['QUERY PLAN'] for row in await ecur.fetchall())
+        except psycopg.Error as e:
+            return f"EXPLAIN fallou: {e.sqlstate}"
+        finally:
+            await ecur.execute("rollback to savepoint sgbd_explain")
+            await ecur.execute("release savepoint sgbd_explain")
+
+
+async def _record(cur, sentenza, params, seconds, rows, ok):
+    """
+    Pasa a sentenza ao QueryTimer de sgbd.TimedCursor. O EXPLAIN das
+    consultas lentas faise aquí, xa que o do QueryTimer é síncrono
+    """
+    timer = sgbd.TimedCursor.timer
+    plan = None
+    if ok and timer.wants_plan(seconds * 1000, sentenza):
+        plan = await _explain(cur.connection, sentenza, params)
+    timer.record(None, sentenza, params, seconds, rows, sentenza if ok else None, plan)
+
+
+class TimedAsyncCursor(psycopg.AsyncCursor):
+    """
+    Cursor asíncrono que, coma sgbd.TimedCursor, pasa cada sentenza que
+    executa ao QueryTimer común (sgbd.TimedCursor.timer)
+    """
+
+    async def execute(self, query, params=None, **kwargs):
+        if sgbd.TimedCursor.timer is None:
+            return await super().execute(query, params, **kwargs)
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            result = await super().execute(query, params, **kwargs)
+            ok = True
+            return result
+        finally:
+            await _record(self, query, params, time.perf_counter() - inicio,
+                          self.rowcount if ok else -1, ok)
+
+
+class TimedAsyncServerCursor(psycopg.AsyncServerCursor):
+    """
+    Cursor do servidor asíncrono rexistrado no QueryTimer común. Coma en
+    sgbd.TimedCursor, a sentenza rexístrase ao rematar de ler as filas,
+    co tempo do execute (o DECLARE) máis o de cada viaxe
+    """
+
+    _timed = None
+
+    async def execute(self, query, params=None, **kwargs):
+        if sgbd.TimedCursor.timer is None:
+            return await super().execute(query, params, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            result = await super().execute(query, params, **kwargs)
+        except BaseException:
+            await _record(self, query, params, time.perf_counter() - inicio, -1, False)
+            raise
+        self._timed = [query, params, time.perf_counter() - inicio, 0]
+        return result
+
+    async def __anext__(self):
+        timed = self._timed
+        if timed is None or sgbd.TimedCursor.timer is None:
+            return await super().__anext__()
+        inicio = time.perf_counter()
+        try:
+            row = await super().__anext__()
+        except StopAsyncIteration:
+            timed[2] += time.perf_counter() - inicio
+            self._timed = None
+            await _record(self, timed[0], timed[1], timed[2], timed[3], True)
+            raise
+        timed[2] += time.perf_counter() - inicio
+        timed[3] += 1
+        return row
+
+
+## POOL--------------------------------------------------------
+class AsyncConnectionPool:
+    """
+    Pool de conexións asíncronas. Igual que sgbd.ConnectionPool pero as
+    esperas (checkout, conexión, reintentos) son corrutinas, así que as
+    tarefas que esperan por unha conexión libre non bloquean o bucle
+    """
+
+    def __init__(self, params, minconn=1, maxconn=5, checkout_timeout=10,
+                 health_check_after=30, max_retries=5, backoff=0.5):
+        """
+        :param params: parámetros de conexión (host, user, ...)
+        Ver sgbd.ConnectionPool para o resto
+        """
+        self.params = params
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._idle = asyncio.LifoQueue()
+        self._slots = asyncio.BoundedSemaphore(maxconn)
+        self._in_use = 0
+        self._closed = False
+
+    async def open(self):
+        """
+        Abre as minconn conexións iniciais
+        :return: o propio pool
+        """
+        for _ in range(self.minconn):
+            self._idle.put_nowait((await self._connect(), time.monotonic()))
+        return self
+
+    async def _connect(self):
+        """
+        Abre unha conexión nova, reintentando con espera exponencial
+        :return: conexión ca BD
+        """
+        delay = self.backoff
+        for intento in range(1, self.max_retries + 1):
+            try:
+                conn = await psycopg.AsyncConnection.connect(autocommit=False, row_factory=dict_row,
+                                                             cursor_factory=TimedAsyncCursor, **self.params)
+                conn.server_cursor_factory = TimedAsyncServerCursor
+                return conn
+            except psycopg.OperationalError:
+                if intento == self.max_retries:
+                    raise
+                await asyncio.sleep(delay + random.uniform(0, delay))
+                delay *= 2
+
+    @staticmethod
+    async def _healthy(conn):
+        if conn.closed:
+            return False
+        try:
+            await conn.execute("select 1")
+            await conn.rollback()
+            return True
+        except psycopg.Error:
+            return False
+
+    @staticmethod
+    async def _close(conn):
+        try:
+            await conn.close()
+        except psycopg.Error:
+            pass
+
+    async def getconn(self):
+        """
+        Colle unha conexión do pool, abrindo unha nova se non hai ningunha
+        libre e aínda non se chegou a maxconn
+        :return: conexión ca BD
+        """
+        if self._closed:
+            raise PoolTimeout("O pool está pechado")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.checkout_timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"Non hai conexións libres tras {self.checkout_timeout} s") from None
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn, last_used = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    conn = await self._connect()
+                    break
+                if time.monotonic() - last_used > self.health_check_after and not await self._healthy(conn):
+                    await self._close(conn)
+                    conn = None
+            self._in_use += 1
+            return conn
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def putconn(self, conn):
+        """
+        Devolve unha conexión ao pool. Se quedou cunha transacción aberta
+        desfaise; se está rota péchase
+        """
+        try:
+            if not conn.closed and not self._closed:
+                try:
+                    if conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                        await conn.rollback()
+                    self._idle.put_nowait((conn, time.monotonic()))
+                except psycopg.Error:
+                    await self._close(conn)
+            else:
+                await self._close(conn)
+        finally:
+            self._in_use -= 1
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        """
+        Checkout dunha conexión para unha operación:
+            async with pool.connection() as conn: ...
+        """
+        conn = await self.getconn()
+        try:
+            yield conn
+        finally:
+            await self.putconn(conn)
+
+    def stats(self):
+        """
+        :return: diccionario con conexións en uso, libres e o máximo
+        """
+        return {'in_use': self._in_use, 'idle': self._idle.qsize(), 'max': self.maxconn}
+
+    async def closeall(self):
+        """
+        Pecha todas as conexións libres e impide novos checkouts
+        """
+        self._closed = True
+        while not self._idle.empty():
+            conn, _ = self._idle.get_nowait()
+            await self._close(conn)
+
+
+async def create_pool(config):
+    """
+    Crea e abre o pool asíncrono a partir da config da BD (ver
+    sgbd.create_pool). O statement_cache do pool non se usa aquí
+    :param config: config da BD xa pasada por sgbd.configure
+    :return: pool de conexións
+    """
+    params, pool_cfg = sgbd.split_pool_config(config)
+    pool = AsyncConnectionPool(params,
+                               minconn=pool_cfg.get('minconn', 1),
+                               maxconn=pool_cfg.get('maxconn', 5),
+                               checkout_timeout=pool_cfg.get('checkout_timeout', 10),
+                               health_check_after=pool_cfg.get('health_check_after', 30),
+                               max_retries=pool_cfg.get('max_retries', 5),
+                               backoff=pool_cfg.get('backoff', 0.5))
+    return await pool.open()
+
+
+## TRANSACCIÓNS------------------------------------------------
+def retry_transaction(method):
+    """
+    Decorador dos métodos que escriben: repite a transacción se falla por
+    serialization_failure ou deadlock_detected, co mesmo TransactionRunner
+    (sgbd.Repo.runner) e polo tanto o mesmo orzamento, esperas e contadores
+    que os repositorios síncronos
+    """
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        runner = sgbd.Repo.runner
+        if runner is None:
+            return await method(self, *args, **kwargs)
+        name = method.__qualname__
+        runner.started(name)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = await method(self, *args, **kwargs)
+            except psycopg.Error as e:
+                delay = runner.retry_delay(name, e.sqlstate, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            runner.succeeded(attempt)
+            return result
+    return wrapper
+
+
+## REPOSITORIOS------------------------------------------------
+class AsyncRepo:
+    """
+    Base dos repositorios asíncronos. Mesmo contrato que sgbd.Repo: cada
+    método é unha transacción completa e os erros de postgres
+    (psycopg.Error) propáganse despois de facer rollback
+    """
+
+    _cursor_ids = itertools.count(1)
+
+    def __init__(self, conn):
+        """
+        :param conn: a conexión aberta á bd (por exemplo collida do pool)
+        """
+        self.conn = conn
+
+    @property
+    def cache(self):
+        return sgbd.Repo.cache
+
+    @asynccontextmanager
+    async def _transaction(self, isolation_level=psycopg.IsolationLevel.READ_COMMITTED):
+        """
+        Abre unha transacción co nivel de illamento indicado e devolve un
+        cursor. Fai commit ao rematar ou rollback se hai unha excepción
+        """
+        await self.conn.set_isolation_level(isolation_level)
+        try:
+            async with self.conn.cursor() as cur:
+                yield cur
+            await self.conn.commit()
+            sgbd.Repo.tx_stats.commit()
+        except BaseException as e:
+            await self.conn.rollback()
+            sgbd.Repo.tx_stats.rollback(e)
+            raise
+
+    async def _stream(self, sentenza, params):
+        """
+        Devolve as filas da consulta a medida que chegan desde un cursor do
+        servidor, itersize en cada viaxe (ver sgbd.Repo._stream)
+        :return: xerador asíncrono de filas
+        """
+        await self.conn.set_isolation_level(psycopg.IsolationLevel.READ_COMMITTED)
+        try:
+            name = f"astream_{next(self._cursor_ids)}"
+            async with self.conn.cursor(name=name) as cur:
+                cur.itersize = sgbd.Repo.itersize
+                await cur.execute(sentenza, params)
+                async for row in cur:
+                    yield row
+            await self.conn.commit()
+            sgbd.Repo.tx_stats.commit()
+        except BaseException as e:
+            await self.conn.rollback()
+            sgbd.Repo.tx_stats.rollback(e)
+            raise
+
+    async def _get(self, table, cls, sentenza, id):
+        """
+        Busca unha fila polo seu id pasando pola caché
+        :return: a dataclass cls ou None se non existe
+        """
+        if self.cache is not None:
+            found, value = self.cache.get(table, id)
+            if found:
+                return value
+        async with self._transaction() as cur:
+            await cur.execute(sentenza, {'id': id})
+            row = await cur.fetchone()
+        value = None if row is None else from_row(cls, row)
+        if self.cache is not None and value is not None:
+            self.cache.put(table, id, value)
+        return value
+
+    def _invalidate(self, table, id=None):
+        if self.cache is not None:
+            self.cache.invalidate(table, id)
+
+    async def _exists(self, cur, sentenza, params):
+        await cur.execute(sentenza, params)
+        return cur.rowcount > 0
+
+    async def _require_empleado(self, cur, id, text=""):
+        if not await self._exists(cur, sgbd.EmpleadoRepo.SELECT_ID, {'id': id}):
+            raise NotFoundError(f"Non existe o empregado con id {id}{text}")
+
+    async def _require_departamento(self, cur, id):
+        if not await self._exists(cur, sgbd.DepartamentoRepo.SELECT_ID, {'id': id}):
+            raise NotFoundError(f"Non existe o departamento con id {id}")
+
+    async def _require_proyecto(self, cur, id):
+        if not await self._exists(cur, sgbd.ProyectoRepo.SELECT_ID, {'id': id}):
+            raise NotFoundError(f"Non existe o proxecto con id {id}")
+
+
+class EmpleadoRepo(AsyncRepo):
+    """
+    Acceso á táboa Empleado (ver sgbd.EmpleadoRepo)
+    """
+
+    sql = sgbd.EmpleadoRepo
+
+    async def get(self, id: int) -> Optional[Empleado]:
+        return await self._get('empleado', Empleado, self.sql.SELECT, id)
+
+    def list_by_salario(self, salario: float) -> AsyncIterator:
+        return self._stream(self.sql.SELECT_BY_SAL, {'salario': salario})
+
+    @retry_transaction
+    async def insert(self, emp: Empleado) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            if emp.id_jefe is not None:
+                await self._require_empleado(cur, emp.id_jefe, " para engadir coma xefe")
+            if emp.id_departamento is not None:
+                await self._require_departamento(cur, emp.id_departamento)
+            await cur.execute(self.sql.INSERT, asdict(emp))
+        self._invalidate('empleado', emp.id)
+
+    @retry_transaction
+    async def update_salario_by_percentage(self, id: int, porcentaxe: float) -> float:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.UPDATE_SAL, {'id': id, 'porc': porcentaxe})
+            row = await cur.fetchone()
+            if row is None:
+                raise NotFoundError(f"Non existe o empregado con id {id}")
+        self._invalidate('empleado', id)
+        return row['salario']
+
+    @retry_transaction
+    async def update_comision(self, id: int, comision: Optional[float]) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.UPDATE_COMM, {'id': id, 'comm': comision})
+            if cur.rowcount == 0:
+                raise NotFoundError(f"Non existe o empregado con id {id}")
+        self._invalidate('empleado', id)
+
+    @retry_transaction
+    async def delete(self, id: int) -> int:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.DELETE, {'id': id})
+            n = cur.rowcount
+        self._invalidate('empleado')
+        return n
+
+    async def directed_depts(self, id: int) -> list:
+        async with self._transaction() as cur:
+            await self._require_empleado(cur, id)
+            await cur.execute(self.sql.SELECT_DIRECTED_DEPTS, {'id': id})
+            return await cur.fetchall()
+
+
+class DepartamentoRepo(AsyncRepo):
+    """
+    Acceso á táboa Departamento (ver sgbd.DepartamentoRepo)
+    """
+
+    sql = sgbd.DepartamentoRepo
+
+    async def get(self, id: int) -> Optional[Departamento]:
+        return await self._get('departamento', Departamento, self.sql.SELECT, id)
+
+    def list_by_localidad(self, localidade: str) -> AsyncIterator:
+        return self._stream(self.sql.SELECT_BY_LOC, {'localidade': localidade})
+
+    @retry_transaction
+    async def insert(self, dept: Departamento) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.INSERT, asdict(dept))
+        self._invalidate('departamento', dept.id)
+
+    @retry_transaction
+    async def update_director(self, id_dept: int, id_emp: int) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await self._require_departamento(cur, id_dept)
+            await self._require_empleado(cur, id_emp)
+            await cur.execute(self.sql.UPDATE_DIRECTOR, {'id_emp': id_emp, 'id_dept': id_dept})
+        self._invalidate('departamento', id_dept)
+
+    @retry_transaction
+    async def delete_by_keyword(self, keyword: str) -> int:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.DELETE_BY_KEYWORD, {'pattern': sgbd.BuscaRepo.like_pattern(keyword)})
+            n = cur.rowcount
+        self._invalidate('departamento')
+        self._invalidate('empleado')
+        return n
+
+
+class ProyectoRepo(AsyncRepo):
+    """
+    Acceso á táboa Proyecto (ver sgbd.ProyectoRepo)
+    """
+
+    sql = sgbd.ProyectoRepo
+
+    async def get(self, id: int) -> Optional[Proyecto]:
+        return await self._get('proyecto', Proyecto, self.sql.SELECT, id)
+
+    def list_by_localidad(self, localidade: str) -> AsyncIterator:
+        return self._stream(self.sql.SELECT_BY_LOC, {'localidade': localidade})
+
+    @retry_transaction
+    async def insert(self, pro: Proyecto) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.INSERT, asdict(pro))
+        self._invalidate('proyecto', pro.id)
+
+    @retry_transaction
+    async def delete_by_localidad(self, localidade: str) -> int:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.DELETE_BY_LOC, {'loc': localidade})
+            n = cur.rowcount
+        self._invalidate('proyecto')
+        return n
+
+
+class EmpleadoProyectoRepo(AsyncRepo):
+    """
+    Acceso á relación EmpleadoProyecto (ver sgbd.EmpleadoProyectoRepo)
+    """
+
+    sql = sgbd.EmpleadoProyectoRepo
+
+    async def proyectos_de_empleado(self, emp_id: int) -> list:
+        async with self._transaction() as cur:
+            await self._require_empleado(cur, emp_id)
+            await cur.execute(self.sql.SELECT_PROS_OF_EMP, {'id': emp_id})
+            return await cur.fetchall()
+
+    async def horas(self, emp_id: int, pro_id: int) -> int:
+        async with self._transaction() as cur:
+            await cur.execute(self.sql.SELECT_HORAS, {'emp_id': emp_id, 'pro_id': pro_id})
+            row = await cur.fetchone()
+        self.sql._check(row, emp_id, pro_id)
+        if row['horas'] is None:
+            raise NotFoundError(f"Non existe a relación entre empregado {emp_id} e proxecto {pro_id}")
+        return row['horas']
+
+    @retry_transaction
+    async def insert(self, emp_id: int, pro_id: int) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.INSERT, {'emp_id': emp_id, 'pro_id': pro_id})
+            row = await cur.fetchone()
+            self.sql._check(row, emp_id, pro_id)
+            if not row['done']:
+                raise AlreadyExistsError("Xa existe esta relación")
+
+    @retry_transaction
+    async def add_horas(self, emp_id: int, pro_id: int, horas: int) -> int:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.UPDATE_HORAS, {'horas': horas, 'emp_id': emp_id, 'pro_id': pro_id})
+            row = await cur.fetchone()
+            self.sql._check(row, emp_id, pro_id)
+            if row['horas'] is None:
+                raise NotFoundError(f"Non existe a relación entre empregado {emp_id} e proxecto {pro_id}")
+            return row['horas']
+
+    @retry_transaction
+    async def replace(self, emp_out_id: int, emp_in_id: int, pro_id: int) -> None:
+        if emp_in_id == emp_out_id:
+            raise SgbdError("Un empregado no se pode sustituír a sí mesmo")
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.REPLACE, {'emp_out_id': emp_out_id, 'emp_in_id': emp_in_id,
+                                                 'pro_id': pro_id})
+            self.sql._check_replace(await cur.fetchone(), emp_out_id, emp_in_id, pro_id)
+
+
+class DepartamentoProyectoRepo(AsyncRepo):
+    """
+    Acceso á relación DepartamentoProyecto (ver sgbd.DepartamentoProyectoRepo)
+    """
+
+    sql = sgbd.DepartamentoProyectoRepo
+
+    async def departamentos_de_proyecto(self, pro_id: int) -> list:
+        async with self._transaction() as cur:
+            await self._require_proyecto(cur, pro_id)
+            await cur.execute(self.sql.SELECT_DEPTS_OF_PRO, {'id': pro_id})
+            return await cur.fetchall()
+
+    @retry_transaction
+    async def insert(self, dept_id: int, pro_id: int) -> None:
+        async with self._transaction(psycopg.IsolationLevel.SERIALIZABLE) as cur:
+            await cur.execute(self.sql.INSERT, {'dept_id': dept_id, 'pro_id': pro_id})
+            self.sql._check(await cur.fetchone(), dept_id, pro_id)
+
+
+## ------------------------------------------------------------
+async def load_test(pool, requests, concurrency, max_id):
+    """
+    Lanza requests buscas de empregados por id, con ata concurrency en
+    curso á vez, e mide o throughput
+    :return: diccionario con peticións, erros, segundos e peticións por segundo
+    """
+    gate = asyncio.Semaphore(concurrency)
+    erros = 0
+
+    async def one():
+        nonlocal erros
+        async with gate:
+            try:
+                async with pool.connection() as conn:
+                    await EmpleadoRepo(conn).get(random.randint(1, max_id))
+            except (psycopg.Error, PoolTimeout):
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    segundos = time.perf_counter() - inicio
+    return {'peticions': requests, 'erros': erros, 'segundos': round(segundos, 3),
+            'peticions_por_segundo': round(requests / segundos, 1)}
+
+
+async def amain(args):
+    config = sgbd.configure(sgbd.read_config('dbconfig.json'))
+    if args.no_cache:
+        sgbd.Repo.cache = None
+    try:
+        pool = await create_pool(config)
+    except psycopg.OperationalError as e:
+        print(f"[✗] Imposible conectar: {e}")
+        return -1
+    exporter = None
+    try:
+        exporter = sgbd.start_metrics(pool, sgbd.MetricsExporter.config, args.metrics_port,
+                                      args.metrics_textfile)
+        async with pool.connection() as conn:
+            cur = await conn.execute("select coalesce(max(id), 0) as max_id from empleado")
+            max_id = (await cur.fetchone())['max_id']
+            await conn.rollback()
+        if max_id == 0:
+            print("[✗] Non hai empregados")
+            return -1
+        resultado = await load_test(pool, args.requests, args.concurrency, max_id)
+        print(f"[✓] {resultado['peticions']} peticións ({resultado['erros']} erros) en "
+              f"{resultado['segundos']} s: {resultado['peticions_por_segundo']} peticións/s")
+        return 0
+    finally:
+        if exporter is not None:
+            exporter.close()
+        await pool.closeall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Proba de carga da capa asíncrona de sgbd.py")
+    parser.add_argument('--requests', type=int, default=10000, help="número de buscas")
+    parser.add_argument('--concurrency', type=int, default=500, help="buscas en curso á vez")
+    parser.add_argument('--no-cache', action='store_true', help="non usar a caché de sgbd.py")
+    parser.add_argument('--metrics-port', type=int, metavar='PORTO',
+                        help="serve as métricas Prometheus en http://127.0.0.1:PORTO/metrics")
+    parser.add_argument('--metrics-textfile', metavar='FICHEIRO',
+                        help="escribe as métricas Prometheus neste ficheiro")
+    sys.exit(asyncio.run(amain(parser.parse_args())))
+
+
+## ------------------------------------------------------------
+if __name__ == '__main__':
+    main()
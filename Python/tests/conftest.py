@@ -0,0 +1,6 @@
+# Os tests importan os módulos de Python/ (sgbd, sgbd_async, benchmark)
+# sen necesitar a BD nin instalar nada
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,39 @@
+import pytest
+
+from benchmark import parse_scale, percentile
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('500', 500), ('10k', 10_000), ('10K', 10_000), ('1M', 1_000_000), ('10m', 10_000_000),
+    ('1.5k', 1_500), (' 2k ', 2_000), ('0.5m', 500_000),
+])
+def test_parse_scale(text, expected):
+    assert parse_scale(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', 'k', 'dez', '10g', '1kk'])
+def test_parse_scale_rejects_garbage(text):
+    with pytest.raises(ValueError):
+        parse_scale(text)
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+
+
+def test_percentile_small_samples():
+    assert percentile([7], 50) == 7
+    assert percentile([7], 99) == 7
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 51) == 3
+    assert percentile([1, 2, 3, 4], 99) == 4
+
+
+def test_percentile_bounds():
+    assert percentile([1, 2, 3], 0) == 1
+    assert percentile([1, 2, 3], 150) == 3
+    assert percentile([], 50) is None
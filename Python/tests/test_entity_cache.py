@@ -0,0 +1,114 @@
+import pytest
+
+import sgbd
+from sgbd import EntityCache, Empleado
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Reloxo monotonic que só avanza cando o test o move
+    """
+    now = [1000.0]
+    monkeypatch.setattr(sgbd.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def empleado(id):
+    return Empleado(id=id, nombre=f"Empregado {id}", trabajo='Analista',
+                    fecha_contratacion=None, salario=1000.0)
+
+
+def test_get_missing_counts_a_miss():
+    cache = EntityCache()
+    assert cache.get('empleado', 1) == (False, None)
+    assert cache.stats()['misses'] == 1
+
+
+def test_get_returns_a_copy():
+    cache = EntityCache()
+    emp = empleado(1)
+    cache.put('empleado', 1, emp)
+    emp.salario = 5000.0
+    found, value = cache.get('empleado', 1)
+    assert found and value.salario == 1000.0
+    value.salario = 9000.0
+    assert cache.get('empleado', 1)[1].salario == 1000.0
+    assert cache.stats()['hits'] == 2
+
+
+def test_entry_expires_after_ttl(clock):
+    cache = EntityCache(ttl=60)
+    cache.put('empleado', 1, empleado(1))
+    clock[0] += 60
+    assert cache.get('empleado', 1)[0]
+    clock[0] += 0.001
+    assert cache.get('empleado', 1) == (False, None)
+    stats = cache.stats()
+    assert stats['evictions'] == 1 and stats['size'] == 0
+
+
+def test_put_refreshes_ttl(clock):
+    cache = EntityCache(ttl=10)
+    cache.put('empleado', 1, empleado(1))
+    clock[0] += 8
+    cache.put('empleado', 1, empleado(1))
+    clock[0] += 8
+    assert cache.get('empleado', 1)[0]
+
+
+def test_evicts_least_recently_used():
+    cache = EntityCache(maxsize=2)
+    cache.put('empleado', 1, empleado(1))
+    cache.put('empleado', 2, empleado(2))
+    cache.get('empleado', 1)
+    cache.put('empleado', 3, empleado(3))
+    assert cache.get('empleado', 2) == (False, None)
+    assert cache.get('empleado', 1)[0]
+    assert cache.get('empleado', 3)[0]
+    assert cache.stats()['evictions'] == 1
+
+
+def test_same_id_in_other_table_is_another_entry():
+    cache = EntityCache()
+    cache.put('empleado', 1, empleado(1))
+    assert cache.get('departamento', 1) == (False, None)
+
+
+def test_invalidate_one_row():
+    cache = EntityCache()
+    cache.put('empleado', 1, empleado(1))
+    cache.put('empleado', 2, empleado(2))
+    cache.invalidate('empleado', 1)
+    assert not cache.get('empleado', 1)[0]
+    assert cache.get('empleado', 2)[0]
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_invalidate_whole_table():
+    cache = EntityCache()
+    cache.put('empleado', 1, empleado(1))
+    cache.put('empleado', 2, empleado(2))
+    cache.put('proyecto', 1, 'proxecto')
+    cache.invalidate('empleado')
+    assert not cache.get('empleado', 1)[0]
+    assert not cache.get('empleado', 2)[0]
+    assert cache.get('proyecto', 1)[0]
+
+
+def test_notifications_invalidate_rows_and_tables():
+    cache = EntityCache()
+    for id in (1, 2, 3):
+        cache.put('empleado', id, empleado(id))
+    cache.put('departamento', 1, 'departamento')
+    cache._on_notify('empleado:1,3')
+    assert [cache.get('empleado', id)[0] for id in (1, 2, 3)] == [False, True, False]
+    cache._on_notify('departamento:*')
+    assert not cache.get('departamento', 1)[0]
+
+
+def test_clear():
+    cache = EntityCache()
+    cache.put('empleado', 1, empleado(1))
+    cache.clear()
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,103 @@
+import csv
+import io
+import json
+from datetime import date
+
+import pytest
+
+from sgbd import Importer, IMPORT_SPECS
+
+EMPLEADO = {'id': '7', 'nombre': 'Ana', 'trabajo': 'Analista', 'fecha_contratacion': '2020/01/31',
+            'salario': '1800.5', 'comision': '', 'id_jefe': '1', 'id_departamento': '2'}
+
+
+@pytest.fixture
+def rejects():
+    return io.StringIO()
+
+
+@pytest.fixture
+def importer(rejects):
+    importer = Importer(None, rejects=rejects)
+    for table in IMPORT_SPECS:
+        importer.stats[table] = {'importadas': 0, 'rexeitadas': 0}
+    return importer
+
+
+def rejected(rejects):
+    """
+    :return: filas do ficheiro de rexeitadas, sen a cabeceira
+    """
+    rows = list(csv.reader(io.StringIO(rejects.getvalue())))
+    assert rows[0] == ['taboa', 'linha', 'motivo', 'fila']
+    return rows[1:]
+
+
+def parse(importer, record, table='empleado', linha=2):
+    return importer._parse(IMPORT_SPECS[table], linha, record)
+
+
+def test_valid_row_is_converted(importer, rejects):
+    values = parse(importer, EMPLEADO)
+    assert values == {'id': 7, 'nombre': 'Ana', 'trabajo': 'Analista',
+                      'fecha_contratacion': date(2020, 1, 31), 'salario': 1800.5,
+                      'comision': None, 'id_jefe': 1, 'id_departamento': 2}
+    assert rejected(rejects) == []
+    assert importer.stats['empleado']['rexeitadas'] == 0
+
+
+def test_jsonl_values_and_missing_optional_columns(importer):
+    record = {'id': 7, 'nombre': 'Ana', 'trabajo': 'Analista', 'fecha_contratacion': '2020-01-31',
+              'salario': 1800}
+    values = parse(importer, record)
+    assert values['salario'] == 1800.0
+    assert values['comision'] is None and values['id_departamento'] is None
+
+
+@pytest.mark.parametrize('column, value', [
+    ('id', 'sete'), ('id', '7.5'), ('salario', 'moito'), ('fecha_contratacion', '31-01-2020'),
+    ('fecha_contratacion', '2020-02-30'), ('id_jefe', [1]),
+])
+def test_bad_format_is_rejected(importer, rejects, column, value):
+    record = dict(EMPLEADO, **{column: value})
+    assert parse(importer, record, linha=5) is None
+    [[taboa, linha, motivo, fila]] = rejected(rejects)
+    assert (taboa, linha, motivo) == ('empleado', '5', f"formato: {column}")
+    assert json.loads(fila)[column] == value
+    assert importer.stats['empleado']['rexeitadas'] == 1
+
+
+@pytest.mark.parametrize('column', ['id', 'nombre', 'trabajo', 'fecha_contratacion', 'salario'])
+def test_missing_required_column_is_rejected(importer, rejects, column):
+    for record in (dict(EMPLEADO, **{column: ''}), {k: v for k, v in EMPLEADO.items() if k != column}):
+        assert parse(importer, record) is None
+    assert [motivo for _, _, motivo, _ in rejected(rejects)] == [f"obrigatorio: {column}"] * 2
+
+
+@pytest.mark.parametrize('column, constraint', [('salario', 'ch_salario'), ('comision', 'ch_comision')])
+def test_negative_values_are_rejected_with_the_check_name(importer, rejects, column, constraint):
+    assert parse(importer, dict(EMPLEADO, **{column: '-1'})) is None
+    assert rejected(rejects)[0][2] == constraint
+
+
+def test_zero_is_not_negative(importer):
+    assert parse(importer, dict(EMPLEADO, salario='0', comision='0')) is not None
+
+
+def test_negative_horas(importer, rejects):
+    record = {'id_empleado': '1', 'id_proyecto': '2', 'horas': '-3'}
+    assert parse(importer, record, 'empleadoproyecto') is None
+    assert rejected(rejects)[0][:3] == ['empleadoproyecto', '2', 'ch_horas']
+    assert importer.stats['empleadoproyecto']['rexeitadas'] == 1
+
+
+def test_first_problem_is_reported_once(importer, rejects):
+    assert parse(importer, dict(EMPLEADO, id='x', nombre='', salario='-1')) is None
+    assert [motivo for _, _, motivo, _ in rejected(rejects)] == ["formato: id"]
+
+
+def test_without_rejects_file_only_counts():
+    importer = Importer(None)
+    importer.stats['proyecto'] = {'importadas': 0, 'rexeitadas': 0}
+    assert importer._parse(IMPORT_SPECS['proyecto'], 2, {'id': '1', 'nombre': 'P'}) is None
+    assert importer.stats['proyecto']['rexeitadas'] == 1
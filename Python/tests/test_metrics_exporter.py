@@ -0,0 +1,113 @@
+import psycopg2
+import psycopg2.errorcodes
+import pytest
+
+from sgbd import (MetricsExporter, QueryTimer, TimedCursor, Repo, TransactionRunner,
+                  TransactionStats, EntityCache)
+
+
+class FakePool:
+    def stats(self):
+        return {'in_use': 2, 'idle': 3, 'max': 5}
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    timer = QueryTimer()
+    timer.record(None, "select * from empleado where id=%(id)s", {'id': 1}, 0.0007, 1, 'q')
+    timer.record(None, "select * from empleado where id=%(id)s", {'id': 2}, 0.003, 1, 'q')
+    monkeypatch.setattr(TimedCursor, 'timer', timer)
+
+    tx_stats = TransactionStats()
+    tx_stats.commit()
+    tx_stats.rollback(type('PgError', (psycopg2.Error,),
+                           {'pgcode': psycopg2.errorcodes.SERIALIZATION_FAILURE})())
+    tx_stats.rollback(ValueError())
+    monkeypatch.setattr(Repo, 'tx_stats', tx_stats)
+
+    runner = TransactionRunner(backoff=0)
+    runner.started('EmpleadoRepo.insert')
+    runner.retry_delay('EmpleadoRepo.insert', psycopg2.errorcodes.SERIALIZATION_FAILURE, 1)
+    monkeypatch.setattr(Repo, 'runner', runner)
+
+    cache = EntityCache()
+    cache.put('empleado', 1, 'valor')
+    cache.get('empleado', 1)
+    cache.get('empleado', 2)
+    cache.get('empleado', 3)
+    monkeypatch.setattr(Repo, 'cache', cache)
+    return MetricsExporter(FakePool())
+
+
+def samples(text):
+    """
+    :return: diccionario "nome{etiquetas}" -> valor das liñas que non son comentarios
+    """
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+
+def test_prometheus_text_format(exporter):
+    text = exporter.render(openmetrics=False)
+    assert text.endswith('\n') and '# EOF' not in text
+    assert '# TYPE sgbd_statements_total counter' in text
+    assert '# TYPE sgbd_pool_connections gauge' in text
+    values = samples(text)
+    assert values['sgbd_statements_total{operation="EmpleadoRepo.SELECT"}'] == '2'
+    assert values['sgbd_statement_rows_total{operation="EmpleadoRepo.SELECT"}'] == '2'
+    assert values['sgbd_pool_connections{state="in_use"}'] == '2'
+    assert values['sgbd_pool_connections{state="idle"}'] == '3'
+    assert values['sgbd_pool_max_connections'] == '5'
+    assert values['sgbd_transaction_commits_total'] == '1'
+    assert values['sgbd_transaction_rollbacks_total{reason="SERIALIZATION_FAILURE"}'] == '1'
+    assert values['sgbd_transaction_rollbacks_total{reason="ValueError"}'] == '1'
+    assert values['sgbd_transaction_retries_total{operation="EmpleadoRepo.insert"}'] == '1'
+    assert values['sgbd_cache_hits_total'] == '1'
+    assert values['sgbd_cache_misses_total'] == '2'
+    assert values['sgbd_cache_entries'] == '1'
+    assert values['sgbd_cache_hit_ratio'] == '0.333333'
+
+
+def test_openmetrics_format(exporter):
+    text = exporter.render(openmetrics=True)
+    assert text.endswith('# EOF\n')
+    # a familia dun contador vai sen _total e as mostras con el
+    assert '# TYPE sgbd_statements counter' in text
+    assert '# TYPE sgbd_statements_total' not in text
+    assert 'sgbd_statements_total{operation="EmpleadoRepo.SELECT"} 2' in text
+
+
+def test_histogram_buckets_are_cumulative(exporter):
+    values = samples(exporter.render(openmetrics=False))
+    bucket = 'sgbd_statement_duration_seconds_bucket{operation="EmpleadoRepo.SELECT",le="%s"}'
+    assert values[bucket % '0.0005'] == '0'
+    assert values[bucket % '0.001'] == '1'
+    assert values[bucket % '0.002'] == '1'
+    assert values[bucket % '0.005'] == '2'
+    assert values[bucket % '10'] == '2'
+    assert values[bucket % '+Inf'] == '2'
+    assert values['sgbd_statement_duration_seconds_count{operation="EmpleadoRepo.SELECT"}'] == '2'
+    assert values['sgbd_statement_duration_seconds_sum{operation="EmpleadoRepo.SELECT"}'] == '0.003700'
+
+
+def test_label_values_are_escaped():
+    assert MetricsExporter._labels(operation='a"b\\c\nd') == '{operation="a\\"b\\\\c\\nd"}'
+    assert MetricsExporter._labels() == ''
+
+
+def test_without_timer_runner_or_cache(monkeypatch):
+    monkeypatch.setattr(TimedCursor, 'timer', None)
+    monkeypatch.setattr(Repo, 'runner', None)
+    monkeypatch.setattr(Repo, 'cache', None)
+    monkeypatch.setattr(Repo, 'tx_stats', TransactionStats())
+    text = MetricsExporter(FakePool()).render()
+    assert 'sgbd_statements' not in text
+    assert 'sgbd_transaction_retries' not in text
+    assert 'sgbd_cache' not in text
+    assert 'sgbd_transaction_commits_total 0' in text
+
+
+def test_rollback_reason_from_psycopg3_sqlstate():
+    psycopg = pytest.importorskip('psycopg')
+    tx_stats = TransactionStats()
+    tx_stats.rollback(psycopg.errors.SerializationFailure())
+    assert tx_stats.stats()['rollbacks'] == {'SERIALIZATION_FAILURE': 1}
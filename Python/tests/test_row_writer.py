@@ -0,0 +1,132 @@
+import csv
+import json
+import sys
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from sgbd import RowWriter
+
+FIELDS = [('id', 'id'), ('nombre', 'nome'), ('salario', 'salario')]
+
+ROWS = [
+    {'id': 1, 'nombre': 'Ana', 'salario': Decimal('1800.50'), 'outra': 'non se escribe'},
+    {'id': 2, 'nombre': None, 'salario': None, 'outra': None},
+]
+
+
+def write(tmp_path, formato, rows, fields=FIELDS):
+    path = tmp_path / f"saida.{formato}"
+    writer = RowWriter(formato, str(path))
+    try:
+        n = writer.write(rows, fields)
+    finally:
+        writer.close()
+    return n, path.read_bytes().decode('utf-8')
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        RowWriter('xml')
+
+
+def test_table(tmp_path):
+    n, text = write(tmp_path, 'table', ROWS)
+    assert n == 2
+    assert text == ("\tFila 1: [id: 1, nome: Ana, salario: 1800.50]\n"
+                    "\tFila 2: [id: 2, nome: None, salario: None]\n")
+
+
+def test_csv_header_nulls_and_quoting(tmp_path):
+    rows = ROWS + [{'id': 3, 'nombre': 'Pérez, "Chus"\nsegunda liña', 'salario': 1}]
+    n, text = write(tmp_path, 'csv', rows)
+    assert n == 3
+    parsed = list(csv.reader(text.splitlines(keepends=True)))
+    assert parsed == [['id', 'nombre', 'salario'],
+                      ['1', 'Ana', '1800.50'],
+                      ['2', '', ''],
+                      ['3', 'Pérez, "Chus"\nsegunda liña', '1']]
+
+
+def test_tsv_header_and_nulls(tmp_path):
+    n, text = write(tmp_path, 'tsv', ROWS)
+    assert n == 2
+    assert text == "id\tnombre\tsalario\n1\tAna\t1800.50\n2\t\\N\t\\N\n"
+
+
+@pytest.mark.parametrize('value, escaped', [
+    ('tab\taqui', 'tab\\taqui'),
+    ('liña\nnova', 'liña\\nnova'),
+    ('retorno\r', 'retorno\\r'),
+    ('C:\\dir', 'C:\\\\dir'),
+    ('\\N', '\\\\N'),
+    ('normal', 'normal'),
+])
+def test_tsv_escaping(tmp_path, value, escaped):
+    _, text = write(tmp_path, 'tsv', [{'id': 1, 'nombre': value}], [('id', 'id'), ('nombre', 'nome')])
+    assert text.splitlines()[1] == f"1\t{escaped}"
+
+
+def test_jsonl(tmp_path):
+    rows = ROWS + [{'id': 3, 'nombre': 'Óscar', 'salario': 1}]
+    n, text = write(tmp_path, 'jsonl', rows)
+    assert n == 3
+    lines = text.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'id': 1, 'nombre': 'Ana', 'salario': 1800.5},
+        {'id': 2, 'nombre': None, 'salario': None},
+        {'id': 3, 'nombre': 'Óscar', 'salario': 1}]
+    assert 'Óscar' in lines[2]
+
+
+def test_jsonl_dates(tmp_path):
+    _, text = write(tmp_path, 'jsonl', [{'id': 1, 'fecha': date(2024, 2, 29)}],
+                    [('id', 'id'), ('fecha', 'data')])
+    assert json.loads(text) == {'id': 1, 'fecha': '2024-02-29'}
+
+
+def test_no_rows(tmp_path):
+    assert write(tmp_path, 'jsonl', []) == (0, '')
+    assert write(tmp_path, 'csv', []) == (0, 'id,nombre,salario\r\n')
+
+
+def test_consecutive_listings_go_to_the_same_file(tmp_path):
+    path = tmp_path / 'saida.jsonl'
+    writer = RowWriter('jsonl', str(path))
+    writer.write(ROWS[:1], FIELDS)
+    writer.write(ROWS[1:], FIELDS)
+    writer.close()
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 2
+
+
+def test_generator_rows(tmp_path):
+    n, text = write(tmp_path, 'tsv', ({'id': i, 'nombre': str(i), 'salario': i} for i in range(3)))
+    assert n == 3 and len(text.splitlines()) == 4
+
+
+def test_messages_go_to_stderr_when_rows_use_stdout(capsys):
+    with RowWriter('csv').messages():
+        print("mensaxe")
+    captured = capsys.readouterr()
+    assert captured.out == '' and captured.err == "mensaxe\n"
+
+
+@pytest.mark.parametrize('formato, path', [('table', None), ('csv', 'saida.csv')])
+def test_messages_stay_on_stdout(capsys, formato, path):
+    with RowWriter(formato, path).messages():
+        print("mensaxe")
+    assert capsys.readouterr().out == "mensaxe\n"
+    assert sys.stdout is not sys.stderr
+
+
+def test_write_document(tmp_path):
+    path = tmp_path / 'ficha.csv'
+    writer = RowWriter('csv', str(path))
+    writer.write_document({'empleado': {'id': 1, 'fecha_contratacion': date(2021, 12, 12)},
+                           'proyectos': [{'id': 2, 'nombre': 'Ñ'}]})
+    writer.close()
+    text = path.read_bytes().decode('utf-8')
+    assert text.endswith('\n') and text.count('\n') == 1
+    assert json.loads(text) == {'empleado': {'id': 1, 'fecha_contratacion': '2021-12-12'},
+                                'proyectos': [{'id': 2, 'nombre': 'Ñ'}]}
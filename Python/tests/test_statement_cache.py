@@ -0,0 +1,42 @@
+from sgbd import StatementCache, EmpleadoRepo
+
+
+def test_named_parameters_become_positional():
+    text, names = StatementCache.to_positional("select * from empleado where id=%(id)s")
+    assert text == "select * from empleado where id=$1"
+    assert names == ['id']
+
+
+def test_parameters_numbered_in_order_of_appearance():
+    text, names = StatementCache.to_positional(
+        "update empleado set salario=%(salario)s where id=%(id)s and id_jefe=%(jefe)s")
+    assert text == "update empleado set salario=$1 where id=$2 and id_jefe=$3"
+    assert names == ['salario', 'id', 'jefe']
+
+
+def test_repeated_parameter_reuses_its_number():
+    text, names = StatementCache.to_positional(
+        "select %(id)s, %(nome)s where id=%(id)s or jefe=%(id)s")
+    assert text == "select $1, $2 where id=$1 or jefe=$1"
+    assert names == ['id', 'nome']
+
+
+def test_escaped_percent_is_unescaped():
+    text, names = StatementCache.to_positional(
+        "select * from empleado where nombre like 'A%%' and id>%(id)s")
+    assert text == "select * from empleado where nombre like 'A%' and id>$1"
+    assert names == ['id']
+
+
+def test_sentence_without_parameters():
+    text, names = StatementCache.to_positional("select count(*) from empleado")
+    assert text == "select count(*) from empleado"
+    assert names == []
+
+
+def test_repo_sentences_have_no_leftover_placeholders():
+    for name, value in vars(EmpleadoRepo).items():
+        if name.isupper() and isinstance(value, str) and '{' not in value:
+            text, names = StatementCache.to_positional(value)
+            assert '%(' not in text
+            assert len(set(names)) == len(names)
@@ -0,0 +1,47 @@
+import base64
+import json
+
+import pytest
+
+from sgbd import encode_token, decode_token, SgbdError
+
+
+@pytest.mark.parametrize('key', [[1800.0, 42], ['Madrid', 7], [None, 3], [5]])
+def test_round_trip(key):
+    assert decode_token(encode_token('empleados_por_salario', key), 'empleados_por_salario') == key
+
+
+def test_token_is_url_safe_without_padding():
+    token = encode_token('proxectos:Coruña ñ?&/', ['Á' * 7, 1])
+    assert '=' not in token
+    assert set(token) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_')
+    assert decode_token(token, 'proxectos:Coruña ñ?&/') == ['Á' * 7, 1]
+
+
+def test_wrong_scope_is_rejected():
+    token = encode_token('empleados_por_salario:1000', [1800.0, 42])
+    with pytest.raises(SgbdError, match="Token de continuación non válido"):
+        decode_token(token, 'empleados_por_salario:2000')
+
+
+@pytest.mark.parametrize('token', [
+    'non-é-base64!',
+    'x',
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    base64.urlsafe_b64encode(b'{"q": "listado"').decode(),
+    base64.urlsafe_b64encode(json.dumps([1, 2]).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({'q': 'listado'}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps('listado').encode()).decode(),
+])
+def test_tampered_token_is_rejected(token):
+    with pytest.raises(SgbdError, match="Token de continuación non válido"):
+        decode_token(token, 'listado')
+
+
+def test_token_rewritten_for_another_listing_is_rejected():
+    token = encode_token('listado', [1800.0, 42])
+    data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    data['q'] = 'outro'
+    tampered = base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip('=')
+    with pytest.raises(SgbdError):
+        decode_token(tampered, 'listado')
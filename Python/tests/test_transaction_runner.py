@@ -0,0 +1,102 @@
+import psycopg2
+import psycopg2.errorcodes
+import pytest
+
+from sgbd import TransactionRunner
+
+
+def pg_error(pgcode):
+    """
+    psycopg2.Error co código pgcode (o de psycopg2 só o enche o servidor)
+    """
+    return type('PgError', (psycopg2.Error,), {'pgcode': pgcode})()
+
+
+def failing(*pgcodes):
+    """
+    Transacción que falla cos códigos indicados, un por intento, e despois
+    devolve o número de intentos
+    """
+    calls = []
+
+    def func():
+        calls.append(1)
+        if len(calls) <= len(pgcodes):
+            raise pg_error(pgcodes[len(calls) - 1])
+        return len(calls)
+    return func
+
+
+SERIALIZATION = psycopg2.errorcodes.SERIALIZATION_FAILURE
+DEADLOCK = psycopg2.errorcodes.DEADLOCK_DETECTED
+
+
+def test_success_first_time():
+    runner = TransactionRunner(backoff=0)
+    assert runner.run('op', failing()) == 1
+    assert runner.attempts == 1
+    assert runner.stats() == {'op': {'chamadas': 1, 'reintentos': 0, 'abortos': 0}}
+
+
+def test_retries_serialization_failure_and_deadlock():
+    runner = TransactionRunner(backoff=0)
+    assert runner.run('op', failing(SERIALIZATION, DEADLOCK)) == 3
+    assert runner.attempts == 3
+    assert runner.stats()['op'] == {'chamadas': 1, 'reintentos': 2, 'abortos': 0}
+
+
+@pytest.mark.parametrize('pgcode', [psycopg2.errorcodes.UNIQUE_VIOLATION,
+                                    psycopg2.errorcodes.CHECK_VIOLATION, None])
+def test_other_errors_are_not_retried(pgcode):
+    runner = TransactionRunner(backoff=0)
+    with pytest.raises(psycopg2.Error):
+        runner.run('op', failing(pgcode))
+    assert runner.stats()['op'] == {'chamadas': 1, 'reintentos': 0, 'abortos': 0}
+
+
+def test_other_exceptions_are_not_retried():
+    runner = TransactionRunner(backoff=0)
+
+    def func():
+        raise ValueError("non é de postgres")
+    with pytest.raises(ValueError):
+        runner.run('op', func)
+    assert runner.attempts == 1
+
+
+def test_gives_up_after_max_attempts():
+    runner = TransactionRunner(max_attempts=3, backoff=0)
+    with pytest.raises(psycopg2.Error):
+        runner.run('op', failing(*[SERIALIZATION] * 5))
+    assert runner.attempts == 3
+    assert runner.stats()['op'] == {'chamadas': 1, 'reintentos': 2, 'abortos': 1}
+
+
+def test_budget_limits_retries_across_transactions():
+    runner = TransactionRunner(max_attempts=10, backoff=0, budget=3, budget_ratio=0.5)
+    with pytest.raises(psycopg2.Error):
+        runner.run('a', failing(*[SERIALIZATION] * 10))
+    assert runner.stats()['a'] == {'chamadas': 1, 'reintentos': 3, 'abortos': 1}
+    # sen orzamento nin sequera se repite unha vez
+    with pytest.raises(psycopg2.Error):
+        runner.run('b', failing(SERIALIZATION))
+    assert runner.stats()['b'] == {'chamadas': 1, 'reintentos': 0, 'abortos': 1}
+
+
+def test_budget_refills_with_first_time_successes():
+    runner = TransactionRunner(backoff=0, budget=1, budget_ratio=0.5)
+    assert runner.run('a', failing(SERIALIZATION)) == 2
+    runner.run('ok', failing())
+    with pytest.raises(psycopg2.Error):
+        runner.run('b', failing(SERIALIZATION))
+    runner.run('ok', failing())
+    assert runner.run('c', failing(SERIALIZATION)) == 2
+    assert runner.stats()['b']['abortos'] == 1
+
+
+def test_retry_delay_is_bounded_exponential_backoff():
+    runner = TransactionRunner(max_attempts=10, backoff=0.1, max_backoff=0.3, budget=10)
+    for attempt, maximo in ((1, 0.1), (2, 0.2), (3, 0.3), (4, 0.3)):
+        delay = runner.retry_delay('op', SERIALIZATION, attempt)
+        assert 0 <= delay <= maximo
+    assert runner.retry_delay('op', psycopg2.errorcodes.UNIQUE_VIOLATION, 1) is None